@@ -0,0 +1,194 @@
+"""
+ADAF - headless batch runner
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Runs ADAF (adaf_inference.main_routine) without the widget on a list of DEMs (paths or glob patterns). Parameters are
+read from a JSON config file, keys are attributes of adaf_utils.ADAFInput, for example:
+
+    {
+        "ml_type": "object detection",
+        "labels": ["barrow", "enclosure"],
+        "out_dir": "results",
+        "min_area": 40,
+        "save_ml_output": false
+    }
+
+All DEMs share one executor for visualisations and vectorisation (worker processes by default, "executor" in the
+config selects threads or a Dask cluster, see executors.py) and one registry of loaded models, several DEMs can be
+processed at the same time (--concurrent). At the end, a JSON summary with output paths and
+timings of every DEM is written to the output folder.
+
+Run from the repository root:
+    python -m adaf "data/*.tif" --config config.json --concurrent 2
+A job can be split between machines with --shard i/N, results of shards are combined with merge_shards.py.
+With --trace, timeline of every run is saved as "trace.json" (see trace.py), with --profile all stages are profiled
+and profile statistics are saved into results folders (see profiling.py).
+"""
+import argparse
+import glob
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import adaf.grid_tools as gt
+from adaf.adaf_inference import main_routine
+from adaf.adaf_utils import ADAFInput, ModelRegistry, build_vrt_from_list
+from adaf.executors import get_executor
+from adaf.resources import plan_resources
+
+# Same defaults as in the widget
+DEFAULT_CONFIG = {
+    "vis_exist_ok": False,
+    "save_vis": False,
+    "ml_type": "segmentation",
+    "labels": ["AO"],
+    "ml_model_custom": "ADAF model",
+    "roundness": 0.5,
+    "min_area": 40,
+    "save_ml_output": False,
+    "tiles_to_vrt": False,
+    "out_dir": "."
+}
+
+
+def expand_inputs(inputs):
+    """List of files from paths and glob patterns (sorted, without duplicates)."""
+    files = []
+    for item in inputs:
+        matches = sorted(glob.glob(item, recursive=True)) if glob.has_magic(item) else [item]
+        files += [Path(match).as_posix() for match in matches if Path(match).as_posix() not in files]
+
+    return files
+
+
+def load_config(config_path=None, **overrides):
+    """Parameters of the run, defaults updated with the JSON config file and overrides (values that are not None)."""
+    config = DEFAULT_CONFIG.copy()
+    if config_path:
+        with open(config_path) as src:
+            config.update(json.load(src))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+
+    return config
+
+
+def run_batch(dem_paths, config, concurrent=1, summary_path=None):
+    """Runs ADAF on every DEM.
+
+    Parameters
+    ----------
+    dem_paths : list
+        Paths to DEMs (or visualisations if "vis_exist_ok" is set).
+    config : dict
+        Parameters of the run, keys are attributes of adaf_utils.ADAFInput.
+    concurrent : int
+        Number of DEMs processed at the same time (threads sharing the executor and the models).
+    summary_path : str or pathlib.Path()
+        Path of the JSON summary, by default "adaf_summary.json" in the output folder (with index of the shard if
+        config has "shard").
+
+    Returns
+    -------
+    dict
+        Summary with results of every DEM ("status" is "ok" or "error").
+    """
+    t0 = time.time()
+    out_dir = Path(config["out_dir"])
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Several input files can be merged into one mosaic (as in the widget)
+    if config.get("tiles_to_vrt") and len(dem_paths) > 1:
+        dem_paths = [build_vrt_from_list(dem_paths, out_dir / "virtual_mosaic.vrt")]
+
+    # Torch threads are split between concurrent DEMs, unless set in config
+    concurrent = max(min(concurrent, len(dem_paths)), 1)
+    resources = plan_resources(config.get("cpus"), config.get("memory_mb"))
+    if config.get("inference_threads") is None:
+        config = {**config, "inference_threads": max(resources.cpus // concurrent, 1)}
+    logging.info(resources.summary())
+
+    registry = ModelRegistry()
+
+    def run_one(dem_path):
+        inp = ADAFInput()
+        inp.update(**config)
+        inp.update(dem_path=dem_path, input_file_list=dem_paths)
+        result = {"dem_path": dem_path}
+        t1 = time.time()
+        try:
+            main_routine(inp, executor=executor, registry=registry, summary=result)
+            result["status"] = "ok"
+        except Exception as err:
+            logging.exception("Processing of %s failed", dem_path)
+            result.update(status="error", error=f"{type(err).__name__}: {err}")
+        result["seconds"] = time.time() - t1
+
+        return result
+
+    executor_kind = config.get("executor") or "processes"
+    with get_executor(executor_kind, resources.vis_workers) as executor, ThreadPoolExecutor(concurrent) as runs:
+        results = list(runs.map(run_one, dem_paths))
+
+    summary = {
+        "files": len(results),
+        "failed": sum(result["status"] != "ok" for result in results),
+        "concurrent": concurrent,
+        "models_loaded": len(registry),
+        "total_seconds": time.time() - t0,
+        "results": results
+    }
+    if summary_path is None:
+        # Shards of a job may share the output folder
+        shard = gt.parse_shard(config["shard"]) if config.get("shard") is not None else None
+        summary_name = f"adaf_summary_shard{shard[0]}of{shard[1]}.json" if shard else "adaf_summary.json"
+        summary_path = out_dir / summary_name
+    summary_path = Path(summary_path)
+    with open(summary_path, "w") as dst:
+        json.dump(summary, dst, indent=2)
+    summary["summary_path"] = summary_path.as_posix()
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m adaf", description="Run ADAF on a batch of DEMs.")
+    parser.add_argument("inputs", nargs="+", help="Paths to DEMs or glob patterns (e.g. 'data/*.tif').")
+    parser.add_argument("--config", default=None, help="JSON file with parameters (attributes of ADAFInput).")
+    parser.add_argument("--out-dir", default=None, help="Output folder (overrides config).")
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default=None)
+    parser.add_argument("--labels", nargs="+", default=None)
+    parser.add_argument("--concurrent", type=int, default=1, help="Number of DEMs processed at the same time.")
+    parser.add_argument("--summary", default=None, help="Path of the JSON summary.")
+    parser.add_argument("--shard", default=None, help="Process only part i/N of the grid (see merge_shards.py).")
+    parser.add_argument("--trace", action="store_true", help="Save timeline of runs (Chrome Trace Event format).")
+    parser.add_argument("--profile", action="store_true", help="Profile all stages (cProfile in every worker).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    config = load_config(
+        args.config,
+        out_dir=args.out_dir,
+        ml_type=args.ml_type,
+        labels=args.labels,
+        shard=args.shard,
+        trace=args.trace or None,
+        profile=args.profile or None
+    )
+    dem_paths = expand_inputs(args.inputs)
+    if not dem_paths:
+        parser.error("No input files found!")
+
+    summary = run_batch(dem_paths, config, args.concurrent, args.summary)
+    for result in summary["results"]:
+        outcome = (result.get("vector_path") or "no detections") if result["status"] == "ok" else result["error"]
+        print(f"{result['status']:>5}  {result['seconds']:8.1f} s  {result['dem_path']} -> {outcome}")
+    print(f"Summary: {summary['summary_path']}")
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
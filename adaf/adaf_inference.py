@@ -15,7 +15,6 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 import rasterio
-from aitlas.models import FasterRCNN, HRNet
 from pyproj import CRS
 from rasterio.features import shapes
 from shapely.geometry import box, shape
@@ -23,19 +22,56 @@ from torch import cuda
 
 import adaf.grid_tools as gt
 from adaf.adaf_utils import (
+    DEFAULT_SKIP_RULES,
     make_predictions_on_patches_object_detection,
     make_predictions_on_patches_segmentation,
+    load_backend,
+    predict_in_workers,
+    model_cache_key,
+    model_config,
     build_vrt_from_list,
+    InferenceCache,
     Logger,
+    ModelRegistry,
+    VirtualTiles,
     image_tiling
 )
 
 from adaf.adaf_vis import tiled_processing
-
-logging.disable(logging.INFO)
-
-
-def object_detection_vectors(predictions_dirs_dict, threshold=0.5, keep_ml_paths=False, min_area=None):
+from adaf.executors import executor_scope
+from adaf.merge_shards import write_shard_manifest
+from adaf.metrics import METRICS_FILE, Metrics
+from adaf.profiling import Profiler
+from adaf.resources import PeakMemory, plan_resources
+from adaf.screener import load_screeners
+from adaf.trace import write_trace
+
+# Paths to models are relative to the script path
+OBJECT_DETECTION_MODELS = {
+    "barrow": r".\ml_models\OD_barrow.tar",
+    "enclosure": r".\ml_models\OD_enclosure.tar",
+    "ringfort": r".\ml_models\OD_ringfort.tar",
+    "AO": r".\ml_models\OD_AO.tar"
+}
+SEGMENTATION_MODELS = {
+    "barrow": r".\ml_models\barrow_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
+    "enclosure": r".\ml_models\enclosure_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
+    "ringfort": r".\ml_models\ringfort_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
+    "AO": r".\ml_models\AO_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar"
+}
+# Result of run_visualisations() and run_tiling() for a shard without tiles
+EMPTY_SHARD = {"output_directory": None, "files_list": [], "vrt_path": None, "tiles": []}
+
+
+def ml_model_path(ml_type, label, custom_model=None):
+    """Path to the model for the label ("custom" for custom_model), relative paths are relative to the script path."""
+    models = OBJECT_DETECTION_MODELS if ml_type == "object detection" else SEGMENTATION_MODELS
+    model_path = custom_model if label == "custom" else models.get(label)
+
+    return Path(__file__).resolve().parent / model_path
+
+
+def object_detection_vectors(predictions_dirs_dict, threshold=0.5, keep_ml_paths=False, min_area=None, metrics=None):
     """Converts object detection bounding boxes from text to vector format.
 
     Parameters
@@ -48,6 +84,9 @@ def object_detection_vectors(predictions_dirs_dict, threshold=0.5, keep_ml_paths
         If true, add path to ML predictions file from which the label was created as an attribute.
     min_area : float
         Minimum area threshold in m^2 (max = 40 m^2).
+    metrics : metrics.Metrics
+        Optional - every prediction file is recorded (stage "vectorisation"), number of detections is added to the
+        stage.
 
     Returns
     -------
@@ -66,6 +105,7 @@ def object_detection_vectors(predictions_dirs_dict, threshold=0.5, keep_ml_paths
         file_list = list(predicts_dir.glob(f"*.txt"))
 
         for file_path in file_list:
+            t_file = time.time()
             # Only read files that are not empty
             if not os.stat(file_path).st_size == 0:
                 # Read predictions from TXT file
@@ -109,6 +149,8 @@ def object_detection_vectors(predictions_dirs_dict, threshold=0.5, keep_ml_paths
                     data_ = data_.dissolve(data_.index, aggfunc=agg_func)
 
                     appended_data.append(data_)
+            if metrics is not None:
+                metrics.tile("vectorisation", t_file, label=label, tile=file_path.name)
 
     if appended_data:
         # We have at least one detection
@@ -121,14 +163,54 @@ def object_detection_vectors(predictions_dirs_dict, threshold=0.5, keep_ml_paths
 
         # Export file
         gdf.to_file(str(output_path), driver="GPKG")
+        if metrics is not None:
+            metrics.add("vectorisation", detections=len(gdf))
     else:
         output_path = ""
 
     return str(output_path)
 
 
+def _mask_polygons(file, label, threshold=0.5, keep_ml_paths=False):
+    """Polygons of a single probability mask (GeoDataFrame or None if there are no polygons)."""
+    with rasterio.open(file) as src:
+        prob_mask = src.read()
+        transform = src.transform
+        crs = src.crs
+
+        prediction = prob_mask.copy()
+
+        # Mask probability map by threshold for extraction of polygons
+        feature = prob_mask >= float(threshold)
+        background = prob_mask < float(threshold)
+
+        prediction[feature] = 1
+        prediction[background] = 0
+
+        # Outputs a list of (polygon, value) tuples
+        output = list(shapes(prediction, transform=transform))
+
+        # Find polygon covering valid data (value = 1) and transform to GDF friendly format
+        poly = []
+        for polygon, value in output:
+            if value == 1:
+                poly.append(shape(polygon))
+
+    # If there is at least one polygon, convert to GeoDataFrame
+    if not poly:
+        return None
+    predicted_labels = gpd.GeoDataFrame(poly, columns=['geometry'], crs=crs)
+    predicted_labels = predicted_labels.dissolve().explode(ignore_index=True)
+    predicted_labels["label"] = label
+    if keep_ml_paths:
+        predicted_labels["prediction_path"] = str(Path().joinpath(*file.parts[-3:]))
+
+    return predicted_labels
+
+
 def semantic_segmentation_vectors(predictions_dirs_dict, threshold=0.5,
-                                  keep_ml_paths=False, roundness=None, min_area=None):
+                                  keep_ml_paths=False, roundness=None, min_area=None, nr_processes=1,
+                                  executor="processes", metrics=None):
     """Converts semantic segmentation probability masks to polygons using a threshold. If more than one class, all
     predictions are stored in the same vector file, class is stored as label attribute.
 
@@ -145,6 +227,12 @@ def semantic_segmentation_vectors(predictions_dirs_dict, threshold=0.5,
         For perfect circle roundness is 1, for square 0.785, and goes towards 0 for irregular shapes.
     min_area : float
         Minimum area threshold in m^2 (max = 40 m^2).
+    nr_processes : int
+        Number of worker processes for extraction of polygons (masks are processed independently).
+    executor : executors.Executor or str
+        Existing executor (not closed) or kind of a new one with nr_processes workers (see executors.get_executor()).
+    metrics : metrics.Metrics
+        Optional - every mask is recorded (stage "vectorisation"), number of detections is added to the stage.
 
     Returns
     -------
@@ -156,48 +244,20 @@ def semantic_segmentation_vectors(predictions_dirs_dict, threshold=0.5,
     # Output path (GPKG file in the data folder)
     output_path = path_to_predictions.parent / "semantic_segmentation.gpkg"
 
-    gdf_out = []
+    input_process_list = []
     for label, predicts_dir in predictions_dirs_dict.items():
         predicts_dir = Path(predicts_dir)
         tif_list = list(predicts_dir.glob(f"*.tif"))
+        input_process_list += [(file, label, threshold, keep_ml_paths) for file in tif_list]
 
-        # file = tif_list[4]
-
-        for file in tif_list:
-            with rasterio.open(file) as src:
-                prob_mask = src.read()
-                transform = src.transform
-                crs = src.crs
-
-                prediction = prob_mask.copy()
-
-                # Mask probability map by threshold for extraction of polygons
-                feature = prob_mask >= float(threshold)
-                background = prob_mask < float(threshold)
-
-                prediction[feature] = 1
-                prediction[background] = 0
-
-                # Outputs a list of (polygon, value) tuples
-                output = list(shapes(prediction, transform=transform))
-
-                # Find polygon covering valid data (value = 1) and transform to GDF friendly format
-                poly = []
-                for polygon, value in output:
-                    if value == 1:
-                        poly.append(shape(polygon))
-
-            # If there is at least one polygon, convert to GeoDataFrame and append to list for output
-            if poly:
-                predicted_labels = gpd.GeoDataFrame(poly, columns=['geometry'], crs=crs)
-                predicted_labels = predicted_labels.dissolve().explode(ignore_index=True)
-                predicted_labels["label"] = label
-                if keep_ml_paths:
-                    predicted_labels["prediction_path"] = str(Path().joinpath(*file.parts[-3:]))
-                gdf_out.append(predicted_labels)
+    with executor_scope(executor, min(nr_processes, len(input_process_list))) as ex:
+        results = list(ex.map(_mask_polygons, input_process_list, "vectorisation", metrics=metrics))
+    # Keep masks with at least one polygon
+    gdf_out = [gdf for gdf in results if gdf is not None]
 
     if gdf_out:
         # We have at least one detection
+        crs = gdf_out[0].crs
         gdf = gpd.GeoDataFrame(pd.concat(gdf_out, ignore_index=True), crs=crs)
 
         # # If same object from two different tiles overlap, join them into one
@@ -214,13 +274,24 @@ def semantic_segmentation_vectors(predictions_dirs_dict, threshold=0.5,
 
         # Export file
         gdf.to_file(output_path.as_posix(), driver="GPKG")
+        if metrics is not None:
+            metrics.add("vectorisation", detections=len(gdf))
     else:
         output_path = ""
 
     return str(output_path)
 
 
-def run_visualisations(dem_path, tile_size, save_dir, nr_processes=1):
+def run_visualisations(
+        dem_path,
+        tile_size,
+        save_dir,
+        nr_processes=1,
+        engine="tiles",
+        executor="processes",
+        shard=None,
+        metrics=None
+):
     """Calculates visualisations from DEM and saves them into VRT (Geotiff) file.
 
     Uses RVT (see adaf_vis.py).
@@ -235,6 +306,14 @@ def run_visualisations(dem_path, tile_size, save_dir, nr_processes=1):
         Save directory.
     nr_processes : int
         Number of processes for parallel computing.
+    engine : str
+        Visualisation engine, can be "tiles" or "strips" (see adaf_vis.tiled_processing).
+    executor : executors.Executor or str
+        Existing executor (not closed) or kind of a new one (see executors.get_executor()).
+    shard : tuple
+        Optional - (index, number of shards), only this part of the grid is processed (see grid_tools.shard_grid()).
+    metrics : metrics.Metrics
+        Optional - every tile is recorded into metrics.
 
     Returns
     -------
@@ -250,6 +329,10 @@ def run_visualisations(dem_path, tile_size, save_dir, nr_processes=1):
     # Create reference grid, filter it and save it to disk
     tiles_extents = gt.bounding_grid(in_file.as_posix(), tile_size, tag=False)
     tiles_extents = gt.filter_by_outline(tiles_extents, valid_data_outline)
+    if shard is not None:
+        tiles_extents = gt.shard_grid(tiles_extents, *shard)
+        if tiles_extents.empty:
+            return dict(EMPTY_SHARD, tiles=[])
 
     # Run visualizations
     logging.debug("Start RVT vis")
@@ -257,13 +340,16 @@ def run_visualisations(dem_path, tile_size, save_dir, nr_processes=1):
         input_raster_path=in_file.as_posix(),
         extents_list=tiles_extents,
         nr_processes=nr_processes,
-        save_dir=Path(save_dir)
+        save_dir=Path(save_dir),
+        engine=engine,
+        executor=executor,
+        metrics=metrics
     )
 
     return out_paths
 
 
-def run_tiling(dem_path, tile_size, save_dir, nr_processes=1):
+def run_tiling(dem_path, tile_size, save_dir, nr_processes=1, engine="thread", virtual=False, shard=None, metrics=None):
     """Cuts visualisation into tiles.
 
     Parameters
@@ -275,7 +361,15 @@ def run_tiling(dem_path, tile_size, save_dir, nr_processes=1):
     save_dir : str
         Save directory.
     nr_processes : int
-        Number of processes for parallel computing.
+        Number of processes (or threads) for parallel computing.
+    engine : str
+        Tiling engine, can be "thread", "process" or "serial" (see adaf_utils.image_tiling).
+    virtual : bool
+        If True, tiles are not saved to disk, they are read from the visualisation during inference (VirtualTiles).
+    shard : tuple
+        Optional - (index, number of shards), only this part of the grid is processed (see grid_tools.shard_grid()).
+    metrics : metrics.Metrics
+        Optional - every tile is recorded into metrics.
 
     Returns
     -------
@@ -291,6 +385,15 @@ def run_tiling(dem_path, tile_size, save_dir, nr_processes=1):
     # Create reference grid and filter it
     tiles_extents = gt.bounding_grid(in_file.as_posix(), tile_size, tag=False)
     tiles_extents = gt.filter_by_outline(tiles_extents, valid_data_outline)
+    if shard is not None:
+        tiles_extents = gt.shard_grid(tiles_extents, *shard)
+        if tiles_extents.empty:
+            return dict(EMPTY_SHARD, tiles=[])
+
+    # Tiles are served straight from the source raster, nothing is written to disk
+    if virtual:
+        tiles = VirtualTiles(in_file, tiles_extents, save_dir=save_dir)
+        return {"output_directory": None, "files_list": [], "vrt_path": None, "tiles": tiles}
 
     # Run tiling
     logging.debug("Start RVT vis")
@@ -298,13 +401,28 @@ def run_tiling(dem_path, tile_size, save_dir, nr_processes=1):
         source_path=in_file.as_posix(),
         ext_list=tiles_extents,
         nr_processes=nr_processes,
-        save_dir=Path(save_dir)
+        save_dir=Path(save_dir),
+        engine=engine,
+        metrics=metrics
     )
 
     return out_paths
 
 
-def run_aitlas_object_detection(labels, images_dir, custom_model=None):
+def run_aitlas_object_detection(
+        labels,
+        images_dir,
+        custom_model=None,
+        skip_rules=None,
+        screener=None,
+        cache=None,
+        backend="torch",
+        precision="fp32",
+        workers=1,
+        threads=None,
+        registry=None,
+        metrics=None
+):
     """Runs AiTLAS for object detection. There are 4 trained models (binary classification) for four different classes
     (e.g. labels). The models are stored relatively to the script path in the "ml_models" folder.
 
@@ -312,26 +430,40 @@ def run_aitlas_object_detection(labels, images_dir, custom_model=None):
     ----------
     labels : list
         A list of labels for which to run the model, can be barrow, enclosure, ringfort or AO.
-    images_dir : str or pathlib.Path()
-        Path to directory containing tiles for inference.
+    images_dir : str or pathlib.Path() or adaf_utils.VirtualTiles
+        Path to directory containing tiles for inference or tiles read directly from the visualisation.
     custom_model : str or pathlib.Path()
         Path to tar file for custom model.
+    skip_rules : dict
+        Tiles matching any of the rules are skipped (see adaf_utils.DEFAULT_SKIP_RULES), None runs model on all tiles.
+    screener : screener.TileScreener or str or pathlib.Path() or dict
+        Optional - cascade stage, only tiles kept by the screener are passed to the model. Can be a single screener
+        (or path to it) for all labels or a dictionary with a screener for each label.
+    cache : adaf_utils.InferenceCache
+        Optional - results of tiles already processed with the same model are read from cache.
+    backend : str
+        Inference backend, "torch" (AiTLAS model), "torchscript" (traced model, cached in "ml_models/.compiled"),
+        "onnx" (ONNX Runtime on CPU, graphs are exported with export_onnx.py) or "onnx-int8" (quantised with
+        quantize.py), see adaf_utils.load_backend().
+    precision : str
+        "fp32" or "bf16" (reduced precision with autocast, falls back to fp32 if not supported), torch backend only.
+    workers : int
+        Number of worker processes for inference, tiles are split between workers (each loads its own model).
+    threads : int
+        Number of torch threads per worker, by default cores are split evenly between workers.
+    registry : adaf_utils.ModelRegistry
+        Optional - models are taken from the registry (loaded once and shared between runs), only when workers is 1.
+    metrics : metrics.Metrics
+        Optional - loading of models and every tile are recorded, only when workers is 1 (workers are not measured).
 
     Returns
     -------
     dict
         A dictionary with a list of paths for each label. The paths are of the result files of object detection.
     """
-    images_dir = str(images_dir)
-
-    # Paths to models are relative to the script path
-    models = {
-        "barrow": r".\ml_models\OD_barrow.tar",
-        "enclosure": r".\ml_models\OD_enclosure.tar",
-        "ringfort": r".\ml_models\OD_ringfort.tar",
-        "AO": r".\ml_models\OD_AO.tar",
-        "custom": custom_model
-    }
+    if not isinstance(images_dir, VirtualTiles):
+        images_dir = str(images_dir)
+    screener = load_screeners(screener)
 
     if cuda.is_available():
         logging.debug("> CUDA is available, running predictions on GPU!")
@@ -340,29 +472,54 @@ def run_aitlas_object_detection(labels, images_dir, custom_model=None):
 
     predictions_dirs = {}
     for label in labels:
-        # Prepare the model
-        model_config = {
-            "num_classes": 2,  # Number of classes in the dataset
-            "learning_rate": 0.0001,  # Learning rate for training
-            "pretrained": True,  # Whether to use a pretrained model or not
-            "use_cuda": cuda.is_available(),  # Set to True if you want to use GPU acceleration
-            "metrics": ["map"]  # Evaluation metrics to be used
-        }
-        model = FasterRCNN(model_config)
-        model.prepare()
-
         # Prepare path to the model
-        model_path = models.get(label)
-        # Path is relative to the Current script directory
-        model_path = Path(__file__).resolve().parent / model_path
+        model_path = ml_model_path("object detection", label, custom_model)
+        # Key of the model for inference cache (checkpoint, configuration, backend and precision)
+        model_key = None
+        if cache is not None:
+            model_key = model_cache_key(
+                model_path, {**model_config("object detection"), "backend": backend, "precision": precision}
+            )
+
+        if workers > 1:
+            # Data-parallel inference, every worker process loads its own model
+            preds_dir = predict_in_workers(
+                "object detection",
+                label,
+                model_path,
+                images_dir,
+                workers,
+                threads=threads,
+                backend=backend,
+                precision=precision,
+                skip_rules=skip_rules,
+                screener=screener.get(label) if isinstance(screener, dict) else screener,
+                cache=cache,
+                model_key=model_key,
+                metrics=metrics
+            )
+            predictions_dirs[label] = preds_dir
+            continue
+
         # Load appropriate ADAF model
-        model.load_model(model_path)
+        t_load = time.perf_counter()
+        if registry is not None:
+            model = registry.get("object detection", model_path, backend, precision)
+        else:
+            model = load_backend("object detection", model_path, backend, precision=precision)
         logging.debug("Model successfully loaded.")
+        if metrics is not None:
+            metrics.emit("model", label=label, backend=backend, load_s=time.perf_counter() - t_load)
 
         preds_dir = make_predictions_on_patches_object_detection(
             model=model,
             label=label,
-            patches_folder=images_dir
+            patches_folder=images_dir,
+            skip_rules=skip_rules,
+            screener=screener.get(label) if isinstance(screener, dict) else screener,
+            cache=cache,
+            model_key=model_key,
+            metrics=metrics
         )
 
         predictions_dirs[label] = preds_dir
@@ -370,7 +527,20 @@ def run_aitlas_object_detection(labels, images_dir, custom_model=None):
     return predictions_dirs
 
 
-def run_aitlas_segmentation(labels, images_dir, custom_model=None):
+def run_aitlas_segmentation(
+        labels,
+        images_dir,
+        custom_model=None,
+        skip_rules=None,
+        screener=None,
+        cache=None,
+        backend="torch",
+        precision="fp32",
+        workers=1,
+        threads=None,
+        registry=None,
+        metrics=None
+):
     """Runs AiTLAS for segmentation. There are 4 trained models (binary classification) for four different classes
     (e.g. labels). The models are stored relatively to the script path in the "ml_models" folder.
 
@@ -378,26 +548,40 @@ def run_aitlas_segmentation(labels, images_dir, custom_model=None):
     ----------
     labels : list
         A list of labels for which to run the model, can be barrow, enclosure, ringfort or AO.
-    images_dir : str or pathlib.Path()
-        Path to directory containing tiles for inference.
+    images_dir : str or pathlib.Path() or adaf_utils.VirtualTiles
+        Path to directory containing tiles for inference or tiles read directly from the visualisation.
     custom_model : str or pathlib.Path()
         Path to tar file for custom model.
+    skip_rules : dict
+        Tiles matching any of the rules are skipped (see adaf_utils.DEFAULT_SKIP_RULES), None runs model on all tiles.
+    screener : screener.TileScreener or str or pathlib.Path() or dict
+        Optional - cascade stage, only tiles kept by the screener are passed to the model. Can be a single screener
+        (or path to it) for all labels or a dictionary with a screener for each label.
+    cache : adaf_utils.InferenceCache
+        Optional - results of tiles already processed with the same model are read from cache.
+    backend : str
+        Inference backend, "torch" (AiTLAS model), "torchscript" (traced model, cached in "ml_models/.compiled"),
+        "onnx" (ONNX Runtime on CPU, graphs are exported with export_onnx.py) or "onnx-int8" (quantised with
+        quantize.py), see adaf_utils.load_backend().
+    precision : str
+        "fp32" or "bf16" (reduced precision with autocast, falls back to fp32 if not supported), torch backend only.
+    workers : int
+        Number of worker processes for inference, tiles are split between workers (each loads its own model).
+    threads : int
+        Number of torch threads per worker, by default cores are split evenly between workers.
+    registry : adaf_utils.ModelRegistry
+        Optional - models are taken from the registry (loaded once and shared between runs), only when workers is 1.
+    metrics : metrics.Metrics
+        Optional - loading of models and every tile are recorded, only when workers is 1 (workers are not measured).
 
     Returns
     -------
     dict
         A dictionary with a list of paths for each label. The paths are of the result files of segmentation.
     """
-    images_dir = str(images_dir)
-
-    # Paths to models are relative to the script path
-    models = {
-        "barrow": r".\ml_models\barrow_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
-        "enclosure": r".\ml_models\enclosure_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
-        "ringfort": r".\ml_models\ringfort_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
-        "AO": r".\ml_models\AO_HRNet_SLRM_512px_pretrained_train_12_val_124_with_Transformation.tar",
-        "custom": custom_model
-    }
+    if not isinstance(images_dir, VirtualTiles):
+        images_dir = str(images_dir)
+    screener = load_screeners(screener)
 
     if cuda.is_available():
         logging.debug("> CUDA is available, running predictions on GPU!")
@@ -406,36 +590,60 @@ def run_aitlas_segmentation(labels, images_dir, custom_model=None):
 
     predictions_dirs = {}
     for label in labels:
-        # Prepare the model
-        model_config = {
-            "num_classes": 2,  # Number of classes in the dataset
-            "learning_rate": 0.0001,  # Learning rate for training
-            "pretrained": True,  # Whether to use a pretrained model or not
-            "use_cuda": cuda.is_available(),  # Set to True if you want to use GPU acceleration
-            "threshold": 0.5,
-            "metrics": ["iou"]  # Evaluation metrics to be used
-        }
-        model = HRNet(model_config)
-        model.prepare()
-
         logging.debug(label)
 
         # Prepare path to the model
-        model_path = models.get(label)
-        # Path is relative to the Current script directory
-        model_path = Path(__file__).resolve().parent / model_path
+        model_path = ml_model_path("segmentation", label, custom_model)
 
         logging.debug(model_path)
 
+        # Key of the model for inference cache (checkpoint, configuration, backend and precision)
+        model_key = None
+        if cache is not None:
+            model_key = model_cache_key(
+                model_path, {**model_config("segmentation"), "backend": backend, "precision": precision}
+            )
+
+        if workers > 1:
+            # Data-parallel inference, every worker process loads its own model
+            preds_dir = predict_in_workers(
+                "segmentation",
+                label,
+                model_path,
+                images_dir,
+                workers,
+                threads=threads,
+                backend=backend,
+                precision=precision,
+                skip_rules=skip_rules,
+                screener=screener.get(label) if isinstance(screener, dict) else screener,
+                cache=cache,
+                model_key=model_key,
+                metrics=metrics
+            )
+            predictions_dirs[label] = preds_dir
+            continue
+
         # Load appropriate ADAF model
-        model.load_model(model_path)
+        t_load = time.perf_counter()
+        if registry is not None:
+            model = registry.get("segmentation", model_path, backend, precision)
+        else:
+            model = load_backend("segmentation", model_path, backend, precision=precision)
         logging.debug("Model successfully loaded.")
+        if metrics is not None:
+            metrics.emit("model", label=label, backend=backend, load_s=time.perf_counter() - t_load)
 
         # Run inference
         preds_dir = make_predictions_on_patches_segmentation(
             model=model,
             label=label,
-            patches_folder=images_dir
+            patches_folder=images_dir,
+            skip_rules=skip_rules,
+            screener=screener.get(label) if isinstance(screener, dict) else screener,
+            cache=cache,
+            model_key=model_key,
+            metrics=metrics
         )
 
         predictions_dirs[label] = preds_dir
@@ -443,13 +651,28 @@ def run_aitlas_segmentation(labels, images_dir, custom_model=None):
     return predictions_dirs
 
 
-def main_routine(inp):
-    """Main processing routine of ADAF. It is started by pressing the RUN button on the widget.
+def main_routine(inp, executor=None, registry=None, summary=None, profile=False):
+    """Main processing routine of ADAF. It is started by pressing the RUN button on the widget (or by the batch runner,
+    see adaf/__main__.py).
 
     Parameters
     ----------
     inp : adaf_utils.ADAFInput()
         An object containing all the input parameters from the widget.
+    executor : executors.Executor
+        Optional - existing executor for visualisations and vectorisation (shared by all DEMs of a batch), by default
+        a new executor of kind inp.executor (see executors.get_executor()) is created for each stage.
+    registry : adaf_utils.ModelRegistry
+        Optional - registry of loaded models (shared by all DEMs of a batch). Not used if inp.inference_server is
+        set, models are then run by the inference server.
+    summary : dict
+        Optional - filled with output paths, processing times (seconds) and peak memory of stages.
+    profile : bool
+        If True (or inp.profile is set), stages are profiled in all workers and profile statistics and report are
+        saved into the results folder (see profiling.py).
+
+    Timing and throughput of stages and tiles are saved as JSON lines ("metrics.jsonl", see metrics.py) next to the
+    logfile, if inp.trace is set they are also saved as a timeline ("trace.json", see trace.py).
 
     Returns
     -------
@@ -468,32 +691,77 @@ def main_routine(inp):
         suff = "_obj"
     else:
         suff = "_seg"
-    save_dir = out_dir / (dem_path.stem + strftime("_%Y%m%d_%H%M%S", time_started) + suff)
-    save_dir.mkdir(parents=True, exist_ok=True)
+    # Part of a job split between machines (see merge_shards.py), every shard has its own results folder
+    shard = gt.parse_shard(inp.shard) if inp.shard is not None else None
+    if shard is not None:
+        suff += f"_shard{shard[0]}of{shard[1]}"
+    # Runs started in the same second (e.g. DEMs with the same name in a concurrent batch) get a counter, folders of
+    # other runs are never reused
+    dir_name = dem_path.stem + strftime("_%Y%m%d_%H%M%S", time_started) + suff
+    out_dir.mkdir(parents=True, exist_ok=True)
+    save_dir = out_dir / dir_name
+    counter = 1
+    while True:
+        try:
+            save_dir.mkdir()
+            break
+        except FileExistsError:
+            counter += 1
+            save_dir = out_dir / f"{dir_name}_{counter}"
 
     # Create logfile
     log_path = save_dir / "logfile.txt"
     logger = Logger(log_path, log_time=time_started)
+    # Structured timing of stages and tiles (see metrics.py), tasks are also profiled in profiling mode
+    profiler = Profiler() if profile or inp.profile else None
+    metrics = Metrics(save_dir / METRICS_FILE, profiler)
 
     # --- VISUALIZATIONS ---
     logger.log_vis_inputs(dem_path, inp.vis_exist_ok)
     t1 = time.time()
 
-    # Determine nr_processes from available CPUs (leave two free)
-    my_cpus = os.cpu_count() - 2
-    if my_cpus < 1:
-        my_cpus = 1
+    # Models are kept loaded by the inference server (see inference_server.py), this process only sends tiles to it
+    if inp.inference_server:
+        registry = ModelRegistry(server=inp.inference_server)
+
+    # Tiled stages run in worker processes, unless another executor is selected (threads, Dask cluster, ...)
+    executor = executor or inp.executor or "processes"
+
+    # Cores (and memory) for all stages, by default all available CPUs minus two
+    resources = plan_resources(
+        inp.cpus, inp.memory_mb, 1 if inp.inference_server else inp.inference_workers, inp.inference_threads
+    )
+    logger.log(resources.summary())
+    metrics.emit(
+        "run",
+        dem_path=dem_path.as_posix(),
+        pid=os.getpid(),
+        ml_type=inp.ml_type,
+        labels=inp.labels,
+        backend=inp.backend or "torch",
+        executor=executor if isinstance(executor, str) else executor.kind,
+        shard=shard,
+        cpus=resources.cpus,
+        inference_workers=resources.inference_workers
+    )
+    # Peak memory of the stage (main process and workers)
+    vis_memory = PeakMemory("visualisations").start()
+    vis_stage = metrics.stage("tiling" if inp.vis_exist_ok else "visualisations")
     # The processing of the image is done on tiles (for better performance)
     tile_size_px = 1024  # Tile size has to be in base 2 (512, 1024) for inference to work!
 
     # vis_path is folder where visualizations are stored
     if inp.vis_exist_ok:
-        # Create tiles (because image pix size has to be divisible by 32)
+        # Create tiles (because image pix size has to be divisible by 32), tiles are only saved to disk if requested
+        # (save_vis also keeps tiles of an existing visualisation, as before save_tiles)
         out_paths = run_tiling(
             dem_path,
             tile_size_px,
             save_dir=save_dir.as_posix(),
-            nr_processes=my_cpus
+            nr_processes=resources.tiling_threads,
+            virtual=not (inp.save_tiles or inp.save_vis),
+            shard=shard,
+            metrics=metrics
         )
     else:
         # Create visualisations
@@ -501,17 +769,26 @@ def main_routine(inp):
             dem_path,
             tile_size_px,
             save_dir=save_dir.as_posix(),
-            nr_processes=my_cpus
+            nr_processes=resources.vis_workers,
+            engine=inp.vis_engine or "tiles",
+            executor=executor,
+            shard=shard,
+            metrics=metrics
         )
 
     vis_path = out_paths["output_directory"]
     vrt_path = out_paths["vrt_path"]
 
     t1 = time.time() - t1
+    vis_memory.stop()
+    vis_stage.end(peak_mb=vis_memory.peak_mb)
     logger.log_vis_results(vis_path, vrt_path, inp.save_vis, t1)
+    logger.log(vis_memory.summary())
 
-    # Make sure it is a Path object!
-    vis_path = Path(vis_path)
+    # Make sure it is a Path object! Virtual tiles have no directory, they are passed directly to inference.
+    if vis_path is not None:
+        vis_path = Path(vis_path)
+    tiles = out_paths.get("tiles", vis_path)
 
     # --- INFERENCE ---
     # Select name of the label for custom model
@@ -520,19 +797,45 @@ def main_routine(inp):
     else:
         labels = inp.labels
 
+    # Tiles without valid data or with flat terrain are skipped (statistics are computed while tiling)
+    skip_rules = DEFAULT_SKIP_RULES if inp.skip_rules is None else inp.skip_rules
+    # Results of tiles that were already processed with the same model are reused
+    cache = InferenceCache(inp.cache_dir, inp.cache_size_mb) if inp.cache_dir else None
+
     logger.log_inference_inputs(inp.ml_type,  labels, inp.ml_model_custom, inp.custom_model_pth)
+    if resources.inference_workers == 1:
+        # Inference runs in this process
+        resources.apply_torch()
     # For logger
     save_raw = []
     t2 = time.time()
-    if inp.ml_type == "object detection":
+    inference_memory = PeakMemory("inference").start()
+    inference_stage = metrics.stage("inference", labels=labels, workers=resources.inference_workers)
+    if isinstance(tiles, list) and not tiles:
+        # Shard without tiles (small DEM of a sharded batch), the manifest is still written for merge_shards.py
+        logger.log("No tiles in this shard, nothing to process.")
+        inference_stage.end()
+        predictions_dict = {}
+        vector_path = ""
+    elif inp.ml_type == "object detection":
         logging.debug("Running object detection")
-        predictions_dict = run_aitlas_object_detection(labels, vis_path, inp.custom_model_pth)
-
-        vector_path = object_detection_vectors(
-            predictions_dict,
-            keep_ml_paths=inp.save_ml_output,
-            min_area=inp.min_area
-        )
+        with metrics.profile("inference"):
+            predictions_dict = run_aitlas_object_detection(
+                labels, tiles, inp.custom_model_pth, skip_rules, inp.screener_path, cache,
+                inp.backend or "torch", inp.precision or "fp32", resources.inference_workers, resources.torch_threads,
+                registry, metrics
+            )
+        inference_stage.end()
+
+        vector_stage = metrics.stage("vectorisation")
+        with metrics.profile("vectorisation"):
+            vector_path = object_detection_vectors(
+                predictions_dict,
+                keep_ml_paths=inp.save_ml_output,
+                min_area=inp.min_area,
+                metrics=metrics
+            )
+        vector_stage.end()
         if vector_path != "":
             logging.debug("Created vector file", vector_path)
         else:
@@ -547,14 +850,25 @@ def main_routine(inp):
 
     elif inp.ml_type == "segmentation":
         logging.debug("Running segmentation")
-        predictions_dict = run_aitlas_segmentation(labels, vis_path, inp.custom_model_pth)
-
+        with metrics.profile("inference"):
+            predictions_dict = run_aitlas_segmentation(
+                labels, tiles, inp.custom_model_pth, skip_rules, inp.screener_path, cache,
+                inp.backend or "torch", inp.precision or "fp32", resources.inference_workers, resources.torch_threads,
+                registry, metrics
+            )
+        inference_stage.end()
+
+        vector_stage = metrics.stage("vectorisation")
         vector_path = semantic_segmentation_vectors(
             predictions_dict,
             keep_ml_paths=inp.save_ml_output,
             roundness=inp.roundness,
-            min_area=inp.min_area
+            min_area=inp.min_area,
+            nr_processes=resources.vector_workers,
+            executor=executor,
+            metrics=metrics
         )
+        vector_stage.end()
         if vector_path != "":
             logging.debug("Created vector file", vector_path)
         else:
@@ -576,6 +890,10 @@ def main_routine(inp):
     else:
         raise Exception("Wrong ml_type: choose 'object detection' or 'segmentation'")
     t2 = time.time() - t2
+    inference_memory.stop()
+    if cache is not None:
+        logger.log(cache.summary())
+    logger.log(inference_memory.summary())
 
     # Log inference results (roundness not used for obj. detection)
     if inp.ml_type == "segmentation":
@@ -584,7 +902,7 @@ def main_routine(inp):
         logger.log_inference_results(vector_path, t2, save_raw, inp.min_area)
 
     # Remove visualizations
-    if not inp.save_vis:
+    if not (inp.save_vis or inp.save_tiles) and vis_path is not None:
         shutil.rmtree(vis_path)
         if vrt_path:
             Path(vrt_path).unlink()
@@ -592,6 +910,47 @@ def main_routine(inp):
     # TOTAL PROCESSING TIME
     t0 = time.time() - t0
     logger.log_total_time(t0)
+    metrics.emit(
+        "run_end", total_s=t0, vis_s=t1, inference_s=t2, vector_path=vector_path,
+        vis_peak_mb=vis_memory.peak_mb, inference_peak_mb=inference_memory.peak_mb
+    )
+    metrics.close()
+    logger.log(f"Metrics (JSON lines): {metrics.path.as_posix()}")
+    trace_path = None
+    if inp.trace:
+        trace_path = write_trace(metrics.path)
+        logger.log(f"Timeline (Chrome Trace Event format): {trace_path.as_posix()}")
+    profile_path = None
+    if profiler is not None:
+        profile_path = profiler.write(save_dir)
+        logger.log(f"Profile report: {profile_path.as_posix()}")
+
+    # Shard is complete, the manifest tells merge_shards.py what to combine
+    if shard is not None:
+        write_shard_manifest(
+            save_dir,
+            shard,
+            dem_path,
+            inp.ml_type,
+            vector_path,
+            predictions_dict if inp.save_ml_output else None
+        )
+
+    if summary is not None:
+        summary.update(
+            dem_path=dem_path.as_posix(),
+            save_dir=save_dir.as_posix(),
+            vector_path=vector_path,
+            log_path=log_path.as_posix(),
+            metrics_path=metrics.path.as_posix(),
+            trace_path=trace_path.as_posix() if trace_path else None,
+            profile_path=profile_path.as_posix() if profile_path else None,
+            vis_seconds=t1,
+            inference_seconds=t2,
+            total_seconds=t0,
+            vis_peak_mb=vis_memory.peak_mb,
+            inference_peak_mb=inference_memory.peak_mb
+        )
 
     logging.debug("\n--\nFINISHED!")
 
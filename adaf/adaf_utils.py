@@ -3,23 +3,199 @@ ADAF - utility functions
 Created on 26 May 2023
 @author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
 """
+import hashlib
+import inspect
+import json
 import logging
 import multiprocessing as mp
 import os
+import secrets
+import sys
+import threading
+import time
 import warnings
+from collections.abc import Mapping
+from multiprocessing.connection import Client
 from pathlib import Path
 from time import localtime, strftime
 
 import numpy as np
+import pandas as pd
 import rasterio
+import torch
+from aitlas.models import FasterRCNN, HRNet
 from aitlas.transforms import ResizeV2
 from aitlas.transforms import Transpose
 from osgeo import gdal
 from rasterio.windows import from_bounds
+from torchvision.ops import nms
+
+from adaf.executors import executor_scope, get_executor
+from adaf.metrics import Metrics, timed_call
+from adaf.profiling import profiled_call
+from adaf.resources import vis_worker_mb, workers_for_memory
 
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# Data type of DEM, visualisations and tiles (all arrays are processed in single precision)
+DTYPE = "float32"
+
+# Statistics of visualisation tiles, saved next to the tiles
+TILE_STATS_FILE = "tile_stats.csv"
+TILE_STATS_BINS = 10
+
+# Tiles that match any of the rules are skipped during inference (use None to disable a rule)
+DEFAULT_SKIP_RULES = {
+    "min_valid_fraction": 0.001,  # Fraction of valid (non-zero) pixels
+    "min_slrm_std": 1e-4,  # Standard deviation of normalised SLRM (flat tiles, e.g. water bodies)
+    "min_slrm_range": None  # Difference between max and min of normalised SLRM
+}
+
+
+def _row_blocks(arr, block_rows=256):
+    """Yields views of the array in blocks of rows (bands of 3D arrays are split separately)."""
+    if arr.ndim > 2:
+        for band in arr:
+            yield from _row_blocks(band, block_rows)
+    else:
+        for r in range(0, arr.shape[0], block_rows):
+            yield arr[r:r + block_rows]
+
+
+def fill_nodata_inplace(arr, nodata, value, block_rows=256):
+    """Replaces nodata (can be NaN) with value, in place.
+
+    The array is processed in blocks of rows with one reusable mask, so no temporary arrays of the full array size are
+    allocated.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        2D or 3D array, modified in place.
+    nodata : float or None
+        Value to be replaced. Nothing is done if None.
+    value : float
+        New value.
+    block_rows : int
+        Number of rows processed at once.
+
+    Returns
+    -------
+    np.ndarray
+        The same (modified) array.
+    """
+    if nodata is None:
+        return arr
+
+    mask = np.empty((block_rows, arr.shape[-1]), dtype=bool)
+    for block in _row_blocks(arr, block_rows):
+        block_mask = mask[:block.shape[0]]
+        if np.isnan(nodata):
+            np.isnan(block, out=block_mask)
+        else:
+            np.equal(block, nodata, out=block_mask)
+        np.copyto(block, value, where=block_mask)
+
+    return arr
+
+
+def clamp_inplace(arr, min_value, max_value):
+    """Clips array values to [min_value, max_value] in place (NaNs are kept)."""
+    np.clip(arr, min_value, max_value, out=arr)
+
+    return arr
+
+
+def normalize_inplace(arr, min_value, max_value):
+    """Linear stretch from [min_value, max_value] to 0-1 in place, NaNs are set to 0.
+
+    Same as the "value" normalization of RVT (normalize_image), but without allocating new arrays.
+    """
+    clamp_inplace(arr, min_value, max_value)
+    arr -= min_value
+    arr /= (max_value - min_value)
+    fill_nodata_inplace(arr, np.nan, 0)
+
+    return arr
+
+
+def tile_statistics(image, bins=TILE_STATS_BINS):
+    """Computes statistics of a visualisation (SLRM) tile, normalised to 0-1 with nodata 0.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Visualisation tile, 2D or 3D array.
+    bins : int
+        Number of histogram bins (over 0-1 range).
+
+    Returns
+    -------
+    dict
+        "valid_fraction" - fraction of valid (non-zero) pixels, "slrm_min", "slrm_max", "slrm_std" - statistics of
+        valid pixels and "hist" - histogram of valid pixels (list of counts).
+    """
+    valid_values = image[image != 0]
+    if valid_values.size == 0:
+        return {"valid_fraction": 0.0, "slrm_min": 0.0, "slrm_max": 0.0, "slrm_std": 0.0, "hist": [0] * bins}
+
+    hist, _ = np.histogram(valid_values, bins=bins, range=(0, 1))
+
+    return {
+        "valid_fraction": valid_values.size / image.size,
+        "slrm_min": float(valid_values.min()),
+        "slrm_max": float(valid_values.max()),
+        "slrm_std": float(valid_values.std(dtype=np.float64)),
+        "hist": hist.tolist()
+    }
+
+
+def save_tile_statistics(tiles_stats, stats_path):
+    """Saves a list of tile statistics (see tile_statistics, each with "file" key) to CSV file. Returns path to file."""
+    rows = []
+    for stats in tiles_stats:
+        row = {key: value for key, value in stats.items() if key != "hist"}
+        row.update({f"hist_{i}": count for i, count in enumerate(stats["hist"])})
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(stats_path, index=False)
+
+    return stats_path
+
+
+def load_tile_statistics(stats_path):
+    """Reads tile statistics from CSV file. Returns a dictionary, key is tile file name, value are statistics."""
+    df = pd.read_csv(stats_path)
+    hist_cols = [col for col in df.columns if col.startswith("hist_")]
+
+    tiles_stats = {}
+    for row in df.to_dict("records"):
+        stats = {key: value for key, value in row.items() if key not in hist_cols and key != "file"}
+        stats["hist"] = [row[col] for col in hist_cols]
+        tiles_stats[row["file"]] = stats
+
+    return tiles_stats
+
+
+def skip_tile(stats, skip_rules):
+    """Checks tile statistics against skip rules (see DEFAULT_SKIP_RULES). Returns True if the tile can be skipped."""
+    if not skip_rules:
+        return False
+
+    min_valid = skip_rules.get("min_valid_fraction")
+    if min_valid is not None and stats["valid_fraction"] < min_valid:
+        return True
+
+    min_std = skip_rules.get("min_slrm_std")
+    if min_std is not None and stats["slrm_std"] < min_std:
+        return True
+
+    min_range = skip_rules.get("min_slrm_range")
+    if min_range is not None and (stats["slrm_max"] - stats["slrm_min"]) < min_range:
+        return True
+
+    return False
+
 
 def make_predictions_on_single_patch_store_preds_single_class(
         model,
@@ -28,25 +204,805 @@ def make_predictions_on_single_patch_store_preds_single_class(
         image_filename,
         predictions_dir
 ):
-    transform = ResizeV2()
-
     with rasterio.open(image_path) as image_tiff:
         image = image_tiff.read()
-        # The following are required to construct vector from txt
-        epsg = image_tiff.crs.to_epsg()
-        res = image_tiff.res[0]
-        x_min = image_tiff.transform.c
-        y_max = image_tiff.transform.f
+        profile = image_tiff.meta.copy()
+
+    object_detection_on_array(model, label, image, profile, image_filename, predictions_dir)
+
+
+_FILE_HASHES = {}
+
 
+def file_hash(path, chunk_size=2 ** 20):
+    """SHA-256 of file contents (hex). Hashes are remembered for the session (key is path, size and modification
+    time), so large checkpoints are only read once."""
+    path = Path(path)
+    stat = path.stat()
+    memo_key = (path.resolve().as_posix(), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _FILE_HASHES:
+        sha = hashlib.sha256()
+        with open(path, "rb") as src:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                sha.update(chunk)
+        _FILE_HASHES[memo_key] = sha.hexdigest()
+
+    return _FILE_HASHES[memo_key]
+
+
+def model_cache_key(model_path, model_config):
+    """Key of a model for InferenceCache, built from hash of the checkpoint and the model configuration."""
+    config = json.dumps(model_config, sort_keys=True, default=str)
+
+    return hashlib.sha256(f"{file_hash(model_path)}|{config}".encode()).hexdigest()
+
+
+class InferenceCache:
+    """Cache of inference results of single tiles, stored as compressed NPZ files.
+
+    Results are keyed by the hash of tile pixels and the model key (checkpoint hash and configuration, see
+    model_cache_key()), so they are reused when the same tile is processed with the same model again (re-runs,
+    overlapping DEMs). When the cache grows over max_size_mb, the least recently used files are removed (down to
+    EVICT_TO of max_size_mb, so that eviction doesn't run on every new file).
+
+    Parameters
+    ----------
+    cache_dir : str or pathlib.Path()
+        Directory of the cache (can be shared between runs).
+    max_size_mb : float
+        Maximum size of the cache on disk.
+    """
+    # Part of max_size_mb that is kept after eviction
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir, max_size_mb=2048):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_size_mb * 1024 ** 2
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # Running size of the cache (files of other processes sharing the cache are counted at eviction)
+        self._size = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The cache is sent to inference workers (see predict_in_workers()), every worker counts the size again
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_size"] = None
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image, model_key):
+        """Cache key of a tile (hash of pixels, shape and data type) for the given model."""
+        image = np.ascontiguousarray(image)
+        sha = hashlib.sha256()
+        sha.update(f"{model_key}|{image.shape}|{image.dtype}|".encode())
+        sha.update(image.data)
+
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key):
+        """Returns dictionary of cached arrays or None if the key is not in cache."""
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            # Missing (or partially written) file
+            self.misses += 1
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+        self.hits += 1
+
+        return arrays
+
+    def put(self, key, **arrays):
+        """Saves arrays under the key and removes the least recently used files if the cache is too big."""
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez_compressed(tmp_path, **arrays)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(file_size for _, file_size, _ in self._files())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def _files(self):
+        """(modification time, size, path) of cached files, files still being written by other workers (*.tmp.npz)
+        are left out."""
+        files = []
+        for path in self.cache_dir.glob("*.npz"):
+            if path.name.endswith(".tmp.npz"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        return files
+
+    def evict(self):
+        """Removes the least recently used files until the cache is smaller than EVICT_TO of max_size_mb."""
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes * self.EVICT_TO:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                self.evicted += 1
+        self._size = total
+
+    def summary(self):
+        """Text with hit/miss counters, used for the log file."""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+
+        return (
+            f"Inference cache: {self.hits} hits, {self.misses} misses ({rate:.0f} % hit rate), "
+            f"{self.evicted} evicted"
+        )
+
+
+def detect_boxes(model, image):
+    """Runs object detection on a single tile. Returns bounding boxes (N x 4, pixel coordinates) and scores (N)."""
     if image.shape[0] == 1:
         image = np.repeat(image, 3, axis=0)
     image = np.transpose(image, (1, 2, 0))
-    predictions_single_patch_str = ""
-    predicted = model.detect_objects_v2(image, [None], transform)
+    with torch.no_grad():
+        predicted = model.detect_objects_v2(image, [None], ResizeV2())
+
+    # Outputs are cast to float32 (they are bfloat16 in reduced precision mode)
+    boxes = predicted['boxes'].detach().float().cpu().numpy().reshape(-1, 4)
+    scores = predicted['scores'].detach().float().cpu().numpy().reshape(-1)
+
+    return boxes, scores
+
+
+def segment_probs(model, image):
+    """Runs semantic segmentation on a single tile. Returns probabilities of the positive class (1 x rows x cols).
+
+    Same as HRNet.predict_masks_tiff_probs_binary() from AiTLAS, but works on an array that is already in memory.
+    """
+    return segment_probs_batch(model, [image])[0]
+
+
+def segment_probs_batch(model, images):
+    """Runs semantic segmentation on tiles of the same shape in one forward pass. Returns probabilities of the positive
+    class (tiles x 1 x rows x cols)."""
+    inputs = []
+    for image in images:
+        if image.shape[0] == 1:
+            image = np.repeat(image, 3, axis=0)
+        inputs.append(Transpose()(np.transpose(image, (1, 2, 0))))
+
+    model.model.eval()
+    inputs = torch.stack(inputs).to(model.device)
+    with torch.no_grad():
+        outputs = model(inputs)
+    # check if outputs is OrderedDict for segmentation
+    if isinstance(outputs, Mapping):
+        outputs = outputs["out"]
+    predicted_probs, _ = model.get_predicted(outputs)
+
+    # Probabilities for the positive class (binary model)
+    return predicted_probs.float().cpu().numpy()[:, 1:2]
+
+
+def model_config(ml_type):
+    """Configuration of AiTLAS model for ADAF, ml_type is "object detection" or "segmentation"."""
+    config = {
+        "num_classes": 2,  # Number of classes in the dataset
+        "learning_rate": 0.0001,  # Learning rate for training
+        "pretrained": True,  # Whether to use a pretrained model or not
+        "use_cuda": torch.cuda.is_available(),  # Set to True if you want to use GPU acceleration
+    }
+    if ml_type == "object detection":
+        config["metrics"] = ["map"]  # Evaluation metrics to be used
+    elif ml_type == "segmentation":
+        config["threshold"] = 0.5
+        config["metrics"] = ["iou"]  # Evaluation metrics to be used
+    else:
+        raise ValueError(f"Wrong ml_type '{ml_type}': choose 'object detection' or 'segmentation'!")
+
+    return config
+
+
+# Memory-mapped loading of weights requires PyTorch 2.1 (torch.load(mmap=True), load_state_dict(assign=True))
+MMAP_SUPPORTED = "mmap" in inspect.signature(torch.load).parameters
+
+
+def weights_model_path(model_path):
+    """Path of the weights converted from a checkpoint for memory-mapped loading (saved in "weights" folder next to
+    the checkpoint, see convert_weights.py)."""
+    model_path = Path(model_path)
+
+    return model_path.parent / "weights" / (model_path.stem + ".pt")
+
+
+def load_mmap_weights(model, weights_path):
+    """Loads weights into AiTLAS model from a file converted with convert_weights.py.
+
+    The file is memory-mapped and tensors of the model point to the mapped pages (assign=True), so weights are read
+    from disk only when used and processes loading the same model share the page cache instead of copies in RAM.
+    Weights are loaded the same way as by AiTLAS load_model() (keys don't have to match exactly).
+    """
+    state_dict = torch.load(Path(weights_path).as_posix(), map_location="cpu", mmap=True, weights_only=True)
+    keys = model.model.load_state_dict(state_dict, strict=False, assign=True)
+    if keys.missing_keys or keys.unexpected_keys:
+        logging.debug(
+            "Weights %s: missing keys %s, unexpected keys %s", weights_path, keys.missing_keys, keys.unexpected_keys
+        )
+    # No-op on CPU (weights stay mapped), copies weights to GPU
+    model.allocate_device()
+
+
+def load_aitlas_model(ml_type, model_path):
+    """Prepares AiTLAS model (FasterRCNN or HRNet) and loads weights from checkpoint (tar file).
+
+    If the checkpoint was converted with convert_weights.py (and the conversion is not older than the checkpoint),
+    weights are memory-mapped from the converted file instead of unpickling the whole checkpoint.
+    """
+    if ml_type == "object detection":
+        model = FasterRCNN(model_config(ml_type))
+    else:
+        model = HRNet(model_config(ml_type))
+    model.prepare()
+
+    weights_path = weights_model_path(model_path)
+    if (
+        MMAP_SUPPORTED and weights_path.is_file()
+        and weights_path.stat().st_mtime >= Path(model_path).stat().st_mtime
+    ):
+        load_mmap_weights(model, weights_path)
+    else:
+        model.load_model(model_path)
+
+    return model
+
+
+def onnx_model_path(model_path, variant=None):
+    """Path of the exported ONNX graph for a checkpoint (saved in "onnx" folder next to the checkpoint). Variant is
+    added to the file name (e.g. "int8" for quantised graphs, see quantize.py)."""
+    model_path = Path(model_path)
+    suffix = f".{variant}.onnx" if variant else ".onnx"
+
+    return model_path.parent / "onnx" / (model_path.stem + suffix)
+
+
+def _three_bands(image):
+    """Tile as float32 array with 3 bands (1-band SLRM is repeated, as expected by the models)."""
+    if image.shape[0] == 1:
+        image = np.repeat(image, 3, axis=0)
+
+    return np.ascontiguousarray(image, dtype=np.float32)
+
+
+class SegmentationGraph(torch.nn.Module):
+    """HRNet with sigmoid of the positive class, the graph returns probabilities (batch x 1 x rows x cols). Used for
+    export to ONNX (see export_onnx.py) and TorchScript (see compile_model())."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        outputs = self.model(x)
+        if isinstance(outputs, Mapping):
+            outputs = outputs["out"]
+
+        return torch.sigmoid(outputs)[:, 1:2]
+
+
+class DetectionGraph(torch.nn.Module):
+    """FasterRCNN for a single image, the graph returns boxes, labels and scores (before NMS). Used for export to ONNX
+    (see export_onnx.py) and TorchScript (see compile_model())."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        outputs = self.model([x])[0]
+
+        return outputs["boxes"], outputs["labels"], outputs["scores"]
+
+
+def bf16_supported(device_type="cpu"):
+    """Checks if the device supports bfloat16 natively (on CPU this requires AVX512-BF16 or AMX)."""
+    if device_type == "cuda":
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class TorchBackend:
+    """Inference backend, runs the AiTLAS model with PyTorch (eager mode).
+
+    Parameters
+    ----------
+    model
+        AiTLAS model.
+    precision : str
+        "fp32" or "bf16". In bf16 mode the model runs under autocast (operations without bfloat16 support run in
+        float32). If the device has no bfloat16 support or the model fails in bfloat16, the backend falls back to fp32.
+    """
+    name = "torch"
+
+    def __init__(self, model, precision="fp32"):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Wrong precision '{precision}': choose one of {PRECISIONS}!")
+        self.model = model
+        self.device_type = torch.device(model.device).type
+        self.precision = precision
+        if precision == "bf16" and not bf16_supported(self.device_type):
+            logging.info("No bfloat16 support on %s, running inference in fp32", self.device_type)
+            self.precision = "fp32"
+
+    def _run(self, func, image):
+        if self.precision == "bf16":
+            try:
+                with torch.autocast(device_type=self.device_type, dtype=torch.bfloat16):
+                    return func(self.model, image)
+            except RuntimeError as err:
+                logging.info("Inference in bfloat16 failed (%s), falling back to fp32", err)
+                self.precision = "fp32"
+
+        return func(self.model, image)
+
+    def detect(self, image):
+        """Bounding boxes (N x 4) and scores (N) for a single tile (bands, rows, cols)."""
+        return self._run(detect_boxes, image)
+
+    def segment(self, image):
+        """Probabilities of the positive class (1 x rows x cols) for a single tile (bands, rows, cols)."""
+        return self._run(segment_probs, image)
+
+    def segment_batch(self, images):
+        """Probabilities of the positive class (tiles x 1 x rows x cols) for tiles of the same shape."""
+        return self._run(segment_probs_batch, images)
+
+
+class OnnxBackend:
+    """Inference backend, runs an exported ONNX graph (see export_onnx.py) with ONNX Runtime on CPU.
+
+    Segmentation graphs return probabilities of the positive class, detection graphs return boxes, labels and scores
+    before NMS (NMS is the same as in AiTLAS BaseObjectDetection.get_predicted()).
+
+    Parameters
+    ----------
+    onnx_path : str or pathlib.Path()
+        Path to exported ONNX file.
+    threads : int
+        Number of threads for ONNX Runtime (intra-op), None uses ONNX Runtime default.
+    nms_threshold : float
+        IoU threshold for non-maximum suppression of detected boxes.
+    """
+    name = "onnx"
+
+    def __init__(self, onnx_path, threads=None, nms_threshold=0.2):
+        try:
+            import onnxruntime as ort
+        except ImportError as err:
+            raise ImportError("ONNX backend requires onnxruntime (pip install onnxruntime)!") from err
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            Path(onnx_path).as_posix(), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.nms_threshold = nms_threshold
+
+    def detect(self, image):
+        """Bounding boxes (N x 4) and scores (N) for a single tile (bands, rows, cols)."""
+        boxes, _, scores = self.session.run(None, {self.input_name: _three_bands(image)})
+        keep = nms(torch.from_numpy(boxes), torch.from_numpy(scores), self.nms_threshold).numpy()
+
+        return boxes[keep].reshape(-1, 4), scores[keep].reshape(-1)
+
+    def segment(self, image):
+        """Probabilities of the positive class (1 x rows x cols) for a single tile (bands, rows, cols)."""
+        probs = self.session.run(None, {self.input_name: _three_bands(image)[np.newaxis]})[0]
+
+        return probs[0]
+
+    def segment_batch(self, images):
+        """Probabilities of the positive class (tiles x 1 x rows x cols) for tiles of the same shape."""
+        return self.session.run(None, {self.input_name: np.stack([_three_bands(image) for image in images])})[0]
+
+
+def compiled_model_path(model_path, ml_type, tile_size=1024, device_type="cpu"):
+    """Path of the TorchScript model compiled from a checkpoint (saved in COMPILED_DIR folder next to the checkpoint).
+
+    The file name contains the key of the compiled model: hash of the checkpoint, PyTorch version, type of the model,
+    tile size and device. Changing any of them compiles a new model.
+    """
+    model_path = Path(model_path)
+    key = hashlib.sha256(
+        json.dumps(
+            {
+                "checkpoint": file_hash(model_path),
+                "torch": torch.__version__,
+                "ml_type": ml_type,
+                "tile_size": tile_size,
+                "device": device_type
+            },
+            sort_keys=True
+        ).encode()
+    ).hexdigest()[:16]
+    torch_version = torch.__version__.replace("+", "-")
+
+    return model_path.parent / COMPILED_DIR / f"{model_path.stem}.torch-{torch_version}.{key}.pt"
+
+
+def compile_model(ml_type, model_path, tile_size=1024):
+    """Traces AiTLAS model for tiles of fixed size and saves it as TorchScript (see compiled_model_path()).
+
+    The traced graph is frozen (weights are inlined as constants), loading it doesn't need AiTLAS model classes.
+
+    Parameters
+    ----------
+    ml_type : str
+        "object detection" or "segmentation".
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    tile_size : int
+        Size of tiles (rows and cols are fixed in the traced graph).
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the compiled model.
+    """
+    model = load_aitlas_model(ml_type, model_path)
+    device = torch.device(model.device)
+    module = model.model.to(device).eval()
+
+    if ml_type == "object detection":
+        graph = DetectionGraph(module)
+        example = torch.rand(3, tile_size, tile_size, device=device)
+    else:
+        graph = SegmentationGraph(module)
+        example = torch.rand(1, 3, tile_size, tile_size, device=device)
+
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(graph, (example,), check_trace=False).eval())
+
+    compiled_path = compiled_model_path(model_path, ml_type, tile_size, device.type)
+    compiled_path.parent.mkdir(parents=True, exist_ok=True)
+    # Save to a temporary file first, so a parallel run never loads a partially written file
+    tmp_path = compiled_path.with_name(f"{compiled_path.name}.{os.getpid()}.tmp")
+    torch.jit.save(traced, tmp_path.as_posix())
+    os.replace(tmp_path, compiled_path)
+
+    return compiled_path
+
+
+class TorchScriptBackend:
+    """Inference backend, runs the model compiled with compile_model() (TorchScript, PyTorch JIT).
+
+    Outputs are the same as with the TorchBackend, detection applies the same NMS as AiTLAS.
+
+    Parameters
+    ----------
+    compiled_path : str or pathlib.Path()
+        Path to compiled model.
+    device_type : str
+        "cpu" or "cuda", has to match the device used for compiling.
+    tile_size : int
+        Size of tiles the model was compiled for.
+    nms_threshold : float
+        IoU threshold for non-maximum suppression of detected boxes.
+    """
+    name = "torchscript"
+
+    def __init__(self, compiled_path, device_type="cpu", tile_size=1024, nms_threshold=0.2):
+        self.device = torch.device(device_type)
+        self.module = torch.jit.load(Path(compiled_path).as_posix(), map_location=self.device)
+        self.tile_size = tile_size
+        self.nms_threshold = nms_threshold
+
+    def _tensor(self, image):
+        if image.shape[1:] != (self.tile_size, self.tile_size):
+            raise ValueError(
+                f"Tile of shape {image.shape[1:]}, the model was compiled for {self.tile_size}px tiles!"
+            )
+
+        return torch.from_numpy(_three_bands(image)).to(self.device)
+
+    def detect(self, image):
+        """Bounding boxes (N x 4) and scores (N) for a single tile (bands, rows, cols)."""
+        with torch.no_grad():
+            boxes, _, scores = self.module(self._tensor(image))
+            keep = nms(boxes, scores, self.nms_threshold)
+
+        return boxes[keep].cpu().numpy().reshape(-1, 4), scores[keep].cpu().numpy().reshape(-1)
+
+    def segment(self, image):
+        """Probabilities of the positive class (1 x rows x cols) for a single tile (bands, rows, cols)."""
+        with torch.no_grad():
+            probs = self.module(self._tensor(image)[None])
+
+        return probs[0].cpu().numpy()
+
+
+# Folder of the inference server socket and key (only accessible by the user)
+SERVER_DIR = Path.home() / ".adaf"
+SERVER_KEY_FILE = SERVER_DIR / "inference_server.key"
+# Address of the inference server (see inference_server.py), "host:port" or path to a Unix socket (named pipe on
+# Windows), by default a Unix socket in SERVER_DIR
+if sys.platform == "win32":
+    DEFAULT_SERVER_ADDRESS = r"\\.\pipe\adaf_inference_server"
+else:
+    DEFAULT_SERVER_ADDRESS = (SERVER_DIR / "inference_server.sock").as_posix()
 
-    for i in range(0, len(predicted['boxes'])):
-        box = predicted['boxes'][i].detach().numpy()
-        score = predicted['scores'][i].detach().numpy()
+
+def server_address(address=None):
+    """Address of the inference server for multiprocessing.connection, (host, port) for "host:port", otherwise path to
+    a Unix socket (or a named pipe on Windows). By default ADAF_SERVER environment variable or DEFAULT_SERVER_ADDRESS.
+    """
+    address = address or os.environ.get("ADAF_SERVER") or DEFAULT_SERVER_ADDRESS
+    if isinstance(address, tuple):
+        return address
+    host, sep, port = str(address).rpartition(":")
+    if sep and port.isdigit():
+        return host or "localhost", int(port)
+
+    return str(address)
+
+
+def server_authkey(create=False):
+    """Key shared by the inference server and its clients.
+
+    Messages are pickled, so the key is what stops other users from running code as the server user. It is taken from
+    ADAF_SERVER_KEY environment variable or from SERVER_KEY_FILE (readable only by the user), which the server creates
+    with a random key (create=True) when it starts.
+    """
+    key = os.environ.get("ADAF_SERVER_KEY")
+    if key:
+        return key.encode()
+
+    if create and not SERVER_KEY_FILE.exists():
+        SERVER_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(SERVER_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as dst:
+            dst.write(secrets.token_hex(32))
+    if not SERVER_KEY_FILE.exists():
+        raise FileNotFoundError(
+            f"Key of the inference server ({SERVER_KEY_FILE}) doesn't exist, start the server or set ADAF_SERVER_KEY!"
+        )
+    if sys.platform != "win32" and SERVER_KEY_FILE.stat().st_mode & 0o077:
+        raise PermissionError(f"Key of the inference server ({SERVER_KEY_FILE}) is accessible by other users!")
+
+    return SERVER_KEY_FILE.read_text().strip().encode()
+
+
+class RemoteBackend:
+    """Inference backend, sends tiles to the inference server (see inference_server.py), which keeps models loaded and
+    runs requests of all clients in batches.
+
+    Every thread uses its own connection, so concurrent runs (e.g. DEMs of a batch) are batched together on the server.
+
+    Parameters
+    ----------
+    ml_type : str
+        "object detection" or "segmentation".
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file), the server loads the model on first request.
+    backend : str
+        Backend used by the server (see load_backend()).
+    precision : str
+        "fp32" or "bf16", torch backend only.
+    address : str or tuple
+        Address of the server (see server_address()).
+    """
+    name = "remote"
+
+    def __init__(self, ml_type, model_path, backend="torch", precision="fp32", address=None):
+        self.address = server_address(address)
+        self.model = {
+            "ml_type": ml_type,
+            "model_path": Path(model_path).resolve().as_posix(),
+            "backend": backend,
+            "precision": precision
+        }
+        self._local = threading.local()
+
+    def request(self, op, **kwargs):
+        """Sends a request to the server and returns the result."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=server_authkey())
+        conn.send({"op": op, **self.model, **kwargs})
+        reply = conn.recv()
+        if "error" in reply:
+            raise RuntimeError(f"Inference server: {reply['error']}")
+
+        return reply["result"]
+
+    @staticmethod
+    def _tile(image):
+        # Tiles saved on disk are read here, the server only accepts arrays (it doesn't open files of clients)
+        if isinstance(image, (str, Path)):
+            with rasterio.open(image) as src:
+                image = src.read()
+
+        return {"image": image}
+
+    def detect(self, image):
+        """Bounding boxes (N x 4) and scores (N) for a single tile (array or path to GeoTIFF)."""
+        return self.request("detect", **self._tile(image))
+
+    def segment(self, image):
+        """Probabilities of the positive class (1 x rows x cols) for a single tile (array or path to GeoTIFF)."""
+        return self.request("segment", **self._tile(image))
+
+
+# Available inference backends and precisions (precision only applies to torch backend)
+BACKENDS = ("torch", "torchscript", "onnx", "onnx-int8")
+PRECISIONS = ("fp32", "bf16")
+# File name suffix of quantised ONNX graphs (see quantize.py)
+INT8_VARIANT = "int8"
+# Folder next to checkpoints with compiled (TorchScript) models
+COMPILED_DIR = ".compiled"
+
+
+def load_backend(ml_type, model_path, backend="torch", threads=None, precision="fp32", tile_size=1024):
+    """Loads model for inference with the selected backend.
+
+    Parameters
+    ----------
+    ml_type : str
+        "object detection" or "segmentation".
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file). The ONNX backend uses the graph exported next to it (see
+        onnx_model_path()).
+    backend : str
+        "torch" (AiTLAS model, PyTorch eager), "torchscript" (model traced for fixed tile size, compiled on first use
+        and cached next to the checkpoint), "onnx" (ONNX Runtime, CPU) or "onnx-int8" (int8 quantised graph,
+        ONNX Runtime, CPU).
+    threads : int
+        Number of threads for ONNX Runtime.
+    precision : str
+        "fp32" or "bf16" (autocast), only for torch backend.
+    tile_size : int
+        Size of tiles, only for torchscript backend.
+
+    Returns
+    -------
+    TorchBackend or TorchScriptBackend or OnnxBackend
+        Backend with detect() and segment() methods.
+    """
+    if backend == "torch":
+        return TorchBackend(load_aitlas_model(ml_type, model_path), precision)
+    elif backend == "torchscript":
+        device_type = "cuda" if torch.cuda.is_available() else "cpu"
+        compiled_path = compiled_model_path(model_path, ml_type, tile_size, device_type)
+        if not compiled_path.is_file():
+            logging.info("Compiling %s for %spx tiles (TorchScript)", Path(model_path).name, tile_size)
+            compile_model(ml_type, model_path, tile_size)
+        return TorchScriptBackend(compiled_path, device_type, tile_size)
+    elif backend in ("onnx", "onnx-int8"):
+        onnx_path = onnx_model_path(model_path, INT8_VARIANT if backend == "onnx-int8" else None)
+        if not onnx_path.is_file():
+            tool = "quantize.py" if backend == "onnx-int8" else "export_onnx.py"
+            raise FileNotFoundError(f"No {backend} graph for {Path(model_path).name}, run {tool} first!")
+        return OnnxBackend(onnx_path, threads=threads)
+    else:
+        raise ValueError(f"Wrong backend '{backend}': choose one of {BACKENDS}!")
+
+
+def as_backend(model):
+    """Wraps AiTLAS model into TorchBackend (backends are returned as they are)."""
+    if isinstance(model, (TorchBackend, TorchScriptBackend, OnnxBackend, RemoteBackend)):
+        return model
+
+    return TorchBackend(model)
+
+
+class ModelRegistry:
+    """Inference backends loaded once and shared between runs (e.g. all DEMs of a batch, see adaf/__main__.py).
+
+    Models are keyed by type, checkpoint, backend and precision. Loading is serialised with a lock, so concurrent runs
+    never load the same model twice. If the address of an inference server is given, models are not loaded in this
+    process, the registry returns clients of the server (RemoteBackend).
+    """
+    def __init__(self, server=None):
+        self.server = server
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, ml_type, model_path, backend="torch", precision="fp32"):
+        """Returns backend for the model (see load_backend()), the model is loaded on first request."""
+        key = (ml_type, Path(model_path).as_posix(), backend, precision)
+        with self._lock:
+            if key not in self._models:
+                if self.server:
+                    self._models[key] = RemoteBackend(ml_type, model_path, backend, precision, self.server)
+                else:
+                    self._models[key] = load_backend(ml_type, model_path, backend, precision=precision)
+
+            return self._models[key]
+
+
+def object_detection_on_array(
+        model,
+        label,
+        image,
+        profile,
+        image_filename,
+        predictions_dir,
+        cache=None,
+        model_key=None,
+        timings=None
+):
+    """Runs object detection on a single tile and stores bounding boxes into a text file.
+
+    Parameters
+    ----------
+    model
+        Selected AITLAS ML model or inference backend (see load_backend()).
+    label : str
+        One of the allowed classes (barrow, enclosure, ringfort, AO).
+    image : np.ndarray
+        Tile array (bands, rows, cols).
+    profile : dict
+        Rasterio profile of the tile, the crs and transform are used for georeferencing the bounding boxes.
+    image_filename : str
+        File name of the tile, used for naming the output file.
+    predictions_dir : str or pathlib.Path()
+        Directory where the text file is saved.
+    cache : InferenceCache
+        Optional - results are read from cache if the same tile was already processed with the same model.
+    model_key : str
+        Key of the model (see model_cache_key()), required when cache is used.
+    timings : dict
+        Optional - filled with seconds of inference ("infer_s", 0 for cached results) and of writing ("write_s").
+    """
+    # The following are required to construct vector from txt
+    epsg = profile["crs"].to_epsg()
+    res = profile["transform"].a
+    x_min = profile["transform"].c
+    y_max = profile["transform"].f
+
+    t0 = time.perf_counter()
+    cached = None
+    if cache is not None:
+        key = cache.key(image, model_key)
+        cached = cache.get(key)
+    if cached is None:
+        boxes, scores = as_backend(model).detect(image)
+        if cache is not None:
+            cache.put(key, boxes=boxes, scores=scores)
+    else:
+        boxes, scores = cached["boxes"], cached["scores"]
+
+    predictions_single_patch_str = ""
+    for box, score in zip(boxes, scores):
         predictions_single_patch_str += (
             f'{round(box[0])} '
             f'{round(box[1])} '
@@ -57,96 +1013,394 @@ def make_predictions_on_single_patch_store_preds_single_class(
             f'{epsg} {res} {x_min} {y_max}'
             f'\n'
         )
+    t1 = time.perf_counter()
+
     filepath = os.path.join(predictions_dir, f"{os.path.splitext(image_filename)[0]}_{label}_bounding_boxes.txt")
     file = open(filepath, "w")
     file.write(predictions_single_patch_str)
     file.close()
 
+    if timings is not None:
+        timings.update(infer_s=t1 - t0, write_s=time.perf_counter() - t1, cached=cached is not None)
+
 
-def make_predictions_on_patches_object_detection(model, label, patches_folder, predictions_dir=None):
+def segmentation_on_array(
+        model,
+        label,
+        image,
+        profile,
+        image_filename,
+        predictions_dir,
+        cache=None,
+        model_key=None,
+        timings=None
+):
+    """Runs semantic segmentation on a single tile and stores the probability mask (GeoTIFF).
+
+    Parameters
+    ----------
+    model
+        Selected AITLAS ML model or inference backend (see load_backend()).
+    label : str
+        One of the allowed classes (barrow, enclosure, ringfort, AO).
+    image : np.ndarray
+        Tile array (bands, rows, cols).
+    profile : dict
+        Rasterio profile of the tile, used for saving the probability mask.
+    image_filename : str
+        File name of the tile, used for naming the output file.
+    predictions_dir : str or pathlib.Path()
+        Directory where the probability mask is saved.
+    cache : InferenceCache
+        Optional - results are read from cache if the same tile was already processed with the same model.
+    model_key : str
+        Key of the model (see model_cache_key()), required when cache is used.
+    timings : dict
+        Optional - filled with seconds of inference ("infer_s", 0 for cached results) and of writing ("write_s").
+    """
+    t0 = time.perf_counter()
+    cached = None
+    if cache is not None:
+        key = cache.key(image, model_key)
+        cached = cache.get(key)
+    if cached is None:
+        p = as_backend(model).segment(image)
+        if cache is not None:
+            cache.put(key, probs=p)
+    else:
+        p = cached["probs"]
+
+    t1 = time.perf_counter()
+
+    out_profile = profile.copy()
+    out_profile.update(count=p.shape[0])
+    file_stem = os.path.splitext(image_filename)[0]
+    out_path = os.path.join(predictions_dir, f"{file_stem}_{label}_segmentation_mask_probs.tif")
+    with rasterio.open(out_path, "w", **out_profile) as dst:
+        dst.write(p)
+
+    if timings is not None:
+        timings.update(infer_s=t1 - t0, write_s=time.perf_counter() - t1, cached=cached is not None)
+
+
+def make_predictions_on_patches_object_detection(
+        model,
+        label,
+        patches_folder,
+        predictions_dir=None,
+        skip_rules=None,
+        screener=None,
+        cache=None,
+        model_key=None,
+        shard=None,
+        metrics=None
+):
     """Generates predictions on patches (the model performs binary object detection).
 
     Parameters
     ----------
     model
-        Selected AITLAS ML model.
+        Selected AITLAS ML model or inference backend (see load_backend()).
     label : str
         One of the allowed classes (barrow, enclosure, ringfort, AO).
-    patches_folder : str or pathlib.Path()
-        Path to folder containing images for inference.
+    patches_folder : str or pathlib.Path() or VirtualTiles
+        Path to folder containing images for inference or tiles read directly from the source raster.
     predictions_dir : str or pathlib.Path()
         Optional - user can specify a custom folder. Otherwise, a folder called "predictions_segmentation_{label}" is
         created.
+    skip_rules : dict
+        Optional - tiles matching any of the rules (see DEFAULT_SKIP_RULES) are skipped, without running the model.
+    screener : screener.TileScreener
+        Optional - tiles rejected by the screener (cascade stage) are skipped, without running the model.
+    cache : InferenceCache
+        Optional - cache of results of single tiles.
+    model_key : str
+        Key of the model (see model_cache_key()), required when cache is used.
+    shard : tuple
+        Optional - (index, number of shards), only every n-th tile is processed (see predict_in_workers()).
+    metrics : metrics.Metrics
+        Optional - time of reading, inference and writing of every tile is recorded (stage "inference").
 
     Returns
     -------
     str
         Path to directory with predictions.
     """
-    patches_folder = Path(patches_folder)
+    tiles = get_tile_source(patches_folder)
     # If predictions_dir is not given, results are saved into a default folder
     if predictions_dir is None:
-        predictions_dir = patches_folder.parent / f"predictions_object_detection_{label}"
+        predictions_dir = tiles.parent_dir / f"predictions_object_detection_{label}"
     else:
         predictions_dir = Path(predictions_dir)
     predictions_dir.mkdir(parents=True, exist_ok=True)
 
     logging.debug("Generating predictions:")
-    for file in os.listdir(patches_folder):
-        if file.endswith(".tif"):
-            logging.debug(">>> ", file)
-            image_path = os.path.join(patches_folder, file)
-            image_filename = file
-            make_predictions_on_single_patch_store_preds_single_class(
-                model,
-                label,
-                image_path,
-                image_filename,
-                str(predictions_dir)
+    t_read = time.time()
+    for image_filename, image, profile in tiles.iter_tiles(skip_rules, screener, shard):
+        logging.debug(">>> ", image_filename)
+        read_s = time.time() - t_read
+        timings = {} if metrics is not None else None
+        object_detection_on_array(
+            model,
+            label,
+            image,
+            profile,
+            image_filename,
+            str(predictions_dir),
+            cache,
+            model_key,
+            timings
+        )
+        if metrics is not None:
+            metrics.tile(
+                "inference", t_read, label=label, tile=image_filename, read_s=read_s, read_bytes=image.nbytes, **timings
             )
+        t_read = time.time()
+    if tiles.skipped:
+        logging.info("Skipped %d of %d tiles (no valid data or flat terrain)", len(tiles.skipped), len(tiles))
+    if tiles.screened:
+        logging.info("Screener rejected %d of %d tiles", len(tiles.screened), len(tiles))
+    if metrics is not None:
+        metrics.add("inference", skipped=len(tiles.skipped), screened=len(tiles.screened))
 
     return str(predictions_dir)
 
 
-def make_predictions_on_patches_segmentation(model, label, patches_folder, predictions_dir=None):
+def make_predictions_on_patches_segmentation(
+        model,
+        label,
+        patches_folder,
+        predictions_dir=None,
+        skip_rules=None,
+        screener=None,
+        cache=None,
+        model_key=None,
+        shard=None,
+        metrics=None
+):
     """Generates predictions on patches (the model performs binary semantic segmentation).
 
     Parameters
     ----------
     model
-        Selected AITLAS ML model.
+        Selected AITLAS ML model or inference backend (see load_backend()).
     label : str
         One of the allowed classes (barrow, enclosure, ringfort, AO).
-    patches_folder : str or pathlib.Path()
-        Path to folder containing images for inference.
+    patches_folder : str or pathlib.Path() or VirtualTiles
+        Path to folder containing images for inference or tiles read directly from the source raster.
     predictions_dir : str or pathlib.Path()
         Optional - user can specify a custom folder. Otherwise, a folder called "predictions_segmentation_{label}" is
         created.
+    skip_rules : dict
+        Optional - tiles matching any of the rules (see DEFAULT_SKIP_RULES) are skipped, without running the model.
+    screener : screener.TileScreener
+        Optional - tiles rejected by the screener (cascade stage) are skipped, without running the model.
+    cache : InferenceCache
+        Optional - cache of results of single tiles.
+    model_key : str
+        Key of the model (see model_cache_key()), required when cache is used.
+    shard : tuple
+        Optional - (index, number of shards), only every n-th tile is processed (see predict_in_workers()).
+    metrics : metrics.Metrics
+        Optional - time of reading, inference and writing of every tile is recorded (stage "inference").
 
     Returns
     -------
     str
         Path to directory with predictions.
     """
-    patches_folder = Path(patches_folder)
+    tiles = get_tile_source(patches_folder)
     # If predictions_dir is not given, results are saved into a default folder
     if predictions_dir is None:
-        predictions_dir = patches_folder.parent / f"predictions_segmentation_{label}"
+        predictions_dir = tiles.parent_dir / f"predictions_segmentation_{label}"
     else:
         predictions_dir = Path(predictions_dir)
     predictions_dir.mkdir(parents=True, exist_ok=True)
 
     logging.debug("Generating predictions:")
-    for file in os.listdir(patches_folder):
-        logging.debug(">>> ", file)
-        if file.endswith(".tif"):
-            image_path = os.path.join(patches_folder, file)
-            model.predict_masks_tiff_probs_binary(
-                image_path=image_path,
-                label=label,
-                data_transforms=Transpose(),
-                predictions_dir=str(predictions_dir)
+    t_read = time.time()
+    for image_filename, image, profile in tiles.iter_tiles(skip_rules, screener, shard):
+        logging.debug(">>> ", image_filename)
+        read_s = time.time() - t_read
+        timings = {} if metrics is not None else None
+        segmentation_on_array(
+            model,
+            label,
+            image,
+            profile,
+            image_filename,
+            str(predictions_dir),
+            cache,
+            model_key,
+            timings
+        )
+        if metrics is not None:
+            metrics.tile(
+                "inference", t_read, label=label, tile=image_filename, read_s=read_s, read_bytes=image.nbytes, **timings
             )
+        t_read = time.time()
+    if tiles.skipped:
+        logging.info("Skipped %d of %d tiles (no valid data or flat terrain)", len(tiles.skipped), len(tiles))
+    if tiles.screened:
+        logging.info("Screener rejected %d of %d tiles", len(tiles.screened), len(tiles))
+    if metrics is not None:
+        metrics.add("inference", skipped=len(tiles.skipped), screened=len(tiles.screened))
+
+    return str(predictions_dir)
+
+
+def inference_worker_split(nr_workers, nr_cpus=None):
+    """Number of torch threads per inference worker, so that workers x threads equals the available cores."""
+    nr_cpus = nr_cpus or os.cpu_count() or 1
+
+    return max(nr_cpus // max(nr_workers, 1), 1)
+
+
+def _predict_shard(args):
+    """Runs inference on one shard of tiles in a worker process (see predict_in_workers()).
+
+    With metrics, events of tiles (and of loading the model) are recorded in the worker and returned with the counts,
+    the whole shard is measured with timed_call() and, with profiling, profiled with profiled_call() (the same as
+    tasks of executors).
+    """
+    (ml_type, label, model_path, tiles, predictions_dir, shard, threads, backend, precision,
+     skip_rules, screener, cache, model_key, submitted, with_metrics, with_profile) = args
+    torch.set_num_threads(threads)
+    # One thread for inter-op parallelism, cores are already split between workers
+    torch.set_num_interop_threads(1)
+
+    shard_metrics = Metrics() if with_metrics else None
+    t_load = time.perf_counter()
+    model = load_backend(ml_type, model_path, backend, threads=threads, precision=precision)
+    if shard_metrics is not None:
+        shard_metrics.emit(
+            "model", label=label, backend=backend, load_s=time.perf_counter() - t_load, pid=os.getpid(), shard=shard[0]
+        )
+    tiles = get_tile_source(tiles)
+    if cache is not None:
+        # Worker has a copy of the cache, only its own counters are returned
+        cache.hits, cache.misses, cache.evicted = 0, 0, 0
+    if ml_type == "object detection":
+        make_predictions = make_predictions_on_patches_object_detection
+    else:
+        make_predictions = make_predictions_on_patches_segmentation
+
+    task = make_predictions
+    task_args = (model, label, tiles, predictions_dir, skip_rules, screener, cache, model_key, shard, shard_metrics)
+    if with_profile:
+        task, task_args = profiled_call, (task, task_args)
+    if shard_metrics is not None:
+        task, task_args = timed_call, (task, task_args, submitted)
+    result = task(*task_args)
+
+    counts = {"skipped": len(tiles.skipped), "screened": len(tiles.screened)}
+    if shard_metrics is not None:
+        result, worker_metrics = result
+        shard_metrics.emit("worker", stage="inference", label=label, shard=shard[0], **worker_metrics)
+        counts["records"] = shard_metrics.records
+    if with_profile:
+        _, counts["stats"] = result
+    if cache is not None:
+        counts.update(hits=cache.hits, misses=cache.misses, evicted=cache.evicted)
+
+    return counts
+
+
+def predict_in_workers(
+        ml_type,
+        label,
+        model_path,
+        patches_folder,
+        nr_workers,
+        threads=None,
+        predictions_dir=None,
+        backend="torch",
+        precision="fp32",
+        skip_rules=None,
+        screener=None,
+        cache=None,
+        model_key=None,
+        metrics=None
+):
+    """Data-parallel inference, tiles are split into shards and each shard is processed by a worker process with its
+    own model.
+
+    Parameters
+    ----------
+    ml_type : str
+        "object detection" or "segmentation".
+    label : str
+        One of the allowed classes (barrow, enclosure, ringfort, AO).
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file), each worker loads the model with load_backend().
+    patches_folder : str or pathlib.Path() or TileFolder or VirtualTiles
+        Tiles for inference.
+    nr_workers : int
+        Number of worker processes (shards).
+    threads : int
+        Number of torch threads per worker, by default cores are split evenly between workers (see
+        inference_worker_split()).
+    predictions_dir : str or pathlib.Path()
+        Optional - custom folder for predictions, otherwise the default folder of make_predictions_on_patches_*() is
+        used. All workers write to the same folder.
+    backend : str
+        Inference backend (see load_backend()).
+    precision : str
+        "fp32" or "bf16", torch backend only.
+    skip_rules : dict
+        Optional - tiles matching any of the rules (see DEFAULT_SKIP_RULES) are skipped.
+    screener : screener.TileScreener
+        Optional - tiles rejected by the screener are skipped.
+    cache : InferenceCache
+        Optional - cache of results of single tiles (counters of workers are added to this object).
+    model_key : str
+        Key of the model (see model_cache_key()), required when cache is used.
+    metrics : metrics.Metrics
+        Optional - tiles (stage "inference"), loading of models and shards of workers are recorded in the workers and
+        added to metrics. If metrics.profiler is set, shards are also profiled.
+
+    Returns
+    -------
+    str
+        Path to directory with predictions.
+    """
+    tiles = get_tile_source(patches_folder)
+    threads = threads or inference_worker_split(nr_workers)
+    profiler = getattr(metrics, "profiler", None)
+    if predictions_dir is None:
+        kind = "object_detection" if ml_type == "object detection" else "segmentation"
+        predictions_dir = tiles.parent_dir / f"predictions_{kind}_{label}"
+    predictions_dir = Path(predictions_dir)
+    predictions_dir.mkdir(parents=True, exist_ok=True)
+
+    submitted = time.time()
+    shards = [
+        (ml_type, label, model_path, tiles, predictions_dir, (i, nr_workers), threads, backend, precision,
+         skip_rules, screener, cache, model_key, submitted, metrics is not None, profiler is not None)
+        for i in range(nr_workers)
+    ]
+    # Workers are spawned (not forked), forking a process with initialised torch thread pools can deadlock
+    with mp.get_context("spawn").Pool(nr_workers) as p:
+        counts = p.map(_predict_shard, shards)
+
+    skipped = sum(c["skipped"] for c in counts)
+    screened = sum(c["screened"] for c in counts)
+    for c in counts:
+        # Events of workers keep their own time, tiles are added to the running stage
+        for record in c.get("records", []):
+            metrics.emit(record["event"], **{key: value for key, value in record.items() if key != "event"})
+        if profiler is not None:
+            profiler.add("inference", c.get("stats"))
+    if metrics is not None:
+        metrics.add("inference", skipped=skipped, screened=screened)
+    if skipped:
+        logging.info("Skipped %d of %d tiles (no valid data or flat terrain)", skipped, len(tiles))
+    if screened:
+        logging.info("Screener rejected %d of %d tiles", screened, len(tiles))
+    if cache is not None:
+        cache.hits += sum(c["hits"] for c in counts)
+        cache.misses += sum(c["misses"] for c in counts)
+        cache.evicted += sum(c["evicted"] for c in counts)
 
     return str(predictions_dir)
 
@@ -263,11 +1517,14 @@ class Logger:
 
     def log_vis_results(self, vis_dir, vrt_path, save_vis, processing_time):
         """Adds results of visualization module to log file"""
-        vis_dir = Path(vis_dir)
-        vrt_path = Path(vrt_path)
+        # Virtual tiles (see VirtualTiles) are not saved
+        save_vis = save_vis and vis_dir is not None
+        if save_vis:
+            vis_dir = Path(vis_dir)
+            vrt_path = Path(vrt_path)
 
-        # Count number of created tiles
-        tiles_count = len(list(vis_dir.glob('*.tif')))
+            # Count number of created tiles
+            tiles_count = len(list(vis_dir.glob('*.tif')))
 
         # PROCESSING TIME IS IN SECONDS
         if processing_time >= 60:
@@ -372,7 +1629,8 @@ class Logger:
     def log_inference_results(self, vector_path, processing_time, list_to_raw_files, min_area, roundness=None):
         """Adds results of inference to the log file"""
 
-        vector_path = Path(vector_path)
+        # Shards without tiles don't write a vector file
+        vector_path = Path(vector_path) if vector_path else "none (no tiles in this shard)"
 
         # Count number of created tiles
         log_raw = ""
@@ -443,6 +1701,23 @@ class ADAFInput:
         self.out_dir = None
         self.tiles_to_vrt = None
         self.dem_path = None
+        self.save_tiles = None
+        self.vis_engine = None
+        self.skip_rules = None
+        self.screener_path = None
+        self.cache_dir = None
+        self.cache_size_mb = 2048
+        self.backend = None
+        self.precision = None
+        self.inference_workers = None
+        self.inference_threads = None
+        self.cpus = None
+        self.memory_mb = None
+        self.inference_server = None
+        self.executor = None
+        self.shard = None
+        self.trace = None
+        self.profile = None
 
     # def __getattr__(self, attr):
     #     category, key, value = attr.split('.')
@@ -460,7 +1735,13 @@ class ADAFInput:
                 logging.debug(f"Invalid parameter: {key}")
 
 
-def clip_tile(bounds, out_file_path, src_path, out_nodata=0):
+def tile_file_name(bounds, src_stem):
+    """File name of a tile of image_tiling() and VirtualTiles, named by its position in the grid (lower left corner),
+    so tiles of different shards of the same raster never have the same name."""
+    return f"tile_{bounds[0]:.0f}_{bounds[1]:.0f}_{src_stem}.tif"
+
+
+def clip_tile(bounds, out_file_path, src_path, out_nodata=0, dtype=DTYPE, with_stats=False):
     """Clips a single tile from a source raster and saves it to disk (GeoTIFF).
 
     Parameters
@@ -473,55 +1754,286 @@ def clip_tile(bounds, out_file_path, src_path, out_nodata=0):
         Path of source raster, from which we are cutting out the tile.
     out_nodata : float
         Value of nodata pixels for the output tile.
+    dtype : str
+        Data type of the output tile, None keeps data type of the source raster.
+    with_stats : bool
+        Also return statistics of the tile (see tile_statistics()).
 
     Returns
     -------
-        Path to output file.
+        Path to output file (and dictionary with tile statistics if with_stats is True).
     """
     with rasterio.open(src_path) as src:
-        orig_window = from_bounds(*bounds, src.transform)
+        out = clip_tile_from_dataset(src, bounds, out_file_path, out_nodata, dtype, with_stats)
 
-        out_image = src.read(window=orig_window, boundless=True)
-        out_transform = src.window_transform(orig_window)
-        out_profile = src.profile.copy()
-        src_nodata = src.nodata
+    return out
 
-    # Fill NaNs
-    if np.isnan(src_nodata):
-        out_image[np.isnan(out_image)] = out_nodata
-    else:
-        out_image[out_image == src_nodata] = out_nodata
+
+def clip_tile_from_dataset(src, bounds, out_file_path, out_nodata=0, dtype=DTYPE, with_stats=False):
+    """Same as clip_tile(), but reads from an already opened rasterio dataset.
+
+    Parameters
+    ----------
+    src : rasterio.io.DatasetReader
+        Opened source raster, from which we are cutting out the tile.
+    bounds : list
+        Geographical extents of the tile ["minx", "miny", "maxx", "maxy"].
+    out_file_path : str or pathlib.Path()
+        Path of output file.
+    out_nodata : float
+        Value of nodata pixels for the output tile.
+    dtype : str
+        Data type of the output tile, None keeps data type of the source raster.
+    with_stats : bool
+        Also return statistics of the tile (see tile_statistics()).
+
+    Returns
+    -------
+        Path to output file (and dictionary with tile statistics if with_stats is True).
+    """
+    out_image, out_profile = read_tile_from_dataset(src, bounds, out_nodata, dtype)
+
+    with rasterio.open(out_file_path, "w", **out_profile, predictor=3) as dst:
+        dst.write(out_image)
+
+    if with_stats:
+        stats = tile_statistics(out_image)
+        stats["file"] = Path(out_file_path).name
+        return out_file_path, stats
+
+    return out_file_path
+
+
+def read_tile_from_dataset(src, bounds, out_nodata=0, dtype=DTYPE):
+    """Reads a single tile from an opened raster and clamps it the same way as clip_tile(), without saving it.
+
+    Parameters
+    ----------
+    src : rasterio.io.DatasetReader
+        Opened source raster, from which we are cutting out the tile.
+    bounds : list
+        Geographical extents of the tile ["minx", "miny", "maxx", "maxy"].
+    out_nodata : float
+        Value of nodata pixels for the output tile.
+    dtype : str
+        Data type of the output tile, None keeps data type of the source raster.
+
+    Returns
+    -------
+    (np.ndarray, dict)
+        Tile array (bands, rows, cols) and GeoTIFF profile of the tile.
+    """
+    orig_window = from_bounds(*bounds, src.transform)
+
+    out_image = src.read(window=orig_window, boundless=True, out_dtype=dtype)
+    out_transform = src.window_transform(orig_window)
+    out_profile = src.profile.copy()
+    src_nodata = src.nodata
+
+    # Fill NaNs (in place)
+    fill_nodata_inplace(out_image, src_nodata, out_nodata)
 
     # Assign correct nodata to metadata and clip to min/max values
     if out_nodata == 0:
         # This is used for all validations
         meta_nd = None
-        out_image[out_image > 1] = 1
-        out_image[out_image < 0] = 0
+        clamp_inplace(out_image, 0, 1)
     else:
         # This is used for DEM
         meta_nd = out_nodata
 
-    # Update metadata and save geotiff
+    # Update metadata
     out_profile.update(
         driver="GTiff",
         compress="lzw",
+        dtype=out_image.dtype,
         width=out_image.shape[-1],
         height=out_image.shape[-2],
         transform=out_transform,
         nodata=meta_nd
     )
-    with rasterio.open(out_file_path, "w", **out_profile, predictor=3) as dst:
-        dst.write(out_image)
 
-    return out_file_path
+    return out_image, out_profile
+
+
+class TileFolder:
+    """Tiles for inference, stored as GeoTIFF files in a folder.
+
+    Iterating over the object yields (file name, array, profile) for every tile. If the folder contains statistics of
+    tiles (TILE_STATS_FILE, saved by image_tiling() and adaf_vis.tiled_processing()), tiles can be skipped without
+    reading them.
+    """
+    def __init__(self, tiles_dir):
+        self.tiles_dir = Path(tiles_dir)
+        # Default location for predictions
+        self.parent_dir = self.tiles_dir.parent
+        # Statistics of tiles, either from file or computed when tiles are read
+        stats_path = self.tiles_dir / TILE_STATS_FILE
+        self.stats = load_tile_statistics(stats_path) if stats_path.is_file() else {}
+        self.skipped = []
+        self.screened = []
+
+    def __len__(self):
+        return len(self.file_names())
+
+    def __iter__(self):
+        return self.iter_tiles()
+
+    def iter_tiles(self, skip_rules=None, screener=None, shard=None):
+        """Yields (file name, array, profile) for tiles that don't match skip rules and are kept by the screener
+        (skipped tiles are listed in self.skipped and self.screened). Shard (index, number of shards) limits tiles
+        to every n-th tile, starting at index."""
+        self.skipped = []
+        self.screened = []
+        for i, file in enumerate(self.file_names()):
+            if shard is not None and i % shard[1] != shard[0]:
+                continue
+            if file in self.stats and skip_tile(self.stats[file], skip_rules):
+                self.skipped.append(file)
+                continue
+
+            with rasterio.open(self.tiles_dir / file) as src:
+                image = src.read()
+                profile = src.meta.copy()
+
+            if file not in self.stats:
+                self.stats[file] = tile_statistics(image)
+                if skip_tile(self.stats[file], skip_rules):
+                    self.skipped.append(file)
+                    continue
+
+            if screener is not None and not screener.keep(image):
+                self.screened.append(file)
+                continue
+
+            yield file, image, profile
+
+    def file_names(self):
+        """Sorted list of tile file names."""
+        return sorted(file for file in os.listdir(self.tiles_dir) if file.endswith(".tif"))
+
+
+class VirtualTiles:
+    """Tiles for inference, read on the fly from the source raster (visualisation).
+
+    Windows are cut out of the source raster and clamped the same way as in clip_tile(), but nothing is written to
+    disk. Iterating over the object yields (tile name, array, profile) for every tile, tile names are the same as the
+    file names created by image_tiling().
+    """
+    def __init__(self, source_path, ext_list, save_dir=None):
+        self.source_path = Path(source_path)
+        self.extents = ext_list[["minx", "miny", "maxx", "maxy"]].values.tolist()
+        # Default location for predictions and for materialised tiles
+        self.parent_dir = Path(save_dir) if save_dir else self.source_path.parent
+        self.ext_list = ext_list
+        # Statistics of tiles, computed when tiles are read
+        self.stats = {}
+        self.skipped = []
+        self.screened = []
+
+    def __len__(self):
+        return len(self.extents)
+
+    def __iter__(self):
+        return self.iter_tiles()
+
+    def iter_tiles(self, skip_rules=None, screener=None, shard=None):
+        """Yields (tile name, array, profile) for tiles that don't match skip rules and are kept by the screener
+        (skipped tiles are listed in self.skipped and self.screened). Shard (index, number of shards) limits tiles
+        to every n-th tile, starting at index."""
+        self.skipped = []
+        self.screened = []
+        with rasterio.open(self.source_path) as src:
+            for i, bounds in enumerate(self.extents):
+                if shard is not None and i % shard[1] != shard[0]:
+                    continue
+                name = self.tile_name(i)
+                if name in self.stats and skip_tile(self.stats[name], skip_rules):
+                    self.skipped.append(name)
+                    continue
+
+                image, profile = read_tile_from_dataset(src, bounds, out_nodata=0)
+
+                if name not in self.stats:
+                    self.stats[name] = tile_statistics(image)
+                    if skip_tile(self.stats[name], skip_rules):
+                        self.skipped.append(name)
+                        continue
+
+                if screener is not None and not screener.keep(image):
+                    self.screened.append(name)
+                    continue
+
+                yield name, image, profile
+
+    def tile_name(self, i):
+        """File name of i-th tile (same as in image_tiling())."""
+        return tile_file_name(self.extents[i], self.source_path.stem)
+
+    def materialise(self, nr_processes=1, engine="thread"):
+        """Saves the tiles as GeoTIFF files into "tiled_image" folder (see image_tiling)."""
+        return image_tiling(
+            source_path=self.source_path,
+            ext_list=self.ext_list,
+            nr_processes=nr_processes,
+            save_dir=self.parent_dir,
+            engine=engine
+        )
+
+
+def get_tile_source(patches_folder):
+    """Returns tiles for inference, either an existing tile source or a TileFolder for a path to directory."""
+    if isinstance(patches_folder, (TileFolder, VirtualTiles)):
+        return patches_folder
+    else:
+        return TileFolder(patches_folder)
+
+
+class ThreadDatasets:
+    """Keeps one opened rasterio dataset per thread.
+
+    Rasterio dataset handles can't be shared between threads, but opening the source raster (VRT) for every tile is
+    expensive. Each worker thread opens the source once and reuses the handle for all of its tiles.
+    """
+    def __init__(self, src_path):
+        self.src_path = src_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = []
+
+    def get(self):
+        """Returns the dataset handle of the calling thread (opens it on first use)."""
+        src = getattr(self._local, "src", None)
+        if src is None:
+            src = rasterio.open(self.src_path)
+            self._local.src = src
+            with self._lock:
+                self._opened.append(src)
+
+        return src
+
+    def close(self):
+        """Closes datasets opened by all the threads."""
+        with self._lock:
+            for src in self._opened:
+                src.close()
+            self._opened = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 def image_tiling(
         source_path,
         ext_list,
         nr_processes=7,
-        save_dir=None
+        save_dir=None,
+        engine="process",
+        executor=None,
+        metrics=None
 ):
     """Multiprocessing for clip_tile().
 
@@ -532,9 +2044,20 @@ def image_tiling(
     ext_list : gpd.GeoDataFrame
         A list of geographical extents of all the tiles in ["minx", "miny", "maxx", "maxy"] format.
     nr_processes : int
-        Number of processes for multiprocessing.
+        Number of processes for multiprocessing (number of threads if engine is "thread").
     save_dir : pathlib.Path()
         Path to directory containing output files.
+    engine : str
+        How tiles are cut out. Can be:
+        "process" - multiprocessing pool (serial run if there are 40 tiles or fewer),
+        "thread" - thread pool, every thread keeps one opened dataset (GDAL releases the GIL while reading and
+        compressing, and there is no process spawning or pickling of arguments),
+        "serial" - all tiles in the main process.
+    executor : executors.Executor or str
+        Optional - executor for the "process" engine (an existing one is not closed) or its kind (see
+        executors.get_executor()), by default a multiprocessing pool.
+    metrics : metrics.Metrics
+        Optional - every tile is recorded (stage "tiling").
 
     Returns
     -------
@@ -557,30 +2080,50 @@ def image_tiling(
     # Prepare data
     input_process_list = []
     ext_list1 = ext_list[["minx", "miny", "maxx", "maxy"]].values.tolist()
-    for i, input_dem_extents in enumerate(ext_list1):
+    for input_dem_extents in ext_list1:
         # Prepare file name for each tile
-        out_name = f"tile_{i:06}_{src_stem}.tif"
+        out_name = tile_file_name(input_dem_extents, src_stem)
         out_path = patch_dir / out_name
 
-        # Append variable parameters
-        to_append = [input_dem_extents, out_path, source_path, 0]
+        # Append variable parameters (nodata, data type, return statistics)
+        to_append = [input_dem_extents, out_path, source_path, 0, DTYPE, True]
         # Change list to tuple and append
         input_process_list.append(tuple(to_append))
 
     # Create rasters/files and save them
-    if nr_processes > 1 and len(input_process_list) > 40:
-        all_tiles_paths = []
-        with mp.Pool(nr_processes) as p:
-            realist = [p.apply_async(clip_tile, r) for r in input_process_list]
-            for result in realist:
-                all_tiles_paths.append(result.get())
+    if engine == "thread":
+        with ThreadDatasets(source_path) as datasets:
+            def clip_one(bounds, out_file_path, _, out_nodata, dtype, with_stats):
+                return clip_tile_from_dataset(datasets.get(), bounds, out_file_path, out_nodata, dtype, with_stats)
+
+            with get_executor("threads", nr_processes) as threads:
+                results = list(threads.map(clip_one, input_process_list, "tiling", metrics=metrics))
+    elif engine == "process" and nr_processes > 1 and len(input_process_list) > 40:
+        # Number of workers is also limited by available memory (one tile per worker)
+        with rasterio.open(source_path) as src:
+            window = from_bounds(*ext_list1[0], src.transform)
+        tile_px = int(round(max(window.height, window.width)))
+        nr_processes = workers_for_memory(nr_processes, vis_worker_mb(tile_px, dtype=DTYPE, copies=3))
+        with executor_scope(executor or "processes", nr_processes) as ex:
+            results = list(ex.map(clip_tile, input_process_list, "tiling", metrics=metrics))
+    elif engine in ("process", "serial"):
+        with get_executor("serial") as ex:
+            results = list(ex.map(clip_tile, input_process_list, "tiling", metrics=metrics))
     else:
-        all_tiles_paths = [
-            clip_tile(*i) for i in input_process_list
-        ]
+        raise ValueError(f"Wrong engine '{engine}': choose 'process', 'thread' or 'serial'!")
+
+    all_tiles_paths = [result[0] for result in results]
+
+    # Statistics index of tiles, used for skipping tiles during inference
+    stats_path = save_tile_statistics([result[1] for result in results], patch_dir / TILE_STATS_FILE)
 
     # Build VRTs
     vrt_name = src_stem + "_tiled.vrt"
     vrt_path = build_vrt(patch_dir, vrt_name)
 
-    return {"output_directory": patch_dir, "files_list": all_tiles_paths, "vrt_path": vrt_path}
+    return {
+        "output_directory": patch_dir,
+        "files_list": all_tiles_paths,
+        "vrt_path": vrt_path,
+        "stats_path": stats_path
+    }
@@ -7,10 +7,10 @@ Creates visualisations from DEM and stores them as VRT.
 
 """
 import logging
-import multiprocessing as mp
 import os
 import time
 from math import ceil
+from multiprocessing import parent_process, resource_tracker, shared_memory
 from pathlib import Path
 
 import numpy as np
@@ -18,17 +18,30 @@ import rasterio
 import rvt.blend
 import rvt.default
 import rvt.vis
-from rasterio.windows import from_bounds
-from rvt.blend_func import normalize_image
+from rasterio.windows import Window, from_bounds
 
-from adaf.adaf_utils import build_vrt
+from adaf.adaf_utils import (
+    DTYPE,
+    TILE_STATS_FILE,
+    build_vrt,
+    fill_nodata_inplace,
+    normalize_inplace,
+    save_tile_statistics,
+    tile_statistics
+)
+from adaf.executors import Executor, executor_scope, get_executor
+from adaf.resources import vis_worker_mb, workers_for_memory
 
 
 def tiled_processing(
         input_raster_path,
         extents_list,
         nr_processes=7,
-        save_dir=None
+        save_dir=None,
+        engine="tiles",
+        dtype=DTYPE,
+        executor="processes",
+        metrics=None
 ):
     """Tiled multiprocessing for RVT for larger rasters.
 
@@ -42,6 +55,20 @@ def tiled_processing(
         Number of processes for multiprocessing.
     save_dir : str or pathlib.Path()
         Path to directory to which results are saved.
+    engine : str
+        Can be:
+        "tiles" - every worker reads its own buffered tile from the raster,
+        "strips" - the main process reads one row of tiles (plus buffer) at a time into shared memory, workers compute
+        visualisations on views of the shared array (see strip_processing),
+        "sliding" - DEM is processed in horizontal strips in the main process, buffer rows are reused from the previous
+        strip and tiles are written by a pool of threads (see sliding_processing).
+    dtype : str
+        Data type in which DEM is read and visualisations are computed.
+    executor : executors.Executor or str
+        Executor for the "tiles" and "strips" engines, an existing one (not closed, e.g. shared by all DEMs of a batch)
+        or kind of a new one with nr_processes workers (see executors.get_executor()).
+    metrics : metrics.Metrics
+        Optional - every tile of the "tiles" and "strips" engines is recorded (stage "visualisations").
 
     Returns
     -------
@@ -50,6 +77,7 @@ def tiled_processing(
         "output_directory" - path to the directory with results,
         "files_list" - list of files (full file paths),
         "vrt_path" - path to VRT file of the results,
+        "stats_path" - path to CSV file with statistics of tiles (see adaf_utils.tile_statistics),
         "processing_time" - time in seconds.
     """
     # Start timer
@@ -76,6 +104,83 @@ def tiled_processing(
         # If not specified, save results next to the input file
         low_level_dir = output_dir_path
 
+    # Number of workers is also limited by available memory (every worker holds one buffered tile)
+    tile_px = int(round((extents_list.maxx.iloc[0] - extents_list.minx.iloc[0]) / res))
+    worker_mb = vis_worker_mb(tile_px, default_1.slrm_rad_cell, dtype)
+    max_processes = workers_for_memory(nr_processes, worker_mb)
+    if not isinstance(executor, Executor) and max_processes < nr_processes:
+        logging.info("Available memory limits visualisation to %d workers (%.0f MB each)", max_processes, worker_mb)
+        nr_processes = max_processes
+
+    if engine == "strips":
+        all_tiles_paths, tiles_stats = strip_processing(
+            input_raster_path,
+            extents_list,
+            default_1,
+            low_level_dir,
+            nr_processes,
+            dtype,
+            executor,
+            metrics
+        )
+    elif engine == "sliding":
+        all_tiles_paths, tiles_stats = sliding_processing(
+            input_raster_path,
+            extents_list,
+            default_1,
+            low_level_dir,
+            nr_processes,
+            dtype
+        )
+    elif engine != "tiles":
+        raise ValueError(f"Wrong engine '{engine}': choose 'tiles', 'strips' or 'sliding'!")
+    else:
+        all_tiles_paths, tiles_stats = _tiles_processing(
+            input_raster_path,
+            extents_list,
+            default_1,
+            low_level_dir,
+            nr_processes,
+            dtype,
+            executor,
+            metrics
+        )
+
+    # Build VRTs
+    # TODO: hardcoded for slrm, change if different vis will be available
+    #  FILE NAMING IS DONE HERE
+    ds_dir = low_level_dir / 'slrm'
+    vrt_name = Path(input_raster_path).stem + "_" + Path(ds_dir).name + ".vrt"
+    vrt_path = build_vrt(ds_dir, vrt_name)
+    logging.debug("  - Created:", vrt_path)
+
+    # Save statistics of tiles (used for skipping empty tiles during inference)
+    stats_path = save_tile_statistics(tiles_stats, ds_dir / TILE_STATS_FILE)
+
+    t1 = time.time() - t0
+    logging.debug(f"Done with computing low-level visualizations in {round(t1/60, ndigits=None)} min.")
+
+    return {
+        "output_directory": ds_dir,
+        "files_list": all_tiles_paths,
+        "vrt_path": vrt_path,
+        "stats_path": stats_path,
+        "processing_time": t1
+    }
+
+
+def _tiles_processing(
+        input_raster_path,
+        extents_list,
+        default_1,
+        low_level_dir,
+        nr_processes,
+        dtype=DTYPE,
+        executor="processes",
+        metrics=None
+):
+    """Runs process_one_tile() for every tile with the executor (existing one or kind of a new one, see
+    executors.get_executor()), tiles are recorded into metrics. Returns list of output paths and statistics of tiles."""
     # Prepare for multiprocessing
     const_params = [
         default_1,           # const 1
@@ -104,6 +209,7 @@ def tiled_processing(
         to_append.append(input_dem_extents)  # var 1
         to_append.append(out_name)  # var 2
         to_append.append(i)  # var 3
+        to_append.append(dtype)
         # Change list to tuple
         input_process_list.append(tuple(to_append))
 
@@ -114,16 +220,17 @@ def tiled_processing(
 
     # multiprocessing
     skipped_tiles = []
-    with mp.Pool(nr_processes) as p:
-        realist = [p.apply_async(process_one_tile, r) for r in input_process_list]
-        for result in realist:
-            pool_out = result.get()
+    tiles_stats = []
+    with executor_scope(executor, nr_processes) as ex:
+        # Tasks are submitted a few at a time (bounded memory), results are collected in order
+        for pool_out in ex.map(process_one_tile, input_process_list, "visualisations", metrics=metrics):
             # Check if tile was all NaN's (remove it from REFGRID!)
             if pool_out[0] == 1:
                 logging.debug("Skipped (tile_ID:", pool_out[1], ");", pool_out[2])
                 skipped_tiles.append(pool_out[1])
             else:
                 logging.debug("tile_ID:", pool_out[1], ";", pool_out[2])
+                tiles_stats.append(pool_out[3])
 
     # # Remove tiles from REFGRID if any (that was the case in Noise mapping)
     # if skipped_tiles:
@@ -131,21 +238,13 @@ def tiled_processing(
     #     refg_pth = list(output_dir_path.glob("*_refgrid*"))[0]  # Find path to "refgrid" file
     #     ext_list.to_file(refg_pth, driver="GPKG")
 
-    # Prepare list with all output tiles paths
-    all_tiles_paths = [pth[2].as_posix() for pth in input_process_list]
-
-    # Build VRTs
-    # TODO: hardcoded for slrm, change if different vis will be available
-    #  FILE NAMING IS DONE HERE
-    ds_dir = low_level_dir / 'slrm'
-    vrt_name = Path(input_raster_path).stem + "_" + Path(ds_dir).name + ".vrt"
-    vrt_path = build_vrt(ds_dir, vrt_name)
-    logging.debug("  - Created:", vrt_path)
-
-    t1 = time.time() - t0
-    logging.debug(f"Done with computing low-level visualizations in {round(t1/60, ndigits=None)} min.")
+    # Prepare list with all output tiles paths (skipped tiles are not saved)
+    all_tiles_paths = [
+        (low_level_dir / "slrm" / default_1.get_slrm_file_name(pth[4])).as_posix() for pth in input_process_list
+        if pth[5] not in skipped_tiles
+    ]
 
-    return {"output_directory": ds_dir, "files_list": all_tiles_paths, "vrt_path": vrt_path, "processing_time": t1}
+    return all_tiles_paths, tiles_stats
 
 
 # Function which is multiprocessing
@@ -155,7 +254,8 @@ def process_one_tile(
         main_save_dir,
         tile_extents,
         tile_name,
-        tile_id
+        tile_id,
+        dtype=DTYPE
 ):
     """Creates RVT visualization(s) for a single tile from a larger raster.
 
@@ -177,10 +277,12 @@ def process_one_tile(
         A file name to be used for this tile in format <minx>_<miny>_rvt.tif"
     tile_id : int
         ID of tile.
+    dtype : str
+        Data type in which DEM is read and visualisations are computed.
 
     Returns
     -------
-        0 if successful, 1 if error (all NaNs encountered)
+        0 if successful, 1 if error (all NaNs encountered), tile ID, message and statistics of the SLRM tile.
     """
     # We only have SLRM, but potentially other visualizations can be added
     buffer_dict = {
@@ -192,19 +294,19 @@ def process_one_tile(
     buffer = buffer_dict[max_buff]
 
     # Read array into RVT dictionary format
-    dict_arrays = get_tile_from_raster(source_raster_path, tile_extents, buffer)
+    dict_arrays = get_tile_from_raster(source_raster_path, tile_extents, buffer, dtype)
 
     # Add default path
     dict_arrays["default_path"] = tile_name
 
     # Change nodata value to np.nan, to avoid problems later
-    dict_arrays["array"][dict_arrays["array"] == dict_arrays["no_data"]] = np.nan
+    fill_nodata_inplace(dict_arrays["array"], dict_arrays["no_data"], np.nan)
     dict_arrays["no_data"] = np.nan
 
     # Then check, if output slice (w/o buffer) is all NaNs, then skip this tile if yes
-    if (dict_arrays["array"][buffer:-buffer, buffer:-buffer] == np.nan).all():
+    if np.isnan(dict_arrays["array"][buffer:-buffer, buffer:-buffer]).all():
         # If all NaNs encountered, output the tile ID
-        return 1, tile_id, f"Skipping, all NaNs in: {tile_name}"
+        return 1, tile_id, f"Skipping, all NaNs in: {tile_name}", None
 
     # --- START VISUALIZATION WITH RVT ---
 
@@ -220,15 +322,7 @@ def process_one_tile(
 
         # Run visualization
         if vis_type == "slrm":
-            slrm = default_1.get_slrm(sliced_arr)
-            out_slrm = normalize_image(
-                visualization="slrm",
-                image=slrm.squeeze(),
-                min_norm=-0.5,
-                max_norm=0.5,
-                normalization="value"
-            )
-            out_slrm[np.isnan(out_slrm)] = 0
+            out_slrm = compute_slrm(default_1, sliced_arr)
             vis_out = {
                 vis_type: out_slrm
             }
@@ -262,10 +356,486 @@ def process_one_tile(
             with rasterio.open(arr_save_path, "w", **out_profile) as dst:
                 dst.write(arr_out)
 
-    return 0, tile_id, f"Finished processing: {tile_name}"
+            if i == "slrm":
+                stats = tile_statistics(arr_out)
+                stats["file"] = Path(arr_save_path).name
+
+    return 0, tile_id, f"Finished processing: {tile_name}", stats
+
+
+def compute_slrm(default_1, dem):
+    """Computes SLRM with RVT and normalises it to 0-1 range (NaNs are set to 0), as used for ADAF inference.
+
+    Parameters
+    ----------
+    default_1 : rvt.default.DefaultValues()
+        An instance of RVT DefaultValues class, with parameters required for SLRM.
+    dem : np.ndarray
+        2D array of DEM (nodata already set to NaN). It is not modified.
+
+    Returns
+    -------
+    np.ndarray
+        Normalised SLRM, same shape as the input DEM.
+    """
+    slrm = default_1.get_slrm(dem)
+    out_slrm = normalize_inplace(slrm.squeeze(), -0.5, 0.5)
+
+    return out_slrm
+
+
+def group_tiles_by_row(extents_list):
+    """Groups tiles of the reference grid into rows (tiles with the same top coordinate), ordered from top to bottom.
+
+    Parameters
+    ----------
+    extents_list : gpd.geodataframe.GeoDataFrame
+        List of extents in GeoDataFrame format (requires "minx", "miny", "maxx", "maxy" columns).
+
+    Returns
+    -------
+    list
+        A list of rows, each row is a list of (positional) indices of tiles, ordered from left to right.
+    """
+    rows = {}
+    for i, (minx, maxy) in enumerate(zip(extents_list.minx.values, extents_list.maxy.values)):
+        rows.setdefault(round(maxy, 6), []).append((minx, i))
+
+    return [[i for _, i in sorted(rows[top])] for top in sorted(rows, reverse=True)]
+
+
+def read_strip_to_shared_memory(src, strip_bounds, buffer, dtype=DTYPE):
+    """Reads one strip (row of tiles) with added buffer from an opened raster into shared memory.
+
+    Nodata values are changed to NaN. The array has shape (rows, cols).
+
+    Parameters
+    ----------
+    src : rasterio.io.DatasetReader
+        Opened DEM.
+    strip_bounds : tuple
+        Extents of the strip without buffer (left, bottom, right, top).
+    buffer : int
+        Buffer in pixels, added on all four sides.
+    dtype : str
+        Data type of the array.
+
+    Returns
+    -------
+    (multiprocessing.shared_memory.SharedMemory, tuple)
+        Shared memory block and shape of the array stored in it.
+    """
+    buffer_m = buffer * src.res[0]
+    buff_window = from_bounds(
+        strip_bounds[0] - buffer_m,
+        strip_bounds[1] - buffer_m,
+        strip_bounds[2] + buffer_m,
+        strip_bounds[3] + buffer_m,
+        src.transform
+    ).round_offsets().round_lengths()
+
+    # boundless - if window falls out of bounds, read it and fill with nodata
+    strip = src.read(1, window=buff_window, boundless=True, out_dtype=dtype)
+    fill_nodata_inplace(strip, src.nodata, np.nan)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(strip.nbytes, 1))
+    shared_strip = np.ndarray(strip.shape, dtype=strip.dtype, buffer=shm.buf)
+    shared_strip[:] = strip
+    del shared_strip
+
+    return shm, strip.shape
+
+
+def attach_shared_memory(shm_name):
+    """Attaches to an existing shared memory block, which is owned (and unlinked) by the process that created it."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # On POSIX attaching also registers the block with the resource tracker of this process, which would try to remove
+    # it again at exit (bpo-39959), only in worker processes (serial and threaded runs share the owner's tracker)
+    if os.name == "posix" and parent_process() is not None:
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    return shm
+
+
+def process_one_strip_tile(
+        default_1,
+        shm_name,
+        strip_shape,
+        col_offset,
+        tile_width,
+        buffer,
+        out_profile,
+        save_path,
+        tile_id,
+        dtype=DTYPE
+):
+    """Creates SLRM for a single tile from a strip stored in shared memory.
+
+    The tile (with buffer) is a view of the shared array, so nothing is copied or pickled between processes.
 
+    Parameters
+    ----------
+    default_1 : rvt.default.DefaultValues()
+        An instance of RVT DefaultValues class, with parameters required for this visualization(s).
+    shm_name : str
+        Name of the shared memory block with the strip (see read_strip_to_shared_memory).
+    strip_shape : tuple
+        Shape of the strip array (rows, cols), including buffer.
+    col_offset : int
+        Column of the strip, where the buffered tile starts.
+    tile_width : int
+        Width of the tile in pixels (without buffer).
+    buffer : int
+        Buffer in pixels.
+    out_profile : dict
+        Rasterio profile of the output tile.
+    save_path : pathlib.Path()
+        Path of the output file.
+    tile_id : int
+        ID of tile.
+    dtype : str
+        Data type of the strip array.
+
+    Returns
+    -------
+        0 if successful, 1 if error (all NaNs encountered), tile ID, message and statistics of the SLRM tile.
+    """
+    shm = attach_shared_memory(shm_name)
+    try:
+        strip = np.ndarray(strip_shape, dtype=dtype, buffer=shm.buf)
+        dem = strip[:, col_offset:col_offset + tile_width + 2 * buffer]
+
+        # Then check, if output slice (w/o buffer) is all NaNs, then skip this tile if yes
+        if np.isnan(dem[buffer:-buffer, buffer:-buffer]).all():
+            del strip, dem
+            return 1, tile_id, f"Skipping, all NaNs in: {save_path.name}", None
+
+        out_slrm = compute_slrm(default_1, dem)
+        del strip, dem
+    finally:
+        shm.close()
+
+    # Slice away buffer and save
+    arr_out = np.expand_dims(out_slrm[buffer:-buffer, buffer:-buffer], axis=0)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    out_profile = out_profile.copy()
+    out_profile.update(dtype=arr_out.dtype, count=arr_out.shape[0], nodata=0)
+    with rasterio.open(save_path, "w", **out_profile) as dst:
+        dst.write(arr_out)
+
+    stats = tile_statistics(arr_out)
+    stats["file"] = save_path.name
+
+    return 0, tile_id, f"Finished processing: {save_path.name}", stats
+
+
+def strip_processing(
+        input_raster_path,
+        extents_list,
+        default_1,
+        low_level_dir,
+        nr_processes,
+        dtype=DTYPE,
+        executor="processes",
+        metrics=None
+):
+    """Multiprocessing for RVT, where DEM is read one strip (row of tiles) at a time into shared memory.
+
+    The main process decodes each strip (with SLRM buffer) only once, the buffer between neighbouring tiles in the
+    same row is not read again. Workers get only the name of the shared memory block and offsets. While the workers
+    are processing one strip, the next one is being read (a strip is released when all of its tiles are finished).
+
+    Parameters
+    ----------
+    input_raster_path : str or pathlib.Path()
+        Path to the source file, raster in GeoTIFF or VRT format.
+    extents_list : gpd.geodataframe.GeoDataFrame
+        List of extents in GeoDataFrame format. Each tile is a square polygon.
+    default_1 : rvt.default.DefaultValues()
+        An instance of RVT DefaultValues class, with parameters required for this visualization(s).
+    low_level_dir : pathlib.Path()
+        Path to the main directory for saving results.
+    nr_processes : int
+        Number of processes for multiprocessing.
+    dtype : str
+        Data type in which DEM is read and visualisations are computed.
+    executor : executors.Executor or str
+        Existing executor (not closed) or kind of a new one (see executors.get_executor()), workers have to run on
+        this machine (shared memory).
+    metrics : metrics.Metrics
+        Optional - every tile is recorded (stage "visualisations").
+
+    Returns
+    -------
+    (list, list)
+        List of paths to output tiles and list of statistics of tiles.
+    """
+    buffer = default_1.slrm_rad_cell
+    ext_list1 = extents_list[["minx", "miny", "maxx", "maxy"]].values.tolist()
+
+    all_tiles_paths = []
+    tiles_stats = []
+    tiles_paths = {}
+    # Shared memory block of every strip and number of its tiles that are not finished yet
+    strips = {}
+    tile_strip = {}
+
+    def strip_tasks(src):
+        # Strips are read lazily, when the executor asks for more tasks
+        res = src.res[0]
+        for row in group_tiles_by_row(extents_list):
+            strip_bounds = (
+                min(ext_list1[i][0] for i in row),
+                min(ext_list1[i][1] for i in row),
+                max(ext_list1[i][2] for i in row),
+                max(ext_list1[i][3] for i in row)
+            )
+            shm, strip_shape = read_strip_to_shared_memory(src, strip_bounds, buffer, dtype)
+            strips[shm.name] = [shm, len(row)]
+
+            for i in row:
+                left, bottom, right, top = ext_list1[i]
+                tile_window = from_bounds(left, bottom, right, top, src.transform)
+                tile_width = int(round(tile_window.width))
+                col_offset = int(round((left - strip_bounds[0]) / res))
+
+                out_profile = {
+                    'driver': 'GTiff',
+                    'nodata': None,
+                    'width': tile_width,
+                    'height': strip_shape[0] - 2 * buffer,
+                    'count': 1,
+                    'crs': src.crs,
+                    'transform': src.window_transform(tile_window),
+                    "compress": "lzw"
+                }
+                tile_name = f"{left:.0f}_{bottom:.0f}_rvt.tif"
+                save_path = low_level_dir / "slrm" / default_1.get_slrm_file_name(tile_name)
+                tiles_paths[i] = save_path.as_posix()
+                tile_strip[i] = shm.name
+
+                yield (
+                    default_1, shm.name, strip_shape, col_offset, tile_width, buffer, out_profile, save_path, i, dtype
+                )
+
+    def release(shm_name):
+        shm = strips.pop(shm_name)[0]
+        shm.close()
+        shm.unlink()
+
+    with rasterio.open(input_raster_path) as src, executor_scope(executor, nr_processes) as ex:
+        try:
+            # Only a few tiles are submitted ahead, so only the strips of these tiles are held in memory
+            for pool_out in ex.map(
+                    process_one_strip_tile, strip_tasks(src), "visualisations", total=len(ext_list1), metrics=metrics
+            ):
+                if pool_out[0] == 1:
+                    logging.debug("Skipped (tile_ID:", pool_out[1], ");", pool_out[2])
+                else:
+                    logging.debug("tile_ID:", pool_out[1], ";", pool_out[2])
+                    all_tiles_paths.append(tiles_paths[pool_out[1]])
+                    tiles_stats.append(pool_out[3])
+
+                # Strip is released as soon as all of its tiles are finished
+                shm_name = tile_strip.pop(pool_out[1])
+                strips[shm_name][1] -= 1
+                if strips[shm_name][1] == 0:
+                    release(shm_name)
+        finally:
+            # Release shared memory if anything went wrong
+            for shm_name in list(strips):
+                release(shm_name)
+
+    return all_tiles_paths, tiles_stats
+
+
+def box_mean_valid(dem, radius):
+    """Mean of valid (non-NaN) pixels in a square window of size 2 * radius + 1, computed with summed-area tables.
+
+    Only the inner part of the array is returned (radius is removed on all sides), so the window never falls out of
+    the array. This gives the same result as the mean filter of RVT (used for SLRM) for pixels that are at least radius
+    pixels away from the edge.
+
+    Parameters
+    ----------
+    dem : np.ndarray
+        2D array of DEM, nodata is NaN.
+    radius : int
+        Radius of the window in pixels.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (rows - 2 * radius, cols - 2 * radius), same data type as DEM. NaN where there are no valid
+        pixels.
+    """
+    k = 2 * radius + 1
+
+    def window_sum(arr):
+        # Summed-area table along rows, then along columns
+        cs = np.cumsum(arr, axis=0, dtype=np.float64)
+        cs = np.concatenate([np.zeros((1, cs.shape[1])), cs], axis=0)
+        arr = cs[k:] - cs[:-k]
+        cs = np.cumsum(arr, axis=1)
+        cs = np.concatenate([np.zeros((cs.shape[0], 1)), cs], axis=1)
+        return cs[:, k:] - cs[:, :-k]
+
+    valid = ~np.isnan(dem)
+    sum_values = window_sum(np.where(valid, dem, 0))
+    nr_pixels = window_sum(valid)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_out = sum_values / nr_pixels
 
-def get_tile_from_raster(raster_path, extents, buffer):
+    return mean_out.astype(dem.dtype)
+
+
+def sliding_slrm(default_1, strip):
+    """Computes normalised SLRM (see compute_slrm) for the inner part of a strip, buffer is removed on all sides.
+
+    Parameters
+    ----------
+    default_1 : rvt.default.DefaultValues()
+        An instance of RVT DefaultValues class, with parameters required for SLRM.
+    strip : np.ndarray
+        2D array of DEM with buffer of default_1.slrm_rad_cell pixels on all sides (nodata is NaN).
+
+    Returns
+    -------
+    np.ndarray
+        Normalised SLRM without buffer.
+    """
+    radius = default_1.slrm_rad_cell
+    dem = strip[radius:-radius, radius:-radius]
+    slrm = box_mean_valid(strip, radius)
+    np.subtract(dem, slrm, out=slrm)
+    slrm *= default_1.ve_factor
+    out_slrm = normalize_inplace(slrm, -0.5, 0.5)
+
+    return out_slrm
+
+
+def sliding_processing(input_raster_path, extents_list, default_1, low_level_dir, nr_processes, dtype=DTYPE):
+    """RVT visualisations computed on horizontal strips of DEM, one row of tiles at a time.
+
+    The strip buffer holds one row of tiles plus SLRM buffer on all sides and spans all the columns of the reference
+    grid. When the next row of tiles is directly below the previous one, the trailing buffer rows are moved to the top
+    of the strip and only the new rows are read from the raster, so the buffer is practically never read twice.
+    SLRM is computed for the whole strip at once (see sliding_slrm), output tiles are cut out of the strip and saved by
+    a pool of threads. Memory use is proportional to one strip.
+
+    Parameters
+    ----------
+    input_raster_path : str or pathlib.Path()
+        Path to the source file, raster in GeoTIFF or VRT format.
+    extents_list : gpd.geodataframe.GeoDataFrame
+        List of extents in GeoDataFrame format. Each tile is a square polygon.
+    default_1 : rvt.default.DefaultValues()
+        An instance of RVT DefaultValues class, with parameters required for this visualization(s).
+    low_level_dir : pathlib.Path()
+        Path to the main directory for saving results.
+    nr_processes : int
+        Number of threads for saving tiles.
+    dtype : str
+        Data type in which DEM is read and visualisations are computed.
+
+    Returns
+    -------
+    (list, list)
+        List of paths to output tiles and list of statistics of tiles.
+    """
+    buffer = default_1.slrm_rad_cell
+    ext_list1 = extents_list[["minx", "miny", "maxx", "maxy"]].values.tolist()
+    left = min(ext[0] for ext in ext_list1)
+    right = max(ext[2] for ext in ext_list1)
+
+    (low_level_dir / "slrm").mkdir(parents=True, exist_ok=True)
+
+    def save_tile(arr_out, out_profile, save_path):
+        with rasterio.open(save_path, "w", **out_profile) as dst:
+            dst.write(np.expand_dims(arr_out, axis=0))
+
+    all_tiles_paths = []
+    tiles_stats = []
+    strip = None
+    prev_bottom = None
+    writing = []
+    with rasterio.open(input_raster_path) as src, get_executor("threads", nr_processes) as writer:
+        res = src.res[0]
+        buffer_m = buffer * res
+        for row in group_tiles_by_row(extents_list):
+            top = max(ext_list1[i][3] for i in row)
+            bottom = min(ext_list1[i][1] for i in row)
+            strip_window = from_bounds(
+                left - buffer_m, bottom - buffer_m, right + buffer_m, top + buffer_m, src.transform
+            ).round_offsets().round_lengths()
+            strip_shape = (int(strip_window.height), int(strip_window.width))
+
+            if strip is not None and strip.shape == strip_shape and \
+                    np.isclose(prev_bottom, top):
+                # Next row is directly below the previous one, reuse the trailing buffer rows (2 * buffer)
+                strip[:2 * buffer] = strip[-2 * buffer:]
+                new_window = Window(
+                    strip_window.col_off, strip_window.row_off + 2 * buffer,
+                    strip_window.width, strip_window.height - 2 * buffer
+                )
+                new_rows = strip[2 * buffer:]
+            else:
+                strip = np.empty(strip_shape, dtype=dtype)
+                new_window = strip_window
+                new_rows = strip
+
+            # boundless - if window falls out of bounds, read it and fill with nodata
+            new_rows[:] = src.read(1, window=new_window, boundless=True, out_dtype=dtype)
+            fill_nodata_inplace(new_rows, src.nodata, np.nan)
+            prev_bottom = bottom
+
+            out_slrm = sliding_slrm(default_1, strip)
+
+            # Wait for tiles of the previous strip, so only one strip is held in memory
+            for future in writing:
+                future.result()
+            writing = []
+
+            for i in row:
+                tile_window = from_bounds(*ext_list1[i], src.transform)
+                col_offset = int(round((ext_list1[i][0] - left) / res))
+                tile_width = int(round(tile_window.width))
+                arr_out = out_slrm[:, col_offset:col_offset + tile_width]
+
+                # Then check, if DEM of the tile is all NaNs, then skip this tile if yes
+                tile_dem = strip[buffer:-buffer, buffer + col_offset:buffer + col_offset + tile_width]
+                tile_name = f"{ext_list1[i][0]:.0f}_{ext_list1[i][1]:.0f}_rvt.tif"
+                if np.isnan(tile_dem).all():
+                    logging.debug("Skipped (tile_ID:", i, ");", f"Skipping, all NaNs in: {tile_name}")
+                    continue
+
+                out_profile = {
+                    'driver': 'GTiff',
+                    'nodata': 0,  # was NaN, use 0 for SLRM in ADAF
+                    'width': tile_width,
+                    'height': arr_out.shape[0],
+                    'count': 1,
+                    'crs': src.crs,
+                    'transform': src.window_transform(tile_window),
+                    "compress": "lzw",
+                    "dtype": arr_out.dtype
+                }
+                save_path = low_level_dir / "slrm" / default_1.get_slrm_file_name(tile_name)
+                all_tiles_paths.append(save_path.as_posix())
+                writing.append(writer.submit(save_tile, arr_out, out_profile, save_path))
+
+                stats = tile_statistics(arr_out)
+                stats["file"] = save_path.name
+                tiles_stats.append(stats)
+
+        for future in writing:
+            future.result()
+
+    return all_tiles_paths, tiles_stats
+
+
+def get_tile_from_raster(raster_path, extents, buffer, dtype=DTYPE):
     """The function reads the array for a single tile from the entire raster. It also extracts all relevant metadata
     such as transform, resolution, crs, array size, nodata, etc.
 
@@ -280,6 +850,8 @@ def get_tile_from_raster(raster_path, extents, buffer):
         Extents to be read (left, bottom, right, top).
     buffer : int
         Buffer in pixels.
+    dtype : str
+        Data type of the array, None keeps data type of the raster.
 
     Returns
     -------
@@ -308,7 +880,7 @@ def get_tile_from_raster(raster_path, extents, buffer):
 
         # Read windowed array (with added buffer)
         # boundless - if window falls out of bounds, read it and fill with NaNs
-        win_array = vrt.read(window=buff_window, boundless=True)
+        win_array = vrt.read(window=buff_window, boundless=True, out_dtype=dtype)
 
         # Save transform object of both extents (original and buffered)
         buff_transform = vrt.window_transform(buff_window)
@@ -3,6 +3,7 @@ ADAF - GUI
 Created on 26 May 2023
 @author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
 """
+import logging
 from pathlib import Path
 from tkinter import Tk, filedialog
 
@@ -13,6 +14,11 @@ from yaspin import yaspin
 
 from adaf.adaf_inference import main_routine
 from adaf.adaf_utils import ADAFInput, build_vrt_from_list
+from adaf.estimate import estimate, format_estimate
+
+# The notebook shows its own progress (yaspin), log messages of ADAF and libraries are not shown. Scripts and the
+# command line (python -m adaf) configure logging themselves and also get progress of stages (executors.log_progress).
+logging.disable(logging.INFO)
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~ INPUT FILES OPTIONS ~~~~~~~~~~~~~~~~~~~~~~~~
@@ -453,8 +459,15 @@ button_run_adaf = widgets.Button(
 output = widgets.Output()  # layout={'border': '1px solid black'})
 
 
-# Handler for BUTTON OF DOOM
-def on_button_clicked(b):
+# Button for the estimate of run time, memory and disk usage (optional, before the run)
+button_estimate = widgets.Button(
+    description="Estimate",
+    layout={'width': 'auto', 'border': '1px solid black'},
+    tooltip='Expected run time, memory and disk usage (processes a few sample tiles)'
+)
+
+
+def prepare_input():
     """
     List of available input parameters:
     rb_input_file.index - 0 for DEM, 1 for visualization
@@ -462,10 +475,9 @@ def on_button_clicked(b):
     inp2.value
 
     model_path - hard coded based on the inp2.value (segmentation or object detection)
-    """
-    output_widget.clear_output()
-    button_run_adaf.disabled = True
 
+    Returns ADAFInput with values of the widgets, or None if the custom model doesn't exist.
+    """
     # Check if paths are correct for custom model
     custom_model_pth = Path(txt_custom_model.value)
     if rb_ml_switch.index == 0:
@@ -477,49 +489,79 @@ def on_button_clicked(b):
             display("The specified Custom Model file doesn't exist!")
         custom_tar_ok = False
 
-    run_app = custom_tar_ok
-
-    if run_app:
-        # Prepare input parameter for processing visualization
-        if rb_input_file.index == 0:
-            # DEM is selected
-            vis_exist_ok = False
-        else:
-            # Visualization is selected
-            vis_exist_ok = True
-
-        # Select classes
-        class_selection = [
-            class_barrow,
-            class_ringfort,
-            class_enclosure,
-            class_all_archaeology,
-        ]
-        class_selection = [select_class(a) for a in class_selection if a.value]
-
-        # Save visualizations (Only available if DEM is selected)
-        if not vis_exist_ok and chk_save_vis.value:
-            save_vis = True
-        else:
-            save_vis = False
-
-        # Save values into input object  # TODO: have a dict that is updated with every event!
-        my_input = ADAFInput()
-        my_input.update(
-            input_file_list=b_file_select.files,  # Input is list of paths
-            tiles_to_vrt=chk_tiling.value,
-            vis_exist_ok=vis_exist_ok,
-            save_vis=save_vis,
-            out_dir=b_dir_select.folder,
-            ml_type=rb_semseg_or_objdet.value,
-            labels=class_selection,
-            ml_model_custom=dropdown.value,
-            custom_model_pth=b_tar_select.files,  # txt_custom_model.value,
-            roundness=fs_roundness.value,
-            min_area=fs_area.value,
-            save_ml_output=chk_save_predictions.value
-        )
+    if not custom_tar_ok:
+        return None
+
+    # Prepare input parameter for processing visualization
+    if rb_input_file.index == 0:
+        # DEM is selected
+        vis_exist_ok = False
+    else:
+        # Visualization is selected
+        vis_exist_ok = True
+
+    # Select classes
+    class_selection = [
+        class_barrow,
+        class_ringfort,
+        class_enclosure,
+        class_all_archaeology,
+    ]
+    class_selection = [select_class(a) for a in class_selection if a.value]
+
+    # Save visualizations (Only available if DEM is selected)
+    if not vis_exist_ok and chk_save_vis.value:
+        save_vis = True
+    else:
+        save_vis = False
+
+    # Save values into input object  # TODO: have a dict that is updated with every event!
+    my_input = ADAFInput()
+    my_input.update(
+        input_file_list=b_file_select.files,  # Input is list of paths
+        tiles_to_vrt=chk_tiling.value,
+        vis_exist_ok=vis_exist_ok,
+        save_vis=save_vis,
+        out_dir=b_dir_select.folder,
+        ml_type=rb_semseg_or_objdet.value,
+        labels=class_selection,
+        ml_model_custom=dropdown.value,
+        custom_model_pth=b_tar_select.files,  # txt_custom_model.value,
+        roundness=fs_roundness.value,
+        min_area=fs_area.value,
+        save_ml_output=chk_save_predictions.value
+    )
+
+    return my_input
+
 
+def input_files(spin):
+    """List of files to process, several files are joined into a VRT mosaic if selected."""
+    batch_list = b_file_select.files
+
+    if len(batch_list) == 1:
+        spin.write("Started - single image processing")
+    elif len(batch_list) > 1 and chk_tiling.value:
+        spin.write("Started - building VRT")
+        vrt_path = Path(b_dir_select.folder) / "virtual_mosaic.vrt"
+        batch_list = [build_vrt_from_list(batch_list, vrt_path)]
+        spin.write("        - single image processing")
+    elif len(batch_list) > 1:
+        spin.write("Started - batch processing")
+    else:
+        spin.write("NO FILES SELECTED!")
+
+    return batch_list
+
+
+# Handler for BUTTON OF DOOM
+def on_button_clicked(b):
+    output_widget.clear_output()
+    button_run_adaf.disabled = True
+
+    my_input = prepare_input()
+
+    if my_input is not None:
         # RUN ACTUAL MAIN ROUTINE
         # with output_widget:
         #     with yaspin():
@@ -527,21 +569,7 @@ def on_button_clicked(b):
 
         with output_widget:
             with yaspin() as spin:
-                batch_list = b_file_select.files
-
-                if len(batch_list) == 1:
-                    spin.write("Started - single image processing")
-                elif len(batch_list) > 1 and chk_tiling.value:
-                    spin.write("Started - building VRT")
-                    vrt_path = Path(b_dir_select.folder) / "virtual_mosaic.vrt"
-                    batch_list = [build_vrt_from_list(batch_list, vrt_path)]
-                    spin.write("        - single image processing")
-                elif len(batch_list) > 1:
-                    spin.write("Started - batch processing")
-                else:
-                    spin.write("NO FILES SELECTED!")
-
-                for file in batch_list:
+                for file in input_files(spin):
                     spin.write(f" >>> {file}")
                     my_input.update(dem_path=file)
 
@@ -554,8 +582,32 @@ def on_button_clicked(b):
     button_run_adaf.disabled = False
 
 
+# Handler for the Estimate button
+def on_estimate_clicked(b):
+    output_widget.clear_output()
+    button_estimate.disabled = True
+
+    my_input = prepare_input()
+
+    if my_input is not None:
+        with output_widget:
+            with yaspin() as spin:
+                for file in input_files(spin):
+                    spin.write(f" >>> {file}")
+                    # The estimate is only informative, a failure is reported and doesn't stop anything
+                    try:
+                        spin.write(format_estimate(estimate(file, my_input.ml_type, my_input.labels, my_input)))
+                    except Exception as err:
+                        spin.write(f"Estimate failed: {type(err).__name__}: {err}")
+
+                spin.ok("✔ Finished estimate")
+
+    button_estimate.disabled = False
+
+
 # button_run_adaf.on_click(on_button_clicked(abc=test_upload))
 button_run_adaf.on_click(on_button_clicked)
+button_estimate.on_click(on_estimate_clicked)
 
 
 def select_class(chk_widget):
@@ -632,7 +684,7 @@ display(
                 )
             ]),
             widgets.Box(
-                [button_run_adaf],
+                [button_estimate, button_run_adaf],
                 layout=widgets.Layout(
                     display='flex',
                     flex_flow='column',
@@ -0,0 +1,78 @@
+"""
+ADAF - conversion of ML checkpoints to memory-mappable weights
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+AiTLAS checkpoints (tar files in "ml_models" folder) are pickled dictionaries with the weights, optimizer state and
+training metadata, loading them unpickles the whole file into RAM. The conversion keeps only the weights (state dict)
+and saves them to "ml_models/weights", from where adaf_utils.load_aitlas_model() memory-maps them (requires PyTorch
+2.1 or newer). Conversion has to be repeated when the checkpoint changes (older conversions are ignored).
+
+Run from the repository root:
+    python -m adaf.convert_weights                     (all shipped models)
+    python -m adaf.convert_weights <path to tar file>
+"""
+import argparse
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import torch
+
+from adaf.adaf_utils import weights_model_path
+
+
+def convert_checkpoint(model_path, weights_path=None):
+    """Saves weights of AiTLAS checkpoint in a format that can be memory-mapped.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    weights_path : str or pathlib.Path()
+        Output path, by default the weights are saved to "weights" folder next to the checkpoint (see
+        adaf_utils.weights_model_path()).
+
+    Returns
+    -------
+    pathlib.Path
+        Path to converted weights.
+    """
+    weights_path = Path(weights_path) if weights_path else weights_model_path(model_path)
+    weights_path.parent.mkdir(parents=True, exist_ok=True)
+
+    checkpoint = torch.load(Path(model_path).as_posix(), map_location="cpu", weights_only=False)
+    # AiTLAS checkpoints store weights under "state_dict", plain state dicts are saved as they are
+    if isinstance(checkpoint, Mapping) and "state_dict" in checkpoint:
+        checkpoint = checkpoint["state_dict"]
+    # Contiguous tensors, each with its own storage (views of larger tensors would map the whole storage)
+    state_dict = {key: value.detach().contiguous().clone() for key, value in checkpoint.items()}
+
+    tmp_path = weights_path.with_name(f"{weights_path.name}.{os.getpid()}.tmp")
+    torch.save(state_dict, tmp_path.as_posix())
+    os.replace(tmp_path, weights_path)
+
+    return weights_path
+
+
+def convert_all(models_dir=None):
+    """Converts all checkpoints (tar files) from models_dir (default is "ml_models" next to this script). Returns
+    dictionary with path to converted weights for each checkpoint."""
+    models_dir = Path(models_dir) if models_dir else Path(__file__).resolve().parent / "ml_models"
+
+    return {model_path.name: convert_checkpoint(model_path) for model_path in sorted(models_dir.glob("*.tar"))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ADAF checkpoints to memory-mappable weights.")
+    parser.add_argument("model_path", nargs="?", default=None, help="Checkpoint (tar), all shipped models if omitted.")
+    args = parser.parse_args()
+
+    if args.model_path:
+        converted = {Path(args.model_path).name: convert_checkpoint(args.model_path)}
+    else:
+        converted = convert_all()
+
+    for name, path in converted.items():
+        size_mb = path.stat().st_size / 2 ** 20
+        print(f"{name} -> {path} ({size_mb:.1f} MB)")
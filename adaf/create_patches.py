@@ -5,9 +5,7 @@ Created on 26 May 2023
 
 Requires ADAF toolbox.
 """
-import multiprocessing as mp
 import warnings
-from os import cpu_count
 from pathlib import Path
 
 import geopandas as gpd
@@ -19,8 +17,11 @@ from shapely.affinity import translate
 from shapely.geometry import box
 
 from adaf.adaf_utils import clip_tile
+from adaf.executors import executor_scope
+from adaf.resources import plan_resources
 
-warnings.filterwarnings("ignore", category=np.VisibleDeprecationWarning)
+# Moved to np.exceptions (removed from the main namespace in numpy 2.0)
+warnings.filterwarnings("ignore", category=getattr(np, "exceptions", np).VisibleDeprecationWarning)
 
 
 def create_one_patch(one_tile, segments_gdf, dem_pth):
@@ -320,7 +321,7 @@ def patches_grid(ds, archaeology, patch_size, stagger):
         return grid
 
 
-def create_patches_main(input_raster, seg_masks_dict, output_directory):
+def create_patches_main(input_raster, seg_masks_dict, output_directory, executor="processes"):
     """Main routine for creating patches.
 
     Parameters
@@ -332,13 +333,15 @@ def create_patches_main(input_raster, seg_masks_dict, output_directory):
         three labels.
     output_directory : str or pathlib.Path()
         Path to directory where patches are saved.
+    executor : executors.Executor or str
+        Existing executor (not closed) or kind of a new one (see executors.get_executor()).
 
     """
     # ##################################################################################################################
     # PROCESS INPUTS:
     input_raster = Path(input_raster)
 
-    nr_processes = cpu_count() - 2
+    nr_processes = plan_resources().vis_workers
 
     output_directory = Path(output_directory)
     output_directory.mkdir(exist_ok=True)
@@ -389,10 +392,10 @@ def create_patches_main(input_raster, seg_masks_dict, output_directory):
 
     # print("Start multiproc")
 
-    with mp.Pool(nr_processes) as p:
-        _ = [p.apply_async(create_one_patch, r) for r in input_process_list]
-        # for result in realist:
-        #     pool_out = result.get()
+    # Results are collected, so failed patches raise an error (and the pool isn't closed before all patches are done)
+    with executor_scope(executor, nr_processes) as ex:
+        for _ in ex.map(create_one_patch, input_process_list, "patches"):
+            pass
 
     # # Single run (FOR DEBUG)
     # tiles_gpkg(*input_process_list[10])
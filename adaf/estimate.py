@@ -0,0 +1,315 @@
+"""
+ADAF - estimate of a run
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Preflight check before a (possibly multi-hour) run: reads the DEM metadata and builds the same filtered grid as the
+run, then processes a few sample tiles (spread over the grid) through visualisation, inference and vectorisation on
+this machine. Times, memory and sizes of files of the sample are extrapolated to all tiles with the resources of the
+run (see resources.py): expected wall time of every stage, peak memory and disk space for intermediate files
+(visualisations, raw predictions) and for the results that are kept.
+
+The estimate is an upper bound for inference, tiles skipped during the run (no valid data, flat terrain, screener) are
+not taken into account. It is shown in the widget (Estimate button, the run is started separately) and can be printed
+from the command line:
+    python -m adaf.estimate dem.tif --ml-type segmentation --labels barrow enclosure
+"""
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+import adaf.grid_tools as gt
+from adaf.adaf_inference import ml_model_path, object_detection_vectors, semantic_segmentation_vectors
+from adaf.adaf_utils import (
+    ADAFInput,
+    image_tiling,
+    load_backend,
+    make_predictions_on_patches_object_detection,
+    make_predictions_on_patches_segmentation
+)
+from adaf.adaf_vis import DTYPE, tiled_processing
+from adaf.metrics import Metrics
+from adaf.resources import (
+    WORKER_BASE_MB,
+    PeakMemory,
+    peak_rss_mb,
+    plan_resources,
+    vis_worker_mb,
+    workers_for_memory
+)
+
+# Tile size of the run (see adaf_inference.main_routine())
+TILE_SIZE_PX = 1024
+# Start of a spawned inference worker (interpreter and torch imports), rough value
+WORKER_SPAWN_S = 5.0
+
+
+def _rss_mb():
+    """Current memory (RSS) of this process in MB, peak memory if psutil is not available."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        return peak_rss_mb() or 0.0
+
+
+def _dir_mb(path):
+    """Size of files in a folder (MB)."""
+    return sum(file.stat().st_size for file in Path(path).rglob("*") if file.is_file()) / 1024 ** 2
+
+
+def _tile_times(metrics, stage, field="wall_s"):
+    """Times of tiles of a stage from metrics records, the first tile (warm-up) is left out if there are more."""
+    times = [record[field] for record in metrics.records if record["event"] == "tile" and record["stage"] == stage]
+
+    return times[1:] if len(times) > 1 else times
+
+
+def estimate(dem_path, ml_type="segmentation", labels=("AO",), inp=None, sample_tiles=3, work_dir=None):
+    """Estimates run time, peak memory and disk usage of a run by processing a few sample tiles.
+
+    Parameters
+    ----------
+    dem_path : str or pathlib.Path()
+        DEM (or visualisation, if inp.vis_exist_ok) of the run.
+    ml_type : str
+        "object detection" or "segmentation".
+    labels : list
+        Labels of the run (ignored for custom model, see inp.ml_model_custom).
+    inp : adaf_utils.ADAFInput
+        Optional - other parameters of the run (visualisation exists, saving of results, custom model, backend,
+        resources, shard).
+    sample_tiles : int
+        Number of sample tiles.
+    work_dir : str or pathlib.Path()
+        Optional - folder for temporary files of the sample (removed), by default the system temporary folder.
+
+    Returns
+    -------
+    dict
+        Grid ("tiles"), time of every stage ("seconds"), peak memory of stages ("memory_mb"), disk usage ("disk_mb")
+        and warnings (e.g. not enough disk space).
+    """
+    inp = inp or ADAFInput()
+    dem_path = Path(dem_path)
+    labels = ["custom"] if inp.ml_model_custom == "Custom model" else list(labels)
+    backend = inp.backend or "torch"
+    resources = plan_resources(
+        inp.cpus, inp.memory_mb, 1 if inp.inference_server else inp.inference_workers, inp.inference_threads
+    )
+    warnings = []
+
+    # DEM metadata and the filtered grid of the run (see adaf_inference.run_visualisations())
+    with rasterio.open(dem_path) as src:
+        dem = {
+            "path": dem_path.as_posix(),
+            "width": src.width,
+            "height": src.height,
+            "res": src.res[0],
+            "crs": src.crs.to_string() if src.crs else None
+        }
+    t_grid = time.perf_counter()
+    valid_data_outline, _ = gt.poly_from_valid(dem_path.as_posix())
+    tiles_extents = gt.bounding_grid(dem_path.as_posix(), TILE_SIZE_PX, tag=False)
+    tiles_extents = gt.filter_by_outline(tiles_extents, valid_data_outline)
+    if inp.shard is not None:
+        tiles_extents = gt.shard_grid(tiles_extents, *gt.parse_shard(inp.shard))
+    grid_s = time.perf_counter() - t_grid
+    nr_tiles = len(tiles_extents)
+    if nr_tiles == 0:
+        warning = "No tiles to process (no valid data in the DEM or empty shard)!"
+        return {"dem": dem, "tiles": 0, "seconds": {"total": grid_s}, "warnings": [warning]}
+
+    # Sample tiles are spread over the grid
+    sample_idx = np.unique(np.linspace(0, nr_tiles - 1, min(sample_tiles, nr_tiles)).round().astype(int))
+    sample = tiles_extents.iloc[sample_idx].reset_index(drop=True)
+    nr_sample = len(sample)
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="adaf_estimate_", dir=work_dir))
+    metrics = Metrics()
+    try:
+        # Visualisations (or tiles of an existing visualisation)
+        if inp.vis_exist_ok:
+            out_paths = image_tiling(
+                dem_path.as_posix(), sample, nr_processes=1, save_dir=tmp_dir / "vis", engine="serial", metrics=metrics
+            )
+            vis_stage = "tiling"
+        else:
+            out_paths = tiled_processing(
+                dem_path.as_posix(), sample, nr_processes=1, save_dir=tmp_dir / "vis", engine=inp.vis_engine or "tiles",
+                executor="serial", metrics=metrics
+            )
+            vis_stage = "visualisations"
+        vis_tile_s = statistics.median(_tile_times(metrics, vis_stage))
+        vis_tile_mb = _dir_mb(out_paths["output_directory"]) / nr_sample
+
+        # Inference on the sample tiles, every model is loaded once (as in the run)
+        resources.apply_torch()
+        predictions_dirs = {}
+        load_s = 0.0
+        inference_tile_s = 0.0
+        base_mb = _rss_mb()
+        with PeakMemory("estimate inference") as inference_memory:
+            for label in labels:
+                t_load = time.perf_counter()
+                model_path = ml_model_path(ml_type, label, inp.custom_model_pth)
+                model = load_backend(ml_type, model_path, backend, precision=inp.precision or "fp32")
+                load_s += time.perf_counter() - t_load
+                predictions_dir = tmp_dir / f"predictions_{label}"
+                label_metrics = Metrics()
+                if ml_type == "object detection":
+                    make_predictions_on_patches_object_detection(
+                        model, label, out_paths["output_directory"], predictions_dir, metrics=label_metrics
+                    )
+                else:
+                    make_predictions_on_patches_segmentation(
+                        model, label, out_paths["output_directory"], predictions_dir, metrics=label_metrics
+                    )
+                inference_tile_s += statistics.median(_tile_times(label_metrics, "inference"))
+                predictions_dirs[label] = predictions_dir
+                del model
+        model_mb = max((inference_memory.peak_mb or base_mb) - base_mb, 0.0)
+        predictions_tile_mb = sum(_dir_mb(p_dir) for p_dir in predictions_dirs.values()) / nr_sample
+
+        # Vectorisation of the sample predictions
+        t_vector = time.perf_counter()
+        if ml_type == "object detection":
+            vector_path = object_detection_vectors(predictions_dirs, min_area=inp.min_area)
+        else:
+            vector_path = semantic_segmentation_vectors(
+                predictions_dirs, roundness=inp.roundness, min_area=inp.min_area, executor="serial"
+            )
+        vector_tile_s = (time.perf_counter() - t_vector) / nr_sample
+        vector_tile_mb = (Path(vector_path).stat().st_size / 1024 ** 2 if vector_path else 0.0) / nr_sample
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Extrapolation to all tiles with the resources of the run
+    if inp.vis_exist_ok:
+        # Tiles are only written if they are saved, otherwise they are read during inference
+        save_tiles = inp.save_tiles or inp.save_vis
+        vis_s = nr_tiles * vis_tile_s / resources.tiling_threads if save_tiles else 0.0
+        vis_mb = nr_tiles * vis_tile_mb if save_tiles else 0.0
+        vis_memory_mb = base_mb
+    else:
+        worker_mb = vis_worker_mb(TILE_SIZE_PX, int(np.ceil(10 / dem["res"])) if dem["res"] < 1 else 10, DTYPE)
+        vis_workers = workers_for_memory(resources.vis_workers, worker_mb, resources.memory_mb)
+        vis_s = nr_tiles * vis_tile_s / vis_workers
+        vis_mb = nr_tiles * vis_tile_mb
+        vis_memory_mb = base_mb + vis_workers * worker_mb
+    inference_workers = resources.inference_workers
+    # Worker processes start and load their models at the same time, loading is counted once
+    inference_s = load_s + nr_tiles * inference_tile_s / inference_workers
+    if inference_workers > 1:
+        inference_s += WORKER_SPAWN_S
+        # Every worker process loads its own models
+        inference_memory_mb = base_mb + inference_workers * (WORKER_BASE_MB + model_mb)
+    else:
+        inference_memory_mb = base_mb + model_mb
+    vector_workers = resources.vector_workers if ml_type == "segmentation" else 1
+    vector_s = nr_tiles * vector_tile_s / vector_workers
+    predictions_mb = nr_tiles * predictions_tile_mb
+    vector_mb = nr_tiles * vector_tile_mb
+
+    # Visualisations and raw predictions are on disk at the same time, they are removed at the end unless kept
+    kept_mb = vector_mb + (vis_mb if inp.save_vis or inp.save_tiles else 0)
+    kept_mb += predictions_mb if inp.save_ml_output else 0
+    out_dir = Path(inp.out_dir) if inp.out_dir else dem_path.parent
+    while not out_dir.exists() and out_dir != out_dir.parent:
+        out_dir = out_dir.parent
+    free_mb = shutil.disk_usage(out_dir).free / 1024 ** 2
+    peak_disk_mb = vis_mb + predictions_mb + vector_mb
+    if peak_disk_mb > free_mb:
+        warnings.append(f"Not enough disk space in {out_dir}: {peak_disk_mb:.0f} MB needed, {free_mb:.0f} MB free!")
+    memory_mb = max(vis_memory_mb, inference_memory_mb)
+    if resources.memory_mb and memory_mb > resources.memory_mb:
+        warnings.append(f"Peak memory {memory_mb:.0f} MB exceeds the memory budget {resources.memory_mb} MB!")
+
+    return {
+        "dem": dem,
+        "ml_type": ml_type,
+        "labels": labels,
+        "tiles": nr_tiles,
+        "sample_tiles": nr_sample,
+        "resources": resources.summary(),
+        "per_tile_seconds": {
+            vis_stage: vis_tile_s,
+            "inference": inference_tile_s,
+            "vectorisation": vector_tile_s
+        },
+        "seconds": {
+            "grid": grid_s,
+            vis_stage: vis_s,
+            "inference": inference_s,
+            "vectorisation": vector_s,
+            "total": grid_s + vis_s + inference_s + vector_s
+        },
+        "memory_mb": {
+            vis_stage: vis_memory_mb,
+            "inference": inference_memory_mb,
+            "peak": memory_mb
+        },
+        "disk_mb": {
+            vis_stage: vis_mb,
+            "predictions": predictions_mb,
+            "vectors": vector_mb,
+            "peak": peak_disk_mb,
+            "kept": kept_mb,
+            "free": free_mb
+        },
+        "warnings": warnings
+    }
+
+
+def _duration(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, seconds = divmod(rest, 60)
+
+    return f"{hours} h {minutes:02d} min" if hours else f"{minutes} min {seconds:02d} s"
+
+
+def format_estimate(est):
+    """Text of the estimate (for the widget and the command line)."""
+    lines = [f"Estimate for {Path(est['dem']['path']).name}: {est['tiles']} tiles"]
+    if not est["tiles"]:
+        return "\n".join(lines + est["warnings"])
+
+    lines[0] += f" ({est['sample_tiles']} sample tiles measured)"
+    lines.append(f"  Expected time: {_duration(est['seconds']['total'])}")
+    lines += [f"    {stage}: {_duration(seconds)}" for stage, seconds in est["seconds"].items() if stage != "total"]
+    lines.append(f"  Peak memory: {est['memory_mb']['peak'] / 1024:.1f} GB")
+    disk = est["disk_mb"]
+    lines.append(
+        f"  Disk: {disk['peak'] / 1024:.2f} GB during the run, {disk['kept'] / 1024:.2f} GB kept "
+        f"({disk['free'] / 1024:.1f} GB free)"
+    )
+    lines += [f"  Warning: {warning}" for warning in est["warnings"]]
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate run time, memory and disk usage of an ADAF run.")
+    parser.add_argument("dem_path", help="Path to DEM (or visualisation with --vis-exist-ok).")
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default="segmentation")
+    parser.add_argument("--labels", nargs="+", default=["AO"])
+    parser.add_argument("--custom-model", default=None, help="Path to custom model (tar file).")
+    parser.add_argument("--vis-exist-ok", action="store_true", help="Input is an existing visualisation.")
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--sample-tiles", type=int, default=3)
+    args = parser.parse_args()
+
+    run_input = ADAFInput()
+    run_input.update(
+        vis_exist_ok=args.vis_exist_ok,
+        out_dir=args.out_dir,
+        ml_model_custom="Custom model" if args.custom_model else "ADAF model",
+        custom_model_pth=args.custom_model
+    )
+    print(format_estimate(estimate(args.dem_path, args.ml_type, args.labels, run_input, args.sample_tiles)))
@@ -0,0 +1,283 @@
+"""
+ADAF - executors for tiled stages
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Tiled stages (visualisations, tiling, vectorisation, training patches) run their tasks through an executor, so the
+same code runs in the main process, in threads, in a multiprocessing pool or on a Dask cluster:
+    "serial" - tasks run one after another in the calling process,
+    "threads" - thread pool (tasks that release the GIL, e.g. GDAL reading and writing),
+    "processes" - multiprocessing pool (default),
+    "dask" - local Dask cluster (requires dask.distributed), or "tcp://host:port" for an existing Dask scheduler.
+
+All executors have the same interface: submit() returns a future with result(), map() yields results in order with a
+bounded number of pending tasks, reports progress with a callback (stage, finished tasks, number of tasks), optionally
+measures and profiles every task (see metrics.py and profiling.py) and raises TaskError (with the failed task and the
+original exception chained) if a task fails.
+"""
+import logging
+import multiprocessing as mp
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from adaf.metrics import timed_call
+from adaf.profiling import profiled_call
+
+EXECUTORS = ("serial", "threads", "processes", "dask")
+
+
+class TaskError(RuntimeError):
+    """Task of a tiled stage failed, the original exception is chained (__cause__)."""
+    def __init__(self, stage, index, error):
+        super().__init__(f"{stage}: task {index} failed ({type(error).__name__}: {error})")
+        self.stage = stage
+        self.index = index
+
+
+def log_progress(stage, done, total):
+    """Default progress report, logs every 10 % of tasks (every 100 tasks if the number of tasks is unknown)."""
+    if total:
+        if done % max(total // 10, 1) == 0 or done == total:
+            logging.info("%s: %d/%d tasks (%.0f %%)", stage, done, total, 100 * done / total)
+    elif done % 100 == 0:
+        logging.info("%s: %d tasks", stage, done)
+
+
+class _Done:
+    """Result of a task that already ran in the calling process (same interface as futures)."""
+    def __init__(self, func, args):
+        self._value = None
+        self._error = None
+        try:
+            self._value = func(*args)
+        except Exception as err:
+            self._error = err
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+
+        return self._value
+
+
+class _PoolFuture:
+    """Result of a task in multiprocessing pool (AsyncResult with the interface of futures)."""
+    def __init__(self, async_result):
+        self._async_result = async_result
+
+    def result(self):
+        return self._async_result.get()
+
+
+class Executor:
+    """Base class of executors, subclasses implement submit() and close().
+
+    Parameters
+    ----------
+    nr_workers : int
+        Number of workers (processes or threads).
+    progress : callable
+        Called with (stage, finished tasks, number of tasks) after every task of map(), None disables reports.
+    """
+    kind = None
+
+    def __init__(self, nr_workers=1, progress=log_progress):
+        self.nr_workers = max(nr_workers, 1)
+        self.progress = progress
+
+    def submit(self, func, *args):
+        """Runs func(*args), returns a future (result() returns the result or raises the exception of the task)."""
+        raise NotImplementedError
+
+    def close(self):
+        """Stops workers."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def map(self, func, args_list, stage="tasks", max_pending=None, total=None, metrics=None):
+        """Runs func(*args) for every item of args_list and yields results in order of args_list.
+
+        At most max_pending tasks (by default two per worker) are submitted at once, the next task is submitted when
+        the oldest result is collected. Memory of queued arguments and finished results is bounded and args_list can be
+        a generator (it is consumed as tasks are submitted).
+
+        Parameters
+        ----------
+        func : callable
+            Function of the task (has to be picklable for processes and Dask).
+        args_list : iterable
+            Arguments (tuples) of tasks.
+        stage : str
+            Name of the stage, used for progress reports and errors.
+        max_pending : int
+            Maximum number of submitted tasks without collected results.
+        total : int
+            Number of tasks for progress reports, by default len(args_list) if it is known.
+        metrics : metrics.Metrics
+            Optional - every task is measured (wall and CPU time, queue wait, I/O) and written as a "tile" event, if
+            metrics.profiler is set, tasks are also profiled (see profiling.py).
+
+        Yields
+        ------
+        Results of tasks. Raises TaskError if a task fails.
+        """
+        max_pending = max_pending or 2 * self.nr_workers
+        if total is None and hasattr(args_list, "__len__"):
+            total = len(args_list)
+        profiler = getattr(metrics, "profiler", None)
+        pending = deque()
+        done = 0
+
+        def collect():
+            nonlocal done
+            index, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as err:
+                raise TaskError(stage, index, err) from err
+            if metrics is not None:
+                result, task_metrics = result
+                metrics.emit("tile", stage=stage, task=index, **task_metrics)
+            if profiler is not None:
+                result, task_stats = result
+                profiler.add(stage, task_stats)
+            done += 1
+            if self.progress is not None:
+                self.progress(stage, done, total)
+
+            return result
+
+        for index, args in enumerate(args_list):
+            if len(pending) >= max_pending:
+                yield collect()
+            task, task_args = func, args
+            if profiler is not None:
+                task, task_args = profiled_call, (task, task_args)
+            if metrics is not None:
+                task, task_args = timed_call, (task, task_args, time.time())
+            pending.append((index, self.submit(task, *task_args)))
+        while pending:
+            yield collect()
+
+
+class SerialExecutor(Executor):
+    """Runs tasks one after another in the calling process."""
+    kind = "serial"
+
+    def __init__(self, nr_workers=1, progress=log_progress):
+        super().__init__(1, progress)
+
+    def submit(self, func, *args):
+        return _Done(func, args)
+
+
+class ThreadExecutor(Executor):
+    """Runs tasks in a pool of threads."""
+    kind = "threads"
+
+    def __init__(self, nr_workers=1, progress=log_progress):
+        super().__init__(nr_workers, progress)
+        self._pool = ThreadPoolExecutor(max_workers=self.nr_workers)
+
+    def submit(self, func, *args):
+        return self._pool.submit(func, *args)
+
+    def close(self):
+        self._pool.shutdown()
+
+
+class ProcessExecutor(Executor):
+    """Runs tasks in a multiprocessing pool (workers are terminated on close, as when leaving "with mp.Pool()")."""
+    kind = "processes"
+
+    def __init__(self, nr_workers=1, progress=log_progress):
+        super().__init__(nr_workers, progress)
+        self._pool = mp.Pool(self.nr_workers)
+
+    def submit(self, func, *args):
+        return _PoolFuture(self._pool.apply_async(func, args))
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+class DaskExecutor(Executor):
+    """Runs tasks on a Dask cluster, a local cluster with nr_workers processes or an existing scheduler (address).
+
+    Workers of a remote cluster have to see the same paths (shared file system), the "strips" engine of
+    visualisations also requires workers on the same machine (shared memory).
+    """
+    kind = "dask"
+
+    def __init__(self, nr_workers=1, progress=log_progress, address=None):
+        try:
+            from dask.distributed import Client, LocalCluster
+        except ImportError as err:
+            raise ImportError("Dask executor requires dask.distributed (pip install distributed)!") from err
+
+        self._cluster = None
+        if address:
+            self.client = Client(address)
+            nr_workers = sum(self.client.nthreads().values())
+        else:
+            self._cluster = LocalCluster(n_workers=max(nr_workers, 1), threads_per_worker=1, processes=True)
+            self.client = Client(self._cluster)
+        super().__init__(nr_workers, progress)
+
+    def submit(self, func, *args):
+        return self.client.submit(func, *args, pure=False)
+
+    def close(self):
+        self.client.close()
+        if self._cluster is not None:
+            self._cluster.close()
+
+
+def get_executor(kind="processes", nr_workers=1, progress=log_progress):
+    """Creates executor.
+
+    Parameters
+    ----------
+    kind : str
+        "serial", "threads", "processes", "dask" (local cluster) or address of a Dask scheduler ("tcp://host:port").
+    nr_workers : int
+        Number of workers, ignored for "serial" and for an existing Dask scheduler.
+    progress : callable
+        Progress callback (see Executor).
+
+    Returns
+    -------
+    Executor
+    """
+    if kind == "serial":
+        return SerialExecutor(progress=progress)
+    elif kind == "threads":
+        return ThreadExecutor(nr_workers, progress)
+    elif kind == "processes":
+        return ProcessExecutor(nr_workers, progress)
+    elif kind == "dask":
+        return DaskExecutor(nr_workers, progress)
+    elif "://" in str(kind):
+        return DaskExecutor(progress=progress, address=kind)
+    else:
+        raise ValueError(f"Wrong executor '{kind}': choose one of {EXECUTORS} or address of a Dask scheduler!")
+
+
+@contextmanager
+def executor_scope(executor="processes", nr_workers=1):
+    """Yields the given executor (it stays open, e.g. an executor shared by all DEMs of a batch) or a new executor of
+    the given kind, which is closed on exit. Threads and processes with a single worker run serially."""
+    if isinstance(executor, Executor):
+        yield executor
+    else:
+        kind = "serial" if executor in ("threads", "processes") and nr_workers <= 1 else executor
+        with get_executor(kind, nr_workers) as new_executor:
+            yield new_executor
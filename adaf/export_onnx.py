@@ -0,0 +1,212 @@
+"""
+ADAF - export of ML models to ONNX
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Converts AiTLAS checkpoints from "ml_models" folder to ONNX graphs (saved to "ml_models/onnx"), which are used by the
+ONNX Runtime backend (see adaf_utils.OnnxBackend). After export, outputs of the graph are compared with the PyTorch
+model on test tiles.
+
+Run from the repository root:
+    python -m adaf.export_onnx                     (all shipped models)
+    python -m adaf.export_onnx <path to tar file> --ml-type segmentation
+"""
+import argparse
+import inspect
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+
+from adaf.adaf_utils import (
+    DetectionGraph,
+    OnnxBackend,
+    SegmentationGraph,
+    TorchBackend,
+    load_aitlas_model,
+    onnx_model_path
+)
+
+
+def ml_type_from_name(model_path):
+    """Guesses type of the model from file name of the shipped checkpoints (OD_*.tar are object detection)."""
+    return "object detection" if Path(model_path).name.startswith("OD_") else "segmentation"
+
+
+def export_model(model_path, ml_type=None, onnx_path=None, tile_size=1024, opset=17):
+    """Exports AiTLAS checkpoint to ONNX.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    ml_type : str
+        "object detection" or "segmentation", guessed from file name if None.
+    onnx_path : str or pathlib.Path()
+        Output path, by default the graph is saved to "onnx" folder next to the checkpoint (see
+        adaf_utils.onnx_model_path()).
+    tile_size : int
+        Size of the example tile used for tracing (rows and cols are dynamic axes of the graph).
+    opset : int
+        ONNX opset version.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to ONNX file.
+    """
+    ml_type = ml_type or ml_type_from_name(model_path)
+    onnx_path = Path(onnx_path) if onnx_path else onnx_model_path(model_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+
+    model = load_aitlas_model(ml_type, model_path)
+    module = model.model.to("cpu").eval()
+
+    if ml_type == "object detection":
+        graph = DetectionGraph(module)
+        example = torch.rand(3, tile_size, tile_size)
+        input_axes = {1: "rows", 2: "cols"}
+        output_names = ["boxes", "labels", "scores"]
+        output_axes = {name: {0: "detections"} for name in output_names}
+    else:
+        graph = SegmentationGraph(module)
+        example = torch.rand(1, 3, tile_size, tile_size)
+        input_axes = {0: "batch", 2: "rows", 3: "cols"}
+        output_names = ["probs"]
+        output_axes = {"probs": {0: "batch", 2: "rows", 3: "cols"}}
+
+    # Newer PyTorch defaults to the dynamo exporter, TorchScript exporter supports torchvision detection models
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            graph,
+            (example,),
+            onnx_path.as_posix(),
+            opset_version=opset,
+            input_names=["image"],
+            output_names=output_names,
+            dynamic_axes={"image": input_axes, **output_axes},
+            **extra
+        )
+
+    return onnx_path
+
+
+def _match_boxes(boxes_a, boxes_b):
+    """Largest difference of coordinates between each box in a and the closest box in b (inf if b is empty)."""
+    if len(boxes_a) == 0:
+        return 0.0
+    if len(boxes_b) == 0:
+        return float("inf")
+    diff = np.abs(boxes_a[:, np.newaxis, :] - boxes_b[np.newaxis, :, :]).max(axis=2)
+
+    return float(diff.min(axis=1).max())
+
+
+def check_parity(model_path, ml_type=None, images=None, tile_size=1024, atol=1e-3, box_atol=1.0):
+    """Compares outputs of the ONNX graph with the PyTorch model.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (the ONNX graph has to be exported).
+    ml_type : str
+        "object detection" or "segmentation", guessed from file name if None.
+    images : list
+        Tiles (bands, rows, cols) or paths to GeoTIFF tiles, random tiles are used if None.
+    tile_size : int
+        Size of random tiles.
+    atol : float
+        Tolerance for probabilities (segmentation) and scores (object detection).
+    box_atol : float
+        Tolerance for box coordinates in pixels.
+
+    Returns
+    -------
+    dict
+        "ok" - True if all outputs match, "max_prob_diff" or "max_box_diff"/"max_score_diff" and "count_diff".
+    """
+    ml_type = ml_type or ml_type_from_name(model_path)
+    torch_backend = TorchBackend(load_aitlas_model(ml_type, model_path))
+    onnx_backend = OnnxBackend(onnx_model_path(model_path))
+
+    if images is None:
+        rng = np.random.default_rng(0)
+        images = [rng.random((1, tile_size, tile_size), dtype=np.float32) for _ in range(2)]
+
+    results = {"tiles": 0, "shapes_ok": True}
+    for image in images:
+        if not isinstance(image, np.ndarray):
+            with rasterio.open(image) as src:
+                image = src.read()
+        results["tiles"] += 1
+
+        if ml_type == "object detection":
+            boxes_t, scores_t = torch_backend.detect(image)
+            boxes_o, scores_o = onnx_backend.detect(image)
+            results["shapes_ok"] &= boxes_o.ndim == 2 and boxes_o.shape[1] == 4 and len(boxes_o) == len(scores_o)
+            results["count_diff"] = max(results.get("count_diff", 0), abs(len(boxes_t) - len(boxes_o)))
+            results["max_box_diff"] = max(
+                results.get("max_box_diff", 0.0), _match_boxes(boxes_t, boxes_o), _match_boxes(boxes_o, boxes_t)
+            )
+            score_diff = abs(np.sort(scores_t)[::-1][:len(scores_o)] - np.sort(scores_o)[::-1][:len(scores_t)])
+            results["max_score_diff"] = max(
+                results.get("max_score_diff", 0.0), float(score_diff.max()) if score_diff.size else 0.0
+            )
+        else:
+            probs_t = torch_backend.segment(image)
+            probs_o = onnx_backend.segment(image)
+            results["shapes_ok"] &= probs_t.shape == probs_o.shape
+            if probs_t.shape == probs_o.shape:
+                results["max_prob_diff"] = max(
+                    results.get("max_prob_diff", 0.0), float(np.abs(probs_t - probs_o).max())
+                )
+
+    if ml_type == "object detection":
+        results["ok"] = (
+            results["shapes_ok"] and results["count_diff"] == 0
+            and results["max_box_diff"] <= box_atol and results["max_score_diff"] <= atol
+        )
+    else:
+        results["ok"] = results["shapes_ok"] and results.get("max_prob_diff", np.inf) <= atol
+
+    return results
+
+
+def export_all(models_dir=None, tile_size=1024, check=True):
+    """Exports all checkpoints (tar files) from models_dir (default is "ml_models" next to this script). Returns
+    dictionary with path to ONNX file and parity results for each checkpoint."""
+    models_dir = Path(models_dir) if models_dir else Path(__file__).resolve().parent / "ml_models"
+
+    out = {}
+    for model_path in sorted(models_dir.glob("*.tar")):
+        onnx_path = export_model(model_path, tile_size=tile_size)
+        out[model_path.name] = {"onnx_path": onnx_path}
+        if check:
+            out[model_path.name]["parity"] = check_parity(model_path, tile_size=tile_size)
+
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export ADAF checkpoints to ONNX and check parity with PyTorch.")
+    parser.add_argument("model_path", nargs="?", default=None, help="Checkpoint (tar), all shipped models if omitted.")
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default=None)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--tiles", nargs="*", default=None, help="GeoTIFF tiles for the parity check.")
+    parser.add_argument("--no-check", action="store_true")
+    args = parser.parse_args()
+
+    if args.model_path:
+        res = {"onnx_path": export_model(args.model_path, args.ml_type, tile_size=args.tile_size)}
+        if not args.no_check:
+            res["parity"] = check_parity(args.model_path, args.ml_type, images=args.tiles, tile_size=args.tile_size)
+        exported = {Path(args.model_path).name: res}
+    else:
+        exported = export_all(tile_size=args.tile_size, check=not args.no_check)
+
+    for name, res in exported.items():
+        print(f"{name} -> {res['onnx_path']}")
+        if "parity" in res:
+            print(f"  parity: {res['parity']}")
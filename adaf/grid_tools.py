@@ -148,6 +148,45 @@ def filter_by_outline(in_grid, outline_file, save_gpkg=False, save_path=None):
     return out_grid
 
 
+def parse_shard(shard):
+    """Shard as (index, number of shards) from "i/N" string or tuple, index is between 0 and N - 1."""
+    if isinstance(shard, str):
+        shard = tuple(int(part) for part in shard.split("/"))
+    index, nr_shards = shard
+    if nr_shards < 1 or not 0 <= index < nr_shards:
+        raise ValueError(f"Wrong shard '{index}/{nr_shards}': index has to be between 0 and {nr_shards - 1}!")
+
+    return index, nr_shards
+
+
+def shard_grid(in_grid, index, nr_shards):
+    """Selects one of nr_shards parts of the (filtered) grid, used to split one job between several machines.
+
+    Tiles are ordered by rows (top to bottom, left to right) and split into nr_shards contiguous parts of (almost) equal
+    size, so each shard is a compact band of rows and the result only depends on the grid. Every tile belongs to
+    exactly one shard. If there are fewer tiles than shards (e.g. small DEMs of a sharded batch), some shards are empty.
+
+    Parameters
+    ----------
+    in_grid : gpd.geodataframe.GeoDataFrame
+        Grid from filter_by_outline() (with minx, miny, maxx, maxy columns).
+    index : int
+        Index of the shard, 0 to nr_shards - 1.
+    nr_shards : int
+        Number of shards.
+
+    Returns
+    -------
+    gpd.geodataframe.GeoDataFrame
+        Tiles of the shard (tile_ID is kept, index is reset), can be empty.
+    """
+    index, nr_shards = parse_shard((index, nr_shards))
+    order = np.lexsort((in_grid["minx"].to_numpy(), -in_grid["maxy"].to_numpy()))
+    selected = np.array_split(order, nr_shards)[index]
+
+    return in_grid.iloc[np.sort(selected)].reset_index(drop=True)
+
+
 def poly_from_valid(tif_pth, save_gpkg=None):
     """Returns a polygon (GeoDataFrame) covering the valid pixels. Valid pixels are all non-NaN pixels.
 
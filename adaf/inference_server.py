@@ -0,0 +1,266 @@
+"""
+ADAF - local inference server
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Long-lived process that keeps ML models loaded and runs inference for several clients (notebooks, scripts, the batch
+runner) on the same workstation, so that every process doesn't load its own copy of the models and compete for cores.
+Clients connect with adaf_utils.RemoteBackend (or set ADAFInput.inference_server) over a Unix socket (by default
+~/.adaf/inference_server.sock, only accessible by the user) or localhost TCP. Connections (multiprocessing.connection)
+are authenticated with ADAF_SERVER_KEY or with a random key, which the server saves into ~/.adaf/inference_server.key
+(readable only by the user). Clients only send arrays, the server doesn't open files of clients.
+
+Requests for the same model are queued and run by one thread per model. When a request arrives, the thread waits up
+to max_wait_ms for more requests (from any client) and runs up to max_batch tiles together, segmentation tiles of the
+same shape go through the model in one forward pass, detection runs tile by tile (AiTLAS detection works on single
+images).
+
+Start the server (models are loaded on first request):
+    python -m adaf.inference_server --max-batch 8 --max-wait-ms 20
+Print statistics or stop it:
+    python -m adaf.inference_server --stats
+    python -m adaf.inference_server --stop
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from adaf.adaf_utils import ModelRegistry, server_address, server_authkey
+from adaf.resources import plan_resources
+
+
+class _Request:
+    """Single tile waiting for inference, the connection thread waits until it is done."""
+    def __init__(self, op, image):
+        self.op = op
+        self.image = image
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Batcher:
+    """Queue of requests for one model, run in batches by a single thread.
+
+    Parameters
+    ----------
+    backend
+        Inference backend (see adaf_utils.load_backend()).
+    max_batch : int
+        Maximum number of tiles in a batch.
+    max_wait_ms : float
+        Latency budget, how long the first request of a batch waits for more requests.
+    stats : dict
+        Counters shared by all batchers.
+    """
+    def __init__(self, backend, max_batch, max_wait_ms, stats):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats
+        self.queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, op, image):
+        """Adds tile to the queue and waits for the result."""
+        request = _Request(op, image)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch):
+        # Segmentation tiles of the same shape are run in one forward pass (if the backend supports batches)
+        groups = defaultdict(list)
+        for request in batch:
+            if request.op == "segment" and hasattr(self.backend, "segment_batch"):
+                groups[request.image.shape].append(request)
+            else:
+                groups[id(request)].append(request)
+
+        for requests in groups.values():
+            try:
+                if len(requests) > 1:
+                    results = self.backend.segment_batch([request.image for request in requests])
+                elif requests[0].op == "segment":
+                    results = [self.backend.segment(requests[0].image)]
+                else:
+                    results = [self.backend.detect(requests[0].image)]
+                for request, result in zip(requests, results):
+                    request.result = result
+            except Exception as err:
+                logging.exception("Inference failed")
+                for request in requests:
+                    request.error = err
+
+        self.stats["batches"] += 1
+        self.stats["tiles"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        for request in batch:
+            request.done.set()
+
+
+class InferenceServer:
+    """Inference server, see module docstring.
+
+    Parameters
+    ----------
+    address : str or tuple
+        Address to listen on (see adaf_utils.server_address()).
+    max_batch : int
+        Maximum number of tiles run together.
+    max_wait_ms : float
+        Latency budget for collecting a batch (milliseconds).
+    """
+    def __init__(self, address=None, max_batch=8, max_wait_ms=20):
+        self.address = server_address(address)
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.registry = ModelRegistry()
+        self.stats = {"clients": 0, "requests": 0, "errors": 0, "batches": 0, "tiles": 0, "max_batch": 0}
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _batcher(self, message):
+        key = (message["ml_type"], message["model_path"], message["backend"], message["precision"])
+        with self._lock:
+            if key not in self._batchers:
+                logging.info("Loading %s model %s (%s, %s)", *key)
+                backend = self.registry.get(*key)
+                self._batchers[key] = _Batcher(backend, self.max_batch, self.max_wait_ms, self.stats)
+
+            return self._batchers[key]
+
+    def statistics(self):
+        """Counters of the server, mean batch size and number of loaded models."""
+        batches = self.stats["batches"]
+
+        return {
+            **self.stats,
+            "mean_batch": self.stats["tiles"] / batches if batches else 0,
+            "models": len(self.registry)
+        }
+
+    def _reply(self, message):
+        op = message.get("op")
+        if op == "ping":
+            return "pong"
+        elif op == "stats":
+            return self.statistics()
+        elif op in ("detect", "segment"):
+            self.stats["requests"] += 1
+
+            return self._batcher(message).submit(op, message["image"])
+        else:
+            raise ValueError(f"Wrong request '{op}'!")
+
+    def _handle(self, conn):
+        self.stats["clients"] += 1
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    # Client disconnected
+                    break
+                if message.get("op") == "shutdown":
+                    conn.send({"result": "bye"})
+                    self.stop()
+                    break
+                try:
+                    conn.send({"result": self._reply(message)})
+                except Exception as err:
+                    self.stats["errors"] += 1
+                    conn.send({"error": f"{type(err).__name__}: {err}"})
+
+    def _prepare_socket(self):
+        """Folder of a Unix socket is only accessible by the user, a socket left by a killed server is removed."""
+        if isinstance(self.address, tuple) or self.address.startswith("\\\\"):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.address)), mode=0o700, exist_ok=True)
+        if os.path.exists(self.address):
+            try:
+                Client(self.address, authkey=server_authkey()).close()
+            except ConnectionRefusedError:
+                os.unlink(self.address)
+            else:
+                raise RuntimeError(f"Inference server is already running on {self.address}!")
+
+    def serve_forever(self):
+        """Accepts clients until stop() is called, every client is served by its own thread."""
+        authkey = server_authkey(create=True)
+        self._prepare_socket()
+        with Listener(self.address, authkey=authkey) as listener:
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.chmod(self.address, 0o600)
+            logging.info("ADAF inference server listening on %s", self.address)
+            while not self._stopped.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    # Failed handshake (e.g. wrong key)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def stop(self):
+        """Stops accepting clients (a dummy connection wakes up the listener)."""
+        self._stopped.set()
+        try:
+            Client(self.address, authkey=server_authkey()).close()
+        except OSError:
+            pass
+
+
+def server_call(op, address=None):
+    """Sends a control request ("ping", "stats" or "shutdown") to the server and returns the result."""
+    with Client(server_address(address), authkey=server_authkey()) as conn:
+        conn.send({"op": op})
+        reply = conn.recv()
+    if "error" in reply:
+        raise RuntimeError(f"Inference server: {reply['error']}")
+
+    return reply["result"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local ADAF inference server (keeps models loaded, batches tiles).")
+    parser.add_argument("--address", default=None, help="host:port or path to a Unix socket (default ~/.adaf).")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--cpus", type=int, default=None, help="Number of torch threads, see resources.py.")
+    parser.add_argument("--stats", action="store_true", help="Print statistics of a running server.")
+    parser.add_argument("--stop", action="store_true", help="Stop a running server.")
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(server_call("stats", args.address), indent=2))
+    elif args.stop:
+        server_call("shutdown", args.address)
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+        plan_resources(args.cpus).apply_torch()
+        InferenceServer(args.address, args.max_batch, args.max_wait_ms).serve_forever()
@@ -0,0 +1,276 @@
+"""
+ADAF - merging of shards
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+One ADAF job (e.g. a national DEM mosaic) can be split between several machines without a shared scheduler. Every
+node runs the same job with a different shard ("i/N", see grid_tools.shard_grid()), the filtered reference grid is
+split deterministically, so the shards don't overlap and together cover all tiles. Each shard is saved into its own
+results folder with a manifest (SHARD_FILE). The merge step combines vector files and raw predictions of all shards,
+detections of the same class from neighbouring shards that overlap or touch (an object cut by the shard boundary) are
+joined into one. Note that min_area and roundness filters are applied by each shard before merging.
+
+Run N shards locally as separate processes and merge them:
+    for i in 0 1 2; do python -m adaf dem.tif --config config.json --shard $i/3 --out-dir shards & done; wait
+    python -m adaf.merge_shards shards --out-dir merged
+"""
+import argparse
+import glob
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from adaf.adaf_utils import build_vrt_from_list
+
+# Manifest of a finished shard, saved into its results folder
+SHARD_FILE = "shard.json"
+
+
+def write_shard_manifest(save_dir, shard, dem_path, ml_type, vector_path, predictions_dirs=None):
+    """Saves manifest of a finished shard into its results folder (paths are relative to the folder).
+
+    Parameters
+    ----------
+    save_dir : str or pathlib.Path()
+        Results folder of the shard.
+    shard : tuple
+        (index, number of shards).
+    dem_path : str or pathlib.Path()
+        Input DEM (or visualisation).
+    ml_type : str
+        "object detection" or "segmentation".
+    vector_path : str
+        Path to vector file, empty string if nothing was detected.
+    predictions_dirs : dict
+        Optional - label and folder with raw predictions (if they were kept).
+
+    Returns
+    -------
+    pathlib.Path
+        Path to manifest.
+    """
+    save_dir = Path(save_dir)
+    manifest = {
+        "shard": shard[0],
+        "nr_shards": shard[1],
+        "dem_path": Path(dem_path).as_posix(),
+        "ml_type": ml_type,
+        "vector_file": Path(vector_path).name if vector_path else "",
+        "predictions": {label: Path(p_dir).name for label, p_dir in (predictions_dirs or {}).items()}
+    }
+    manifest_path = save_dir / SHARD_FILE
+    with open(manifest_path, "w") as dst:
+        json.dump(manifest, dst, indent=2)
+
+    return manifest_path
+
+
+def find_shards(inputs, allow_partial=False):
+    """Reads manifests of shards and checks that they belong to the same job and that all shards are present.
+
+    Parameters
+    ----------
+    inputs : list
+        Results folders of shards, folders containing them or glob patterns.
+    allow_partial : bool
+        If True, missing shards are only reported (merge of the finished part of the job).
+
+    Returns
+    -------
+    list
+        Manifests (dict, with "dir" added) ordered by index of shard.
+    """
+    manifest_paths = []
+    for item in inputs:
+        for match in sorted(glob.glob(str(item))) if glob.has_magic(str(item)) else [item]:
+            match = Path(match)
+            if (match / SHARD_FILE).is_file():
+                manifest_paths.append(match / SHARD_FILE)
+            elif match.is_dir():
+                manifest_paths += sorted(match.rglob(SHARD_FILE))
+            elif match.name == SHARD_FILE:
+                manifest_paths.append(match)
+
+    manifests = {}
+    for manifest_path in manifest_paths:
+        with open(manifest_path) as src:
+            manifest = json.load(src)
+        manifest["dir"] = manifest_path.parent
+        if manifest["shard"] in manifests:
+            raise ValueError(
+                f"Shard {manifest['shard']} found twice ({manifests[manifest['shard']]['dir']} and "
+                f"{manifest['dir']}), remove one of the results folders!"
+            )
+        manifests[manifest["shard"]] = manifest
+    if not manifests:
+        raise FileNotFoundError(f"No shards ({SHARD_FILE}) found in {[str(item) for item in inputs]}!")
+
+    manifests = [manifests[index] for index in sorted(manifests)]
+    for key in ("nr_shards", "ml_type"):
+        values = {manifest[key] for manifest in manifests}
+        if len(values) > 1:
+            raise ValueError(f"Shards belong to different jobs (different {key}: {sorted(values)})!")
+    if len({Path(manifest["dem_path"]).name for manifest in manifests}) > 1:
+        logging.warning("Shards were made from differently named inputs, make sure they belong to the same job!")
+
+    nr_shards = manifests[0]["nr_shards"]
+    missing = sorted(set(range(nr_shards)) - {manifest["shard"] for manifest in manifests})
+    if missing:
+        message = f"Missing shards {missing} of {nr_shards}!"
+        if not allow_partial:
+            raise ValueError(message)
+        logging.warning(message)
+
+    return manifests
+
+
+def join_across_shards(gdf, tolerance=0.0):
+    """Joins detections of the same label from different shards that overlap or touch (objects cut by the boundary
+    between shards). Detections within one shard are left as they are.
+
+    Parameters
+    ----------
+    gdf : gpd.GeoDataFrame
+        Detections of all shards with "label" and "shard" columns.
+    tolerance : float
+        Detections closer than tolerance (map units) are also joined, e.g. one pixel for boxes rounded to pixels.
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        Joined detections, score is the maximum score of joined parts.
+    """
+    if gdf.empty:
+        return gdf
+    gdf = gdf.reset_index(drop=True)
+
+    geometry = gdf.geometry.buffer(tolerance) if tolerance else gdf.geometry
+    left = gpd.GeoDataFrame({"label": gdf["label"], "shard": gdf["shard"]}, geometry=geometry, crs=gdf.crs)
+    pairs = gpd.sjoin(left, gdf[["label", "shard", "geometry"]], predicate="intersects")
+    pairs = pairs[(pairs["label_left"] == pairs["label_right"]) & (pairs["shard_left"] != pairs["shard_right"])]
+
+    # Connected groups of detections (union-find), the group is named by its first detection
+    parent = np.arange(len(gdf))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(pairs.index, pairs["index_right"]):
+        root_i, root_j = root(i), root(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    gdf["group"] = [root(i) for i in range(len(gdf))]
+    if gdf["group"].nunique() == len(gdf):
+        return gdf.drop(columns="group")
+
+    agg_func = {column: "first" for column in gdf.columns if column not in ("geometry", "group")}
+    if "score" in gdf.columns:
+        agg_func["score"] = "max"
+    joined = gdf.dissolve("group", aggfunc=agg_func).reset_index(drop=True)
+
+    # Attributes computed from geometry are updated for joined detections
+    if "area" in joined.columns:
+        joined["area"] = joined.geometry.area
+    if "roundness" in joined.columns:
+        joined["roundness"] = 4 * np.pi * joined.geometry.area / (joined.geometry.convex_hull.length ** 2)
+
+    return joined
+
+
+def merge_shards(inputs, out_dir, tolerance=0.0, allow_partial=False):
+    """Combines results of all shards of a job into one results folder.
+
+    Parameters
+    ----------
+    inputs : list
+        Results folders of shards, folders containing them or glob patterns.
+    out_dir : str or pathlib.Path()
+        Folder for merged results.
+    tolerance : float
+        See join_across_shards().
+    allow_partial : bool
+        Merge even if some shards are missing.
+
+    Returns
+    -------
+    dict
+        Summary of the merge, also saved as "merge_summary.json" into out_dir.
+    """
+    manifests = find_shards(inputs, allow_partial)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ml_type = manifests[0]["ml_type"]
+
+    # Vector files
+    vector_name = "object_detection.gpkg" if ml_type == "object detection" else "semantic_segmentation.gpkg"
+    parts = []
+    for manifest in manifests:
+        if manifest["vector_file"]:
+            gdf = gpd.read_file(manifest["dir"] / manifest["vector_file"])
+            gdf["shard"] = manifest["shard"]
+            parts.append(gdf)
+    detections = 0
+    vector_path = ""
+    if parts:
+        gdf = gpd.GeoDataFrame(pd.concat(parts, ignore_index=True), crs=parts[0].crs)
+        detections = len(gdf)
+        gdf = join_across_shards(gdf, tolerance).drop(columns="shard")
+        vector_path = out_dir / vector_name
+        gdf.to_file(vector_path.as_posix(), driver="GPKG")
+
+    # Raw predictions (tiles are named by their position in the grid, so shards don't share file names)
+    predictions = {}
+    sources = {}
+    for manifest in manifests:
+        for label, p_name in manifest["predictions"].items():
+            dst_dir = out_dir / p_name
+            dst_dir.mkdir(exist_ok=True)
+            for file in (manifest["dir"] / p_name).iterdir():
+                dst_path = dst_dir / file.name
+                if dst_path in sources:
+                    raise FileExistsError(
+                        f"Prediction {file.name} of shard {manifest['shard']} collides with {sources[dst_path]}!"
+                    )
+                shutil.copy2(file, dst_path)
+                sources[dst_path] = file
+            predictions[label] = dst_dir
+    if ml_type == "segmentation":
+        for label, p_dir in predictions.items():
+            tif_list = [file.as_posix() for file in sorted(p_dir.glob(f"*{label}*.tif"))]
+            build_vrt_from_list(tif_list, out_dir / (p_dir.name + ".vrt"))
+
+    summary = {
+        "shards": [manifest["shard"] for manifest in manifests],
+        "nr_shards": manifests[0]["nr_shards"],
+        "ml_type": ml_type,
+        "shard_dirs": [manifest["dir"].as_posix() for manifest in manifests],
+        "detections_in_shards": detections,
+        "detections": len(gdf) if parts else 0,
+        "vector_path": Path(vector_path).as_posix() if vector_path else "",
+        "predictions": {label: p_dir.as_posix() for label, p_dir in predictions.items()}
+    }
+    with open(out_dir / "merge_summary.json", "w") as dst:
+        json.dump(summary, dst, indent=2)
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge results of ADAF shards (see --shard of python -m adaf).")
+    parser.add_argument("inputs", nargs="+", help="Results folders of shards, their parent folder or glob patterns.")
+    parser.add_argument("--out-dir", required=True, help="Folder for merged results.")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Join detections closer than this (map units).")
+    parser.add_argument("--allow-partial", action="store_true", help="Merge even if some shards are missing.")
+    args = parser.parse_args()
+
+    res = merge_shards(args.inputs, args.out_dir, args.tolerance, args.allow_partial)
+    print(f"Merged {len(res['shards'])}/{res['nr_shards']} shards: {res['detections_in_shards']} detections -> "
+          f"{res['detections']} in {res['vector_path'] or 'no vector file (nothing detected)'}")
@@ -0,0 +1,222 @@
+"""
+ADAF - structured metrics
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Timing and throughput metrics of a run, written as JSON lines ("metrics.jsonl" next to "logfile.txt"). Every line is
+one event:
+    "run" - parameters of the run (first line),
+    "tile" - one task of a stage: start time, process and thread, wall and CPU time, time waiting in the queue of the
+    executor, bytes read and written by the worker (tiled stages), time of reading, inference and writing (inference),
+    "model" - loading of a model,
+    "stage" - totals of a stage: wall and CPU time and bytes read and written by the main process, number of tiles,
+    tiles per second and sums of tile metrics,
+    "run_end" - total time.
+
+Bytes read and written are I/O of the process as counted by the OS (including reads from page cache), they are only
+available on Linux and with psutil. CPU time of a tile is the CPU time of the worker process (or of the thread for
+serial and threaded executors). Start times and durations of tiles are enough to draw a timeline of the run (see
+trace.py).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from multiprocessing import parent_process
+from pathlib import Path
+
+# File with metrics, saved into the results folder
+METRICS_FILE = "metrics.jsonl"
+# Tile fields that are summed into the stage totals
+_SUMMED = ("wall_s", "cpu_s", "queue_s", "read_s", "infer_s", "write_s", "read_bytes", "write_bytes")
+
+
+def io_counters():
+    """(bytes read, bytes written) by this process, None if not available (/proc/self/io or psutil)."""
+    try:
+        with open("/proc/self/io") as src:
+            counters = dict(line.split(": ") for line in src.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+    except (ImportError, AttributeError):
+        return None
+
+    return getattr(counters, "read_chars", counters.read_bytes), getattr(counters, "write_chars", counters.write_bytes)
+
+
+def _io_delta(start, end):
+    if start is None or end is None:
+        return {}
+
+    return {"read_bytes": end[0] - start[0], "write_bytes": end[1] - start[1]}
+
+
+def timed_call(func, args, submitted):
+    """Runs func(*args) and measures it (used by executors.Executor.map() with metrics). Returns (result, metrics)."""
+    start = time.time()
+    # Worker processes measure the whole process, threads only themselves (I/O is only counted per process)
+    in_worker = parent_process() is not None
+    cpu_clock = time.process_time if in_worker else time.thread_time
+    cpu = cpu_clock()
+    io_start = io_counters() if in_worker else None
+
+    result = func(*args)
+
+    tile_metrics = {
+        "start": start,
+        "queue_s": max(start - submitted, 0.0),
+        "wall_s": time.time() - start,
+        "cpu_s": cpu_clock() - cpu,
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+        **_io_delta(io_start, io_counters() if in_worker else None)
+    }
+
+    return result, tile_metrics
+
+
+class Stage:
+    """Measures one stage of a run, see Metrics.stage(). Can be used as context manager or ended with end()."""
+    def __init__(self, metrics, name, **fields):
+        self.metrics = metrics
+        self.name = name
+        self.fields = fields
+        self.totals = {"tiles": 0}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._io = io_counters()
+
+    def add(self, **counts):
+        """Adds counts (e.g. skipped tiles) to the stage record."""
+        for key, value in counts.items():
+            self.totals[key] = self.totals.get(key, 0) + value
+
+    def end(self, **fields):
+        """Ends the stage and writes its record, returns the record."""
+        wall = time.perf_counter() - self._wall
+        record = {
+            "stage": self.name,
+            **self.fields,
+            **fields,
+            "wall_s": wall,
+            "cpu_s": time.process_time() - self._cpu,
+            **_io_delta(self._io, io_counters()),
+            **{f"tiles_{key}" if key in _SUMMED else key: value for key, value in self.totals.items()},
+            "tiles_per_s": self.totals["tiles"] / wall if wall > 0 else None
+        }
+        self.metrics.end_stage(self, record)
+
+        return record
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.end()
+
+
+class _NoStage:
+    """Stage of a run without metrics (all methods do nothing)."""
+    def add(self, **counts):
+        pass
+
+    def end(self, **fields):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class Metrics:
+    """Collects metrics of a run and writes them as JSON lines.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path()
+        Path of the JSON lines file (appended), None keeps records only in memory (self.records).
+    profiler : profiling.Profiler
+        Optional - tasks of executors (and blocks of code in profile()) are also profiled.
+    """
+    def __init__(self, path=None, profiler=None):
+        self.path = Path(path) if path else None
+        self.profiler = profiler
+        self.records = []
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a") if self.path else None
+
+    def emit(self, event, **fields):
+        """Writes one event, tile events are also added to the totals of the running stage with the same name."""
+        record = {"time": time.time(), "event": event, **fields}
+        with self._lock:
+            if event == "tile" and fields.get("stage") in self._stages:
+                stage = self._stages[fields["stage"]]
+                stage.add(tiles=1, **{key: fields[key] for key in _SUMMED if fields.get(key) is not None})
+            self.records.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, default=str) + "\n")
+
+    def tile(self, stage, start, **fields):
+        """Writes a tile event of a task that ran in this process, started at start (time.time())."""
+        fields.setdefault("wall_s", time.time() - start)
+        self.emit("tile", stage=stage, start=start, pid=os.getpid(), tid=threading.get_native_id(), **fields)
+
+    def stage(self, name, **fields):
+        """Starts a stage, tile events of the stage (same name) are summed into its record."""
+        stage = Stage(self, name, **fields)
+        with self._lock:
+            self._stages[name] = stage
+
+        return stage
+
+    def end_stage(self, stage, record):
+        with self._lock:
+            if self._stages.get(stage.name) is stage:
+                del self._stages[stage.name]
+        self.emit("stage", **record)
+        self.flush()
+
+    def add(self, stage, **counts):
+        """Adds counts to the running stage (if there is one)."""
+        with self._lock:
+            if stage in self._stages:
+                self._stages[stage].add(**counts)
+
+    def profile(self, stage):
+        """Context manager profiling a block of code in this process (does nothing without profiler)."""
+        if self.profiler is None:
+            return nullcontext()
+
+        return self.profiler.profile(stage)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def metrics_stage(metrics, name, **fields):
+    """Starts a stage on metrics, or returns a stage that does nothing if metrics is None."""
+    if metrics is None:
+        return _NoStage()
+
+    return metrics.stage(name, **fields)
+
+
+def load_metrics(path):
+    """Reads a metrics file into a list of events."""
+    with open(path) as src:
+        return [json.loads(line) for line in src if line.strip()]
@@ -0,0 +1,123 @@
+"""
+ADAF - profiling of a run
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Most of the work of a run is done by executor workers (see executors.py), which a profiler attached to the main
+process doesn't see. In profiling mode (main_routine(profile=True), ADAFInput.profile or --profile of python -m adaf)
+every task of a tiled stage runs under cProfile in its worker, statistics are sent back with the result and merged for
+each stage. Stages that run in the main process (inference, vectorisation of object detection) are profiled there.
+
+Results are saved into the results folder: "profile_<stage>.pstats" for each stage (open with pstats, snakeviz, ...)
+and "profile_report.txt" with functions of every stage sorted by cumulative time.
+
+Profiling slows down pure Python code. Inference in worker processes (inference_workers > 1) is not profiled, only
+waiting for the workers is. Python 3.12+ allows one active profiler per process, tasks are run without profiling if
+another one is already active (e.g. several tasks at the same time in the threads executor).
+"""
+import cProfile
+import io
+import pstats
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Report of a profiled run, saved into the results folder
+PROFILE_REPORT = "profile_report.txt"
+
+
+class _RawStats:
+    """Profile statistics (dict) received from a worker, in the form accepted by pstats.Stats."""
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profiled_call(func, args):
+    """Runs func(*args) under cProfile (used by executors.Executor.map() with a profiler). Returns (result, statistics),
+    statistics are None if another profiler is active in this process."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return func(*args), None
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+
+    return result, profiler.stats
+
+
+class Profiler:
+    """Merges profile statistics of tasks for each stage."""
+    def __init__(self):
+        self.stats = {}
+        self.tasks = {}
+        self.unprofiled = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, stats):
+        """Adds statistics of one task (see profiled_call()) to the stage."""
+        with self._lock:
+            if stats is None:
+                self.unprofiled[stage] = self.unprofiled.get(stage, 0) + 1
+                return
+            if stage in self.stats:
+                self.stats[stage].add(_RawStats(stats))
+            else:
+                self.stats[stage] = pstats.Stats(_RawStats(stats))
+            self.tasks[stage] = self.tasks.get(stage, 0) + 1
+
+    @contextmanager
+    def profile(self, stage):
+        """Profiles a block of code running in this process as one task of the stage."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self.add(stage, None)
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            self.add(stage, profiler.stats)
+
+    def write(self, out_dir, top=40, sort="cumulative"):
+        """Saves statistics of every stage ("profile_<stage>.pstats") and a report (PROFILE_REPORT) into out_dir.
+
+        Parameters
+        ----------
+        out_dir : str or pathlib.Path()
+            Results folder.
+        top : int
+            Number of functions of every stage in the report.
+        sort : str
+            Sort key of the report (see pstats.Stats.sort_stats()).
+
+        Returns
+        -------
+        pathlib.Path
+            Path to report.
+        """
+        out_dir = Path(out_dir)
+        report = io.StringIO()
+        for stage, stats in self.stats.items():
+            stats.dump_stats(out_dir / f"profile_{stage}.pstats")
+            header = f"{stage}: tasks profiled {self.tasks[stage]}"
+            if self.unprofiled.get(stage):
+                header += f", not profiled {self.unprofiled[stage]} (another profiler was active)"
+            report.write(f"{'=' * len(header)}\n{header}\n{'=' * len(header)}\n")
+            stats.stream = report
+            stats.sort_stats(sort).print_stats(top)
+        report_path = out_dir / PROFILE_REPORT
+        with open(report_path, "w") as dst:
+            dst.write(report.getvalue())
+
+        return report_path
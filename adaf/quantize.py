@@ -0,0 +1,195 @@
+"""
+ADAF - int8 quantisation of ML models for CPU inference
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Quantises ONNX graphs exported with export_onnx.py to int8 with ONNX Runtime. Static quantisation is calibrated on
+tiles of our own visualisations (SLRM), dynamic quantisation needs no calibration. Quantised graphs are saved next to
+the fp32 graphs ("ml_models/onnx/<checkpoint>.int8.onnx") and are used by the "onnx-int8" backend (see
+adaf_utils.load_backend()).
+
+Run from the repository root:
+    python -m adaf.quantize <path to tar file> --calibration <tiles folder or visualisation> --mode static
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+import adaf.grid_tools as gt
+from adaf.adaf_utils import (
+    DEFAULT_SKIP_RULES,
+    INT8_VARIANT,
+    TileFolder,
+    onnx_model_path,
+    read_tile_from_dataset,
+    skip_tile,
+    tile_file_name,
+    tile_statistics
+)
+from adaf.export_onnx import ml_type_from_name
+
+
+def calibration_tiles(source, nr_tiles=32, tile_size=1024):
+    """Selects tiles for calibration from a folder of tiles or from a visualisation raster.
+
+    Tiles are sampled evenly, only the sampled tiles are read. Empty and flat tiles are skipped (DEFAULT_SKIP_RULES),
+    the next tile after a skipped one is used instead (up to the next sampled tile).
+
+    Parameters
+    ----------
+    source : str or pathlib.Path()
+        Folder with tiles (GeoTIFF) or path to visualisation (GeoTIFF or VRT).
+    nr_tiles : int
+        Number of tiles for calibration.
+    tile_size : int
+        Tile size in pixels (only used if source is a raster).
+
+    Returns
+    -------
+    list
+        Tiles as arrays (bands, rows, cols).
+    """
+    source = Path(source)
+    if source.is_dir():
+        folder = TileFolder(source)
+        names = folder.file_names()
+        # Statistics saved with the tiles, empty tiles are skipped without reading them
+        stats = folder.stats
+
+        def read(i):
+            with rasterio.open(source / names[i]) as src:
+                return src.read()
+    else:
+        # Same grid as in adaf_inference.run_tiling()
+        valid_data_outline, _ = gt.poly_from_valid(source.as_posix())
+        tiles_extents = gt.bounding_grid(source.as_posix(), tile_size, tag=False)
+        tiles_extents = gt.filter_by_outline(tiles_extents, valid_data_outline)
+        extents = tiles_extents[["minx", "miny", "maxx", "maxy"]].values.tolist()
+        names = [tile_file_name(bounds, source.stem) for bounds in extents]
+        stats = {}
+
+        def read(i):
+            with rasterio.open(source) as src:
+                return read_tile_from_dataset(src, extents[i], out_nodata=0)[0]
+
+    if not names:
+        return []
+    # Start of every sampled part of the grid, tiles are searched from the start to the end of the part
+    starts = np.unique(np.linspace(0, len(names), min(nr_tiles, len(names)), endpoint=False).astype(int))
+    ends = np.append(starts[1:], len(names))
+    images = []
+    for start, end in zip(starts, ends):
+        for i in range(start, end):
+            if names[i] in stats and skip_tile(stats[names[i]], DEFAULT_SKIP_RULES):
+                continue
+            image = read(i)
+            if not skip_tile(tile_statistics(image), DEFAULT_SKIP_RULES):
+                images.append(image)
+                break
+
+    return images
+
+
+class _TilesReader:
+    """Calibration data reader for ONNX Runtime (feeds tiles one by one)."""
+    def __init__(self, images, input_name, batched):
+        self.input_name = input_name
+        self.batched = batched
+        self._images = iter(images)
+
+    def get_next(self):
+        image = next(self._images, None)
+        if image is None:
+            return None
+        if image.shape[0] == 1:
+            image = np.repeat(image, 3, axis=0)
+        image = np.ascontiguousarray(image, dtype=np.float32)
+
+        return {self.input_name: image[np.newaxis] if self.batched else image}
+
+    def rewind(self):
+        # Not needed for a single calibration pass
+        pass
+
+
+def quantize_model(model_path, mode="static", calibration=None, nr_tiles=32, ml_type=None):
+    """Quantises the exported ONNX graph of a checkpoint to int8.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file), the ONNX graph has to be exported (see export_onnx.py).
+    mode : str
+        "static" (weights and activations, calibrated on tiles) or "dynamic" (weights only, activations are quantised
+        on the fly).
+    calibration : str or pathlib.Path() or list
+        Folder with tiles, visualisation raster or list of tiles (arrays), required for static mode.
+    nr_tiles : int
+        Number of tiles for calibration.
+    ml_type : str
+        "object detection" or "segmentation", guessed from file name if None.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to quantised ONNX graph.
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quant_pre_process, quantize_dynamic, quantize_static
+
+    ml_type = ml_type or ml_type_from_name(model_path)
+    fp32_path = onnx_model_path(model_path)
+    int8_path = onnx_model_path(model_path, INT8_VARIANT)
+    if not fp32_path.is_file():
+        raise FileNotFoundError(f"No ONNX graph for {Path(model_path).name}, run export_onnx.py first!")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference and graph optimisation before quantisation (symbolic shape inference doesn't support the
+        # data-dependent shapes of the detection graph)
+        pre_path = Path(tmp_dir) / "preprocessed.onnx"
+        quant_pre_process(
+            fp32_path.as_posix(), pre_path.as_posix(), skip_symbolic_shape=ml_type == "object detection"
+        )
+
+        if mode == "dynamic":
+            quantize_dynamic(
+                pre_path.as_posix(),
+                int8_path.as_posix(),
+                weight_type=QuantType.QInt8,
+                per_channel=True
+            )
+        elif mode == "static":
+            if calibration is None:
+                raise ValueError("Static quantisation requires calibration tiles!")
+            images = calibration if isinstance(calibration, list) else calibration_tiles(calibration, nr_tiles)
+            # Detection graph takes a single image (bands, rows, cols), segmentation graph takes a batch
+            reader = _TilesReader(images, "image", batched=ml_type == "segmentation")
+            quantize_static(
+                pre_path.as_posix(),
+                int8_path.as_posix(),
+                reader,
+                quant_format=QuantFormat.QDQ,
+                op_types_to_quantize=["Conv", "MatMul", "Gemm"],
+                per_channel=True,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8
+            )
+        else:
+            raise ValueError(f"Wrong mode '{mode}': choose 'static' or 'dynamic'!")
+
+    return int8_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantise exported ADAF models to int8 (ONNX Runtime).")
+    parser.add_argument("model_path", help="Path to AiTLAS checkpoint (tar file), exported with export_onnx.py.")
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--calibration", default=None, help="Folder with tiles or visualisation raster.")
+    parser.add_argument("--nr-tiles", type=int, default=32)
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default=None)
+    args = parser.parse_args()
+
+    out_path = quantize_model(args.model_path, args.mode, args.calibration, args.nr_tiles, args.ml_type)
+    print(f"Saved: {out_path}")
@@ -0,0 +1,283 @@
+"""
+ADAF - CPU and memory budget
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+One place that decides how many cores (and optionally how much memory) each stage of ADAF gets: worker processes for
+visualisations (RVT), threads for tiling, worker processes and torch threads for inference and worker processes for
+vectorisation. Stages run one after another, each stage gets the whole budget, inference splits it between workers
+(workers x torch threads = cores). Number of workers is also limited by memory, the budget is the available RAM
+unless it is set, and the visualisation and tiling stages check their per-worker estimate (see vis_worker_mb()) again
+before starting the pool. Peak RSS of every stage is recorded with PeakMemory.
+
+The budget is all cores available to the process minus two (as before), it can be overridden with ADAFInput.cpus and
+ADAFInput.memory_mb or with environment variables ADAF_CPUS and ADAF_MEMORY_MB (e.g. when several runs share a node).
+
+Print the allocation for this machine:
+    python -m adaf.resources --cpus 16 --inference-workers 4
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+import torch
+
+# Cores left for the system and other processes when the budget is not set
+RESERVED_CPUS = 2
+# Rough peak memory of a single worker, used to limit the number of workers by the memory budget
+VIS_WORKER_MB = 1024
+INFERENCE_WORKER_MB = 3072
+VECTOR_WORKER_MB = 512
+# Memory of an idle worker process (Python, numpy, rasterio and torch imported)
+WORKER_BASE_MB = 300
+# Part of the available memory that workers may use
+MEMORY_HEADROOM = 0.8
+
+
+def available_cpus():
+    """Number of cores the process may use (respects CPU affinity, e.g. taskset or cgroup cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on Windows and macOS
+        return os.cpu_count() or 1
+
+
+def available_memory_mb():
+    """Memory available for new processes in MB (psutil or /proc/meminfo), None if it can't be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 1024 ** 2
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def vis_worker_mb(tile_px, buffer_px=0, dtype="float32", copies=6):
+    """Estimated peak memory (MB) of a worker processing one tile.
+
+    Parameters
+    ----------
+    tile_px : int
+        Size of the tile in pixels (rows = cols).
+    buffer_px : int
+        Buffer around the tile in pixels (e.g. SLRM radius).
+    dtype : str
+        Data type of arrays.
+    copies : int
+        Number of full-size arrays held at once (SLRM keeps the DEM, NaN mask, summed-area table, mean and result,
+        only clipping a tile needs about 3).
+
+    Returns
+    -------
+    float
+    """
+    side = tile_px + 2 * buffer_px
+
+    return WORKER_BASE_MB + side * side * np.dtype(dtype).itemsize * copies / 1024 ** 2
+
+
+def workers_for_memory(nr_workers, worker_mb, memory_mb=None):
+    """Limits number of workers, so that their estimated memory fits into memory_mb (by default the part of the
+    available memory given by MEMORY_HEADROOM). Returns at least 1."""
+    if memory_mb is None:
+        available = available_memory_mb()
+        if available is None:
+            return nr_workers
+        memory_mb = available * MEMORY_HEADROOM
+
+    return max(min(nr_workers, int(memory_mb // worker_mb)), 1)
+
+
+class PeakMemory:
+    """Records peak RSS (MB) of a stage, used as a context manager or with start() and stop().
+
+    With psutil, RSS of the process and its children (pool workers) is sampled in a background thread, "peak_mb" is the
+    largest total. Without psutil, the peak of the main process and of the largest terminated child so far are used
+    (resource module, Linux and macOS).
+    """
+    def __init__(self, stage, interval=0.2):
+        self.stage = stage
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self, process):
+        import psutil
+        while not self._stop.is_set():
+            try:
+                rss = process.memory_info().rss
+                for child in process.children(recursive=True):
+                    try:
+                        rss += child.memory_info().rss
+                    except psutil.Error:
+                        # Child already finished
+                        pass
+            except psutil.Error:
+                break
+            self.peak_mb = max(self.peak_mb or 0, rss / 1024 ** 2)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts recording."""
+        try:
+            import psutil
+        except ImportError:
+            return self
+        self._thread = threading.Thread(target=self._sample, args=(psutil.Process(),), daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Stops recording, the result is in self.peak_mb."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        else:
+            peaks = [mb for mb in (peak_rss_mb(), peak_rss_mb(children=True)) if mb is not None]
+            self.peak_mb = sum(peaks) if peaks else None
+
+        return self.peak_mb
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def summary(self):
+        """Text for the log file."""
+        peak = f"{self.peak_mb:.0f} MB" if self.peak_mb is not None else "unknown"
+
+        return f"Peak memory ({self.stage}): {peak}"
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size (memory) in MB of the current process or of its largest terminated child process.
+
+    Uses the resource module (Linux, macOS), on Windows psutil is required for the current process. Returns None if
+    it can't be determined.
+    """
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        divisor = 1024 ** 2 if sys.platform == "darwin" else 1024
+        return usage.ru_maxrss / divisor
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    if children:
+        return None
+    mem = psutil.Process().memory_info()
+    return getattr(mem, "peak_wset", mem.rss) / 1024 ** 2
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+class ResourcePlan:
+    """Allocation of cores (and memory) to the stages of ADAF, see plan_resources()."""
+    def __init__(self, cpus, memory_mb, vis_workers, tiling_threads, inference_workers, torch_threads,
+                 torch_interop_threads, vector_workers):
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.vis_workers = vis_workers
+        self.tiling_threads = tiling_threads
+        self.inference_workers = inference_workers
+        self.torch_threads = torch_threads
+        self.torch_interop_threads = torch_interop_threads
+        self.vector_workers = vector_workers
+
+    def apply_torch(self):
+        """Sets torch thread pools of this process (used when inference runs in the main process)."""
+        torch.set_num_threads(self.torch_threads)
+        try:
+            torch.set_num_interop_threads(self.torch_interop_threads)
+        except RuntimeError:
+            # Inter-op pool can only be set before the first parallel work of the process
+            logging.debug("Torch inter-op threads already set to %d", torch.get_num_interop_threads())
+
+    def summary(self):
+        """Text with the final allocation, used for the log file."""
+        memory = f"{self.memory_mb} MB" if self.memory_mb else "unknown"
+
+        return (
+            f"Resources: {self.cpus} cores, memory {memory} | visualisations {self.vis_workers} processes, "
+            f"tiling {self.tiling_threads} threads, inference {self.inference_workers} x {self.torch_threads} torch "
+            f"threads ({self.torch_interop_threads} inter-op), vectorisation {self.vector_workers} processes"
+        )
+
+
+def plan_resources(cpus=None, memory_mb=None, inference_workers=None, torch_threads=None):
+    """Assigns cores (and memory) to the stages of ADAF.
+
+    Parameters
+    ----------
+    cpus : int
+        Number of cores for ADAF, by default ADAF_CPUS or all available cores minus RESERVED_CPUS.
+    memory_mb : int
+        Optional - memory budget, limits number of worker processes (by default ADAF_MEMORY_MB or the part of
+        available memory given by MEMORY_HEADROOM).
+    inference_workers : int
+        Number of inference worker processes (see adaf_utils.predict_in_workers()), 1 runs inference in the main
+        process.
+    torch_threads : int
+        Number of torch threads per inference worker, by default cores are split evenly between workers.
+
+    Returns
+    -------
+    ResourcePlan
+    """
+    cpus = cpus or _env_int("ADAF_CPUS") or max(available_cpus() - RESERVED_CPUS, 1)
+    memory_mb = memory_mb or _env_int("ADAF_MEMORY_MB")
+    if memory_mb is None:
+        available = available_memory_mb()
+        memory_mb = int(available * MEMORY_HEADROOM) if available is not None else None
+
+    inference_workers = workers_for_memory(min(inference_workers or 1, cpus), INFERENCE_WORKER_MB, memory_mb)
+    torch_threads = torch_threads or max(cpus // inference_workers, 1)
+
+    return ResourcePlan(
+        cpus=cpus,
+        memory_mb=memory_mb,
+        vis_workers=workers_for_memory(cpus, VIS_WORKER_MB, memory_mb),
+        # Tiling threads mostly wait for disk, they share the memory of the main process
+        tiling_threads=cpus,
+        inference_workers=inference_workers,
+        torch_threads=torch_threads,
+        # Models run one tile at a time, inter-op parallelism only competes with intra-op threads
+        torch_interop_threads=1,
+        vector_workers=workers_for_memory(cpus, VECTOR_WORKER_MB, memory_mb)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print allocation of cores and memory to ADAF stages.")
+    parser.add_argument("--cpus", type=int, default=None)
+    parser.add_argument("--memory-mb", type=int, default=None)
+    parser.add_argument("--inference-workers", type=int, default=None)
+    parser.add_argument("--torch-threads", type=int, default=None)
+    args = parser.parse_args()
+
+    print(plan_resources(args.cpus, args.memory_mb, args.inference_workers, args.torch_threads).summary())
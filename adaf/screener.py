@@ -0,0 +1,316 @@
+"""
+ADAF - tile screener
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+A light tile-level classifier (gradient boosting on SLRM texture features), used as the first stage of a cascade. Only
+tiles that the screener marks as possible archaeology are passed on to the full ML models (FasterRCNN/HRNet).
+
+The screener is trained on patches from create_patches.py (positives) and on tiles of areas without archaeology
+(negatives), because create_patches only creates patches that contain labeled objects.
+"""
+from pathlib import Path
+
+import joblib
+import numpy as np
+import rasterio
+
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+except ImportError:
+    # scikit-learn < 1.0
+    from sklearn.experimental import enable_hist_gradient_boosting  # noqa: F401
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+# Order of features returned by texture_features()
+FEATURE_NAMES = [
+    "valid_fraction",
+    "mean",
+    "std",
+    "p05",
+    "p50",
+    "p95",
+    "low_fraction",
+    "high_fraction",
+    "grad_mean",
+    "grad_std",
+    "grad_p95",
+    "laplace_mean",
+    "block16_std_mean",
+    "block16_std_p95",
+    "block64_std_mean",
+    "block64_std_p95"
+]
+
+
+def _block_std(image, block):
+    """Standard deviation of pixels in non-overlapping blocks (NaNs are ignored). Returns 1D array of valid blocks."""
+    h = image.shape[0] // block * block
+    w = image.shape[1] // block * block
+    if h == 0 or w == 0:
+        return np.zeros(1, dtype=image.dtype)
+    blocks = image[:h, :w].reshape(h // block, block, w // block, block)
+    valid = ~np.isnan(blocks)
+    counts = valid.sum(axis=(1, 3))
+    # Blocks without valid pixels are excluded
+    filled = np.where(valid, blocks, 0)
+    mean = filled.sum(axis=(1, 3)) / np.maximum(counts, 1)
+    var = (filled ** 2).sum(axis=(1, 3)) / np.maximum(counts, 1) - mean ** 2
+    std = np.sqrt(np.maximum(var[counts > 0], 0))
+
+    return std if std.size else np.zeros(1, dtype=image.dtype)
+
+
+def texture_features(image):
+    """Computes texture features of a SLRM tile (normalised to 0-1, nodata 0), see FEATURE_NAMES.
+
+    All features are per-pixel statistics, so they don't depend on the tile size (training patches are 512 px,
+    inference tiles are 1024 px).
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Visualisation tile, 2D array or 3D array (only the first band is used).
+
+    Returns
+    -------
+    np.ndarray
+        1D array of features (float32).
+    """
+    if image.ndim == 3:
+        image = image[0]
+    image = image.astype(np.float32)
+    valid = image != 0
+    valid_fraction = valid.mean()
+    if not valid.any():
+        return np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+
+    values = image[valid]
+    p05, p50, p95 = np.percentile(values, [5, 50, 95])
+
+    # Nodata is set to NaN for neighbourhood features
+    image = np.where(valid, image, np.nan)
+
+    gy, gx = np.gradient(image)
+    grad = np.hypot(gx, gy)
+    grad = grad[~np.isnan(grad)]
+    if grad.size == 0:
+        grad = np.zeros(1, dtype=np.float32)
+
+    laplace = np.abs(
+        4 * image[1:-1, 1:-1] - image[:-2, 1:-1] - image[2:, 1:-1] - image[1:-1, :-2] - image[1:-1, 2:]
+    )
+    laplace = laplace[~np.isnan(laplace)]
+
+    block16 = _block_std(image, 16)
+    block64 = _block_std(image, 64)
+
+    features = [
+        valid_fraction,
+        values.mean(),
+        values.std(),
+        p05,
+        p50,
+        p95,
+        (values < 0.4).mean(),  # SLRM is 0.5 on flat terrain (after normalisation)
+        (values > 0.6).mean(),
+        grad.mean(),
+        grad.std(),
+        np.percentile(grad, 95),
+        laplace.mean() if laplace.size else 0,
+        block16.mean(),
+        np.percentile(block16, 95),
+        block64.mean(),
+        np.percentile(block64, 95)
+    ]
+
+    return np.array(features, dtype=np.float32)
+
+
+def threshold_for_recall(probabilities, targets, recall=0.98):
+    """Highest threshold at which at least the given fraction of positive tiles is kept (probability >= threshold)."""
+    pos = np.sort(np.asarray(probabilities)[np.asarray(targets) == 1])
+    if pos.size == 0:
+        return 0.0
+    # Number of positives that may be dropped
+    n_drop = int(np.floor((1 - recall) * pos.size))
+
+    return float(pos[n_drop])
+
+
+class TileScreener:
+    """Tile-level classifier, decides which tiles are passed on to the full ML model.
+
+    Parameters
+    ----------
+    threshold : float
+        Tiles with probability of archaeology below threshold are skipped. Use threshold_for_recall() (or fit() with
+        recall) to set it from labeled data.
+    model : sklearn classifier
+        Optional - fitted classifier with predict_proba(), by default a HistGradientBoostingClassifier is fitted.
+    label : str
+        Label the screener was trained for (None if trained for any archaeology).
+    calibration_recall : float
+        Recall of positives at threshold on out-of-fold probabilities (set by fit()), None if threshold was set by hand.
+    """
+    def __init__(self, threshold=0.5, model=None, label=None, calibration_recall=None):
+        self.threshold = threshold
+        self.model = model
+        self.label = label
+        self.calibration_recall = calibration_recall
+
+    def fit(self, features, targets, recall=0.98, folds=5, **kwargs):
+        """Fits the classifier and sets threshold, so that at least recall fraction of positives is kept. Keyword
+        arguments are passed to HistGradientBoostingClassifier.
+
+        Probabilities of the training rows are overfit (positives get probabilities close to 1), so the threshold is
+        set from out-of-fold probabilities (cross-validation with folds folds), which behave like probabilities of new
+        tiles. The final model is fitted on all rows.
+        """
+        params = {"max_iter": 200, "learning_rate": 0.1, "max_leaf_nodes": 15}
+        params.update(kwargs)
+        features = np.asarray(features)
+        targets = np.asarray(targets)
+        self.model = HistGradientBoostingClassifier(**params)
+        if recall is not None:
+            folds = min(folds, np.bincount(targets, minlength=2).min())
+            if folds < 2:
+                raise ValueError("At least 2 positive and 2 negative tiles are needed to set the threshold!")
+            cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+            oof = cross_val_predict(self.model, features, targets, cv=cv, method="predict_proba")[:, 1]
+            self.threshold = threshold_for_recall(oof, targets, recall)
+            self.calibration_recall = float(np.mean(oof[targets == 1] >= self.threshold))
+        self.model.fit(features, targets)
+
+        return self
+
+    def predict_proba(self, features):
+        """Probability of archaeology for every row of features."""
+        return self.model.predict_proba(np.atleast_2d(features))[:, 1]
+
+    def keep(self, image):
+        """Returns True if the tile should be passed on to the full ML model."""
+        return bool(self.predict_proba(texture_features(image))[0] >= self.threshold)
+
+    def save(self, path):
+        """Saves the screener (model, threshold, label and calibration recall) to file."""
+        joblib.dump(
+            {
+                "model": self.model,
+                "threshold": self.threshold,
+                "label": self.label,
+                "calibration_recall": self.calibration_recall
+            },
+            path
+        )
+
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Loads the screener saved with save()."""
+        params = joblib.load(path)
+
+        return cls(
+            threshold=params["threshold"],
+            model=params["model"],
+            label=params["label"],
+            calibration_recall=params.get("calibration_recall")
+        )
+
+
+def load_screeners(screener):
+    """Prepares screeners for run_aitlas_*. Accepts a TileScreener, path to saved screener or a dictionary of them
+    (key is label). Returns None, TileScreener or dictionary of TileScreener."""
+    if screener is None or isinstance(screener, TileScreener):
+        return screener
+    if isinstance(screener, dict):
+        return {label: load_screeners(one) for label, one in screener.items()}
+
+    return TileScreener.load(screener)
+
+
+def patches_dataset(patches_dir, negatives_dir=None, label=None):
+    """Prepares features and targets from patches created by create_patches.py.
+
+    Parameters
+    ----------
+    patches_dir : str or pathlib.Path()
+        Output directory of create_patches_main() (contains "images" and "labelTxt" folders).
+    negatives_dir : str or pathlib.Path()
+        Optional - folder with tiles (GeoTIFF) without archaeology, used as negatives.
+    label : str
+        Optional - only patches containing this label are positives (other patches are negatives). If None, all patches
+        are positives.
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray, list)
+        Features (one row per tile), targets (1 = archaeology) and paths of tiles.
+    """
+    patches_dir = Path(patches_dir)
+
+    features = []
+    targets = []
+    paths = []
+    for image_path in sorted((patches_dir / "images").glob("*.tif")):
+        label_path = patches_dir / "labelTxt" / image_path.name.replace("__images.tif", "__labelTxt.txt")
+        if label is None:
+            target = 1
+        else:
+            with open(label_path) as src:
+                # labelTxt: <x1> <y1> <x2> <y2> <x3> <y3> <x4> <y4> <label> <DFM>
+                target = int(any(line.split()[8] == label for line in src if line.strip()))
+
+        with rasterio.open(image_path) as src:
+            features.append(texture_features(src.read(1)))
+        targets.append(target)
+        paths.append(image_path)
+
+    if negatives_dir:
+        for image_path in sorted(Path(negatives_dir).glob("*.tif")):
+            with rasterio.open(image_path) as src:
+                features.append(texture_features(src.read(1)))
+            targets.append(0)
+            paths.append(image_path)
+
+    return np.array(features, dtype=np.float32), np.array(targets), paths
+
+
+def train_screener(patches_dir, negatives_dir, save_path, label=None, recall=0.98):
+    """Trains a TileScreener on patches from create_patches.py and negative tiles, and saves it.
+
+    Parameters
+    ----------
+    patches_dir : str or pathlib.Path()
+        Output directory of create_patches_main().
+    negatives_dir : str or pathlib.Path()
+        Folder with tiles without archaeology.
+    save_path : str or pathlib.Path()
+        Path to output file.
+    label : str
+        Optional - train screener for a single label.
+    recall : float
+        Fraction of positive tiles that have to be passed on to the full model (sets the threshold).
+
+    Returns
+    -------
+    TileScreener
+        Trained screener.
+    """
+    features, targets, _ = patches_dataset(patches_dir, negatives_dir, label)
+    screener = TileScreener(label=label).fit(features, targets, recall=recall)
+    screener.save(save_path)
+
+    return screener
+
+
+if __name__ == "__main__":
+    # Patches from create_patches.py and tiles of an area without archaeology
+    patches = r"../test_data/training_samples"
+    negatives = r"../test_data/no_archaeology/slrm"
+
+    my_screener = train_screener(patches, negatives, r"../test_data/screener_any.joblib", recall=0.98)
+    print("Threshold:", my_screener.threshold, "calibration recall:", my_screener.calibration_recall)
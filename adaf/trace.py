@@ -0,0 +1,134 @@
+"""
+ADAF - timeline of a run
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Converts metrics of a run (metrics.jsonl, see metrics.py) to Chrome Trace Event format, which can be opened in
+chrome://tracing or https://ui.perfetto.dev. Every tile is drawn on the track of the process and thread that ran it,
+with reading, inference and writing of inference tiles nested inside, stages and loading of models are drawn on their
+own tracks. Idle workers, stragglers and gaps between stages are visible on the timeline.
+
+Set ADAFInput.trace (or run python -m adaf with --trace) to save "trace.json" into the results folder, or convert
+metrics of an existing run:
+    python -m adaf.trace results/dem_20261019_101010_seg/metrics.jsonl
+"""
+import argparse
+import json
+from pathlib import Path
+
+from adaf.metrics import load_metrics
+
+# Trace file, saved into the results folder
+TRACE_FILE = "trace.json"
+# Track (pid) of stages and models
+_RUN_PID = 0
+# Parts of inference tiles, drawn inside the tile
+_TILE_PARTS = ("read_s", "infer_s", "write_s")
+
+
+def _us(seconds):
+    """Seconds to microseconds (unit of trace events)."""
+    return round(seconds * 1e6, 1)
+
+
+def chrome_trace(events):
+    """Converts metrics events to trace events.
+
+    Parameters
+    ----------
+    events : list
+        Events of a run (see metrics.load_metrics()).
+
+    Returns
+    -------
+    list
+        Trace events ("X" complete events and "M" metadata naming processes and threads).
+    """
+    # Start and end (time.time()) of timed events
+    spans = []
+    for event in events:
+        if event["event"] == "tile" and "start" in event:
+            spans.append((event["start"], event["wall_s"], event))
+        elif event["event"] == "stage":
+            spans.append((event["time"] - event["wall_s"], event["wall_s"], event))
+        elif event["event"] == "model":
+            spans.append((event["time"] - event["load_s"], event["load_s"], event))
+    if not spans:
+        return []
+
+    t0 = min(start for start, _, _ in spans)
+    main_pid = next((event.get("pid") for event in events if event["event"] == "run"), None)
+    trace = [
+        {"ph": "M", "name": "process_name", "pid": _RUN_PID, "args": {"name": "ADAF run"}},
+        {"ph": "M", "name": "process_sort_index", "pid": _RUN_PID, "args": {"sort_index": -1}},
+        {"ph": "M", "name": "thread_name", "pid": _RUN_PID, "tid": 0, "args": {"name": "stages"}},
+        {"ph": "M", "name": "thread_name", "pid": _RUN_PID, "tid": 1, "args": {"name": "models"}}
+    ]
+    processes = set()
+    for start, duration, event in spans:
+        args = {key: value for key, value in event.items() if key not in ("time", "event", "start", "pid", "tid")}
+        if event["event"] == "stage":
+            trace.append({
+                "ph": "X", "name": event["stage"], "cat": "stage", "pid": _RUN_PID, "tid": 0,
+                "ts": _us(start - t0), "dur": _us(duration), "args": args
+            })
+        elif event["event"] == "model":
+            trace.append({
+                "ph": "X", "name": f"load {event['label']}", "cat": "model", "pid": _RUN_PID, "tid": 1,
+                "ts": _us(start - t0), "dur": _us(duration), "args": args
+            })
+        else:
+            pid, tid = event["pid"], event.get("tid", event["pid"])
+            processes.add(pid)
+            name = event.get("tile", event.get("task"))
+            trace.append({
+                "ph": "X", "name": f"{event['stage']} {name}", "cat": event["stage"], "pid": pid, "tid": tid,
+                "ts": _us(start - t0), "dur": _us(duration), "args": args
+            })
+            # Reading, inference and writing follow one another inside the tile
+            part_start = start
+            for part in _TILE_PARTS:
+                if event.get(part) is not None:
+                    trace.append({
+                        "ph": "X", "name": part[:-2], "cat": event["stage"], "pid": pid, "tid": tid,
+                        "ts": _us(part_start - t0), "dur": _us(event[part])
+                    })
+                    part_start += event[part]
+
+    for pid in sorted(processes):
+        name = "main process" if pid == main_pid else f"worker {pid}"
+        trace.append({"ph": "M", "name": "process_name", "pid": pid, "args": {"name": name}})
+
+    return trace
+
+
+def write_trace(metrics_path, trace_path=None):
+    """Saves timeline of a run in Chrome Trace Event format.
+
+    Parameters
+    ----------
+    metrics_path : str or pathlib.Path()
+        Metrics of the run (JSON lines, see metrics.py).
+    trace_path : str or pathlib.Path()
+        Optional - output file, by default TRACE_FILE next to metrics.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to trace file.
+    """
+    metrics_path = Path(metrics_path)
+    trace_path = Path(trace_path) if trace_path else metrics_path.parent / TRACE_FILE
+    with open(trace_path, "w") as dst:
+        json.dump({"traceEvents": chrome_trace(load_metrics(metrics_path)), "displayTimeUnit": "ms"}, dst)
+
+    return trace_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ADAF metrics (metrics.jsonl) to Chrome Trace Event format.")
+    parser.add_argument("metrics_path", help="Path to metrics.jsonl of a run.")
+    parser.add_argument("-o", "--output", default=None, help=f"Output file, by default {TRACE_FILE} next to metrics.")
+    args = parser.parse_args()
+
+    print(f"Trace: {write_trace(args.metrics_path, args.output)}")
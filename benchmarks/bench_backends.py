@@ -0,0 +1,166 @@
+"""
+ADAF - inference backends benchmark
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Compares throughput (tiles per second) of inference backends (see adaf_utils.load_backend()) on the same tiles, and
+the difference of their outputs from the PyTorch backend. PyTorch backend in reduced precision is selected with
+"torch-bf16" (parity check of bfloat16 autocast against fp32).
+
+Run from the repository root:
+    python -m benchmarks.bench_backends adaf/ml_models/OD_barrow.tar --ml-type "object detection" --backends torch onnx
+    python -m benchmarks.bench_backends adaf/ml_models/ringfort.tar --backends torch torch-bf16 --tiles <tiles>
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import rasterio
+import torch
+
+from adaf.adaf_utils import PRECISIONS, load_backend
+
+
+def _load_tiles(tiles, tile_size, nr_tiles):
+    """Reads GeoTIFF tiles or creates random tiles (1 band, SLRM range 0-1)."""
+    if tiles:
+        images = []
+        for path in tiles[:nr_tiles]:
+            with rasterio.open(path) as src:
+                images.append(src.read())
+        return images
+
+    rng = np.random.default_rng(0)
+
+    return [rng.random((1, tile_size, tile_size), dtype=np.float32) for _ in range(nr_tiles)]
+
+
+def _backend_precision(name):
+    """Splits benchmark name into backend and precision ("torch-bf16" -> "torch", "bf16")."""
+    for precision in PRECISIONS:
+        if name.endswith(f"-{precision}"):
+            return name[:-len(precision) - 1], precision
+
+    return name, "fp32"
+
+
+def _output_diff(ml_type, reference, output):
+    """Largest difference of probabilities (segmentation) or scores (object detection) and difference in count of
+    detected objects."""
+    if ml_type == "segmentation":
+        return {"max_prob_diff": float(np.abs(reference - output).max())}
+
+    scores_ref = np.sort(reference[1])[::-1]
+    scores_out = np.sort(output[1])[::-1]
+    n = min(len(scores_ref), len(scores_out))
+
+    return {
+        "count_diff": abs(len(scores_ref) - len(scores_out)),
+        "max_score_diff": float(np.abs(scores_ref[:n] - scores_out[:n]).max()) if n else 0.0
+    }
+
+
+def benchmark_backends(
+        model_path,
+        ml_type,
+        backends=("torch", "onnx"),
+        tiles=None,
+        tile_size=1024,
+        nr_tiles=8,
+        threads=None,
+        warmup=1
+):
+    """Runs every backend on the same tiles and measures throughput.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    ml_type : str
+        "object detection" or "segmentation".
+    backends : tuple
+        Names of backends (see adaf_utils.load_backend()), optionally with precision suffix ("torch-bf16"). The first
+        one is the reference for output differences.
+    tiles : list
+        Paths to GeoTIFF tiles, random tiles are used if None.
+    tile_size : int
+        Size of random tiles.
+    nr_tiles : int
+        Number of tiles.
+    threads : int
+        Number of threads for PyTorch and ONNX Runtime.
+    warmup : int
+        Number of tiles processed before timing starts.
+
+    Returns
+    -------
+    dict
+        Seconds, tiles per second and output differences for each backend.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    images = _load_tiles(tiles, tile_size, nr_tiles)
+
+    results = {}
+    reference = None
+    for name in backends:
+        backend_name, precision = _backend_precision(name)
+        backend = load_backend(ml_type, model_path, backend_name, threads=threads, precision=precision)
+        run = backend.detect if ml_type == "object detection" else backend.segment
+
+        for image in images[:warmup]:
+            run(image)
+
+        outputs = []
+        t0 = time.perf_counter()
+        for image in images:
+            outputs.append(run(image))
+        seconds = time.perf_counter() - t0
+
+        results[name] = {"seconds": seconds, "tiles_per_sec": len(images) / seconds}
+        if precision != "fp32":
+            # Precision actually used (backend falls back to fp32 if reduced precision is not supported)
+            results[name]["precision"] = backend.precision
+        if reference is None:
+            reference = outputs
+        else:
+            diffs = [_output_diff(ml_type, ref, out) for ref, out in zip(reference, outputs)]
+            for key in diffs[0]:
+                results[name][key] = max(diff[key] for diff in diffs)
+
+    return {"tiles": len(images), "threads": threads, "backends": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ADAF inference backends.")
+    parser.add_argument("model_path", help="Path to AiTLAS checkpoint (tar file).")
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default="segmentation")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--tiles", nargs="*", default=None, help="GeoTIFF tiles, random tiles if omitted.")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--nr-tiles", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    res = benchmark_backends(
+        args.model_path,
+        args.ml_type,
+        backends=args.backends,
+        tiles=args.tiles,
+        tile_size=args.tile_size,
+        nr_tiles=args.nr_tiles,
+        threads=args.threads
+    )
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        print(f"{res['tiles']} tiles, {res['threads'] or 'default'} threads")
+        for name, r in res["backends"].items():
+            extra = "  ".join(
+                f"{k} {v:.4g}" if isinstance(v, float) else f"{k} {v}"
+                for k, v in r.items() if k not in ("seconds", "tiles_per_sec")
+            )
+            print(f"  {name:<10} {r['seconds']:8.2f} s  {r['tiles_per_sec']:6.2f} tiles/s  {extra}")
@@ -0,0 +1,156 @@
+"""
+ADAF - split of cores between inference workers and torch threads
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Runs data-parallel inference (see adaf_utils.predict_in_workers()) on the same tiles with different numbers of worker
+processes K, each with cores / K torch threads, and reports tiles per second for each split. The best K is the value
+for ADAFInput.inference_workers on this machine.
+
+Run from the repository root:
+    python -m benchmarks.bench_inference_workers adaf/ml_models/OD_barrow.tar --ml-type "object detection"
+        --tiles-dir <folder with tiles> --cores 16
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from adaf.adaf_utils import TileFolder, inference_worker_split, predict_in_workers
+
+
+def _random_tiles(tiles_dir, tile_size, nr_tiles):
+    """Writes random tiles (1 band, SLRM range 0-1) as GeoTIFF files."""
+    rng = np.random.default_rng(0)
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": tile_size,
+        "height": tile_size,
+        "crs": "EPSG:3794",
+        "nodata": 0
+    }
+    for i in range(nr_tiles):
+        profile["transform"] = from_origin(500000 + i * tile_size, 100000, 1, 1)
+        with rasterio.open(Path(tiles_dir) / f"tile_{i:06}_random.tif", "w", **profile) as dst:
+            dst.write(rng.random((1, tile_size, tile_size), dtype=np.float32))
+
+
+def _splits(cores):
+    """Numbers of workers that divide the cores evenly (1, 2, 4, ... and cores)."""
+    return [k for k in range(1, cores + 1) if cores % k == 0]
+
+
+def sweep_workers(
+        model_path,
+        ml_type,
+        tiles_dir=None,
+        cores=None,
+        workers=None,
+        backend="torch",
+        tile_size=1024,
+        nr_tiles=16
+):
+    """Measures throughput of data-parallel inference for different numbers of workers.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    ml_type : str
+        "object detection" or "segmentation".
+    tiles_dir : str or pathlib.Path()
+        Folder with tiles (GeoTIFF), random tiles are used if None.
+    cores : int
+        Number of cores for inference, all cores by default.
+    workers : list
+        Numbers of workers to test, by default all divisors of cores.
+    backend : str
+        Inference backend (see adaf_utils.load_backend()).
+    tile_size : int
+        Size of random tiles.
+    nr_tiles : int
+        Number of random tiles.
+
+    Returns
+    -------
+    dict
+        Seconds and tiles per second for each split and the best split.
+    """
+    cores = cores or os.cpu_count() or 1
+    workers = workers or _splits(cores)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if tiles_dir is None:
+            tiles_dir = Path(tmp_dir) / "tiles"
+            tiles_dir.mkdir()
+            _random_tiles(tiles_dir, tile_size, nr_tiles)
+        nr_tiles = len(TileFolder(tiles_dir))
+
+        results = {}
+        for k in workers:
+            threads = inference_worker_split(k, cores)
+            t0 = time.perf_counter()
+            # Time includes start-up of workers and loading of models, as in a real run
+            predict_in_workers(
+                ml_type,
+                "sweep",
+                model_path,
+                tiles_dir,
+                k,
+                threads=threads,
+                predictions_dir=Path(tmp_dir) / f"predictions_{k}",
+                backend=backend
+            )
+            seconds = time.perf_counter() - t0
+            results[f"{k}x{threads}"] = {
+                "workers": k,
+                "threads": threads,
+                "seconds": seconds,
+                "tiles_per_sec": nr_tiles / seconds
+            }
+
+    best = max(results, key=lambda split: results[split]["tiles_per_sec"])
+
+    return {"tiles": nr_tiles, "cores": cores, "splits": results, "best": best}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the best split of cores between inference workers.")
+    parser.add_argument("model_path", help="Path to AiTLAS checkpoint (tar file).")
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default="segmentation")
+    parser.add_argument("--tiles-dir", default=None, help="Folder with tiles, random tiles if omitted.")
+    parser.add_argument("--cores", type=int, default=None)
+    parser.add_argument("--workers", type=int, nargs="*", default=None, help="Numbers of workers to test.")
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--nr-tiles", type=int, default=16)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    res = sweep_workers(
+        args.model_path,
+        args.ml_type,
+        tiles_dir=args.tiles_dir,
+        cores=args.cores,
+        workers=args.workers,
+        backend=args.backend,
+        tile_size=args.tile_size,
+        nr_tiles=args.nr_tiles
+    )
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        print(f"{res['tiles']} tiles, {res['cores']} cores")
+        for split, r in res["splits"].items():
+            mark = "  <- best" if split == res["best"] else ""
+            print(f"  {r['workers']:>3} workers x {r['threads']:>3} threads  {r['seconds']:8.2f} s  "
+                  f"{r['tiles_per_sec']:6.2f} tiles/s{mark}")
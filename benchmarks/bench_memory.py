@@ -0,0 +1,109 @@
+"""
+ADAF - memory benchmark
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Measures peak RSS of the worker processes (and of the main process) for the visualisation and tiling stages.
+
+Every measurement runs in a fresh Python process, so the peak of terminated child processes (pool workers) belongs to
+that measurement only. Peak RSS of child processes is only available on Linux and macOS.
+
+Run from the repository root:
+    python -m benchmarks.bench_memory <path to DEM> --workers 4
+    python -m benchmarks.bench_memory <path to DEM> --dtype float64
+
+The script only uses tiled_processing() and image_tiling() of ADAF (peak RSS is read here with the resource module),
+so it can be copied into an older revision to get the "before" numbers (leave out --dtype there). --dtype float64 on
+the current code still uses in-place operations, it is not the same as an older revision.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import adaf.grid_tools as gt
+from adaf.adaf_utils import image_tiling
+from adaf.adaf_vis import tiled_processing
+
+
+def peak_rss_mb(children=False):
+    """Peak RSS (MB) of this process or of its largest terminated child process."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def run_stage(stage, raster_path, nr_workers, tile_size=1024, dtype=None, engine=None):
+    """Runs one stage on the raster and returns peak RSS (MB) of the main process and of the largest worker."""
+    raster_path = Path(raster_path)
+    valid_data_outline, _ = gt.poly_from_valid(raster_path.as_posix())
+    tiles_extents = gt.bounding_grid(raster_path.as_posix(), tile_size, tag=False)
+    tiles_extents = gt.filter_by_outline(tiles_extents, valid_data_outline)
+
+    # Only pass the options that were given (older revisions don't have them), tiling has no dtype option
+    kwargs = {}
+    if engine:
+        kwargs["engine"] = engine
+
+    with tempfile.TemporaryDirectory(prefix="adaf_bench_mem_") as save_dir:
+        if stage == "visualisation":
+            if dtype:
+                kwargs["dtype"] = dtype
+            tiled_processing(raster_path.as_posix(), tiles_extents, nr_workers, Path(save_dir), **kwargs)
+        elif stage == "tiling":
+            image_tiling(raster_path, tiles_extents, nr_workers, Path(save_dir), **kwargs)
+        else:
+            raise ValueError(f"Unknown stage {stage}")
+
+    return {
+        "stage": stage,
+        "dtype": dtype,
+        "engine": engine,
+        "tiles": int(tiles_extents.shape[0]),
+        "peak_main_rss_mb": peak_rss_mb(),
+        "peak_worker_rss_mb": peak_rss_mb(children=True)
+    }
+
+
+def benchmark_memory(raster_path, nr_workers=4, stages=("visualisation", "tiling"), dtype=None, engine=None):
+    """Runs every stage in a separate Python process and collects the results."""
+    results = []
+    for stage in stages:
+        cmd = [
+            sys.executable, "-m", "benchmarks.bench_memory", str(raster_path),
+            "--workers", str(nr_workers), "--run-stage", stage
+        ]
+        if dtype:
+            cmd += ["--dtype", dtype]
+        if engine:
+            cmd += ["--engine", engine]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak RSS of visualisation and tiling workers.")
+    parser.add_argument("raster_path", help="Path to DEM (or visualisation for tiling).")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dtype", default=None, help="Data type policy, e.g. float32 or float64.")
+    parser.add_argument("--engine", default=None, help="Engine of the stage (see tiled_processing, image_tiling).")
+    parser.add_argument("--stages", nargs="+", default=["visualisation", "tiling"])
+    parser.add_argument("--run-stage", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        # Child process, print results as JSON
+        print(json.dumps(run_stage(args.run_stage, args.raster_path, args.workers, dtype=args.dtype,
+                                   engine=args.engine)))
+    else:
+        for res in benchmark_memory(args.raster_path, args.workers, args.stages, args.dtype, args.engine):
+            print(
+                f"{res['stage']:<14} dtype={res['dtype'] or 'default':<8} tiles={res['tiles']:<5} "
+                f"main={res['peak_main_rss_mb'] or float('nan'):8.1f} MB  "
+                f"worker={res['peak_worker_rss_mb'] or float('nan'):8.1f} MB"
+            )
@@ -0,0 +1,206 @@
+"""
+ADAF - accuracy and throughput of quantised models
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Evaluates backends (e.g. "onnx" and "onnx-int8", see adaf_utils.load_backend()) on labelled patches created with
+create_patches.py: IoU for segmentation (against segmentation masks) and AP@0.5 for object detection (against
+labelTxt), the difference to the first backend and tiles per second. Use it per label to decide whether the speed-up of
+the int8 model is worth the loss of accuracy.
+
+Run from the repository root:
+    python -m benchmarks.bench_quantization adaf/ml_models/OD_barrow.tar <patches dir> --label barrow
+        --ml-type "object detection" --backends onnx onnx-int8
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+from adaf.adaf_utils import load_backend
+
+
+def read_patches(patches_dir, label, mask_band=1):
+    """Reads patches from create_patches.py output.
+
+    Returns list of (image, mask, boxes), where mask is the segmentation mask (band mask_band, 1-based, order of labels
+    as given to create_patches_main()) and boxes are ground-truth boxes of the label [x_min, y_min, x_max, y_max].
+    """
+    patches_dir = Path(patches_dir)
+
+    patches = []
+    for image_path in sorted((patches_dir / "images").glob("*.tif")):
+        with rasterio.open(image_path) as src:
+            image = src.read()
+
+        mask_path = patches_dir / "segmentation_masks" / image_path.name.replace("__images", "__segmentation_masks")
+        mask = None
+        if mask_path.is_file():
+            with rasterio.open(mask_path) as src:
+                mask = src.read(mask_band) > 0
+
+        boxes = []
+        label_path = patches_dir / "labelTxt" / image_path.name.replace("__images.tif", "__labelTxt.txt")
+        if label_path.is_file():
+            with open(label_path) as src:
+                for line in src:
+                    # labelTxt: <x1> <y1> <x2> <y2> <x3> <y3> <x4> <y4> <label> <DFM>
+                    parts = line.split()
+                    if len(parts) >= 9 and parts[8] == label:
+                        xs = [float(v) for v in parts[0:8:2]]
+                        ys = [float(v) for v in parts[1:8:2]]
+                        boxes.append([min(xs), min(ys), max(xs), max(ys)])
+
+        patches.append((image, mask, np.array(boxes, dtype=np.float32).reshape(-1, 4)))
+
+    return patches
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix of two sets of boxes [x_min, y_min, x_max, y_max]."""
+    x1 = np.maximum(boxes_a[:, np.newaxis, 0], boxes_b[np.newaxis, :, 0])
+    y1 = np.maximum(boxes_a[:, np.newaxis, 1], boxes_b[np.newaxis, :, 1])
+    x2 = np.minimum(boxes_a[:, np.newaxis, 2], boxes_b[np.newaxis, :, 2])
+    y2 = np.minimum(boxes_a[:, np.newaxis, 3], boxes_b[np.newaxis, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    return intersection / np.maximum(area_a[:, np.newaxis] + area_b[np.newaxis, :] - intersection, 1e-9)
+
+
+def average_precision(detections, ground_truth, iou_threshold=0.5):
+    """AP (all-point interpolation) over patches. Detections is a list of (boxes, scores), ground_truth a list of
+    boxes (one item per patch)."""
+    records = []
+    nr_gt = sum(len(gt) for gt in ground_truth)
+    for (boxes, scores), gt in zip(detections, ground_truth):
+        matched = np.zeros(len(gt), dtype=bool)
+        ious = box_iou(boxes, gt) if len(boxes) and len(gt) else np.zeros((len(boxes), 0))
+        for i in np.argsort(-scores):
+            tp = False
+            if ious.shape[1]:
+                j = int(np.argmax(ious[i]))
+                if ious[i, j] >= iou_threshold and not matched[j]:
+                    matched[j] = True
+                    tp = True
+            records.append((scores[i], tp))
+    if nr_gt == 0 or not records:
+        return 0.0
+
+    records.sort(key=lambda r: -r[0])
+    tp = np.cumsum([r[1] for r in records])
+    fp = np.cumsum([not r[1] for r in records])
+    recall = tp / nr_gt
+    precision = tp / np.maximum(tp + fp, 1e-9)
+
+    # Precision envelope
+    precision = np.concatenate([[0], precision, [0]])
+    recall = np.concatenate([[0], recall, [1]])
+    for i in range(len(precision) - 2, -1, -1):
+        precision[i] = max(precision[i], precision[i + 1])
+    idx = np.flatnonzero(recall[1:] != recall[:-1])
+
+    return float(np.sum((recall[idx + 1] - recall[idx]) * precision[idx + 1]))
+
+
+def benchmark_quantization(
+        model_path,
+        patches_dir,
+        label,
+        ml_type="segmentation",
+        backends=("onnx", "onnx-int8"),
+        mask_band=1,
+        threshold=0.5,
+        threads=None
+):
+    """Evaluates accuracy and throughput of backends on labelled patches.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    patches_dir : str or pathlib.Path()
+        Output directory of create_patches_main().
+    label : str
+        Label of the model (barrow, enclosure, ringfort, AO).
+    ml_type : str
+        "object detection" or "segmentation".
+    backends : tuple
+        Names of backends, the first one is the reference for deltas.
+    mask_band : int
+        Band of segmentation masks with the label (1-based).
+    threshold : float
+        Probability threshold for segmentation.
+    threads : int
+        Number of threads for ONNX Runtime.
+
+    Returns
+    -------
+    dict
+        IoU (segmentation) or AP50 (object detection), delta to the reference and tiles per second for each backend.
+    """
+    patches = read_patches(patches_dir, label, mask_band)
+
+    results = {}
+    for name in backends:
+        backend = load_backend(ml_type, model_path, name, threads=threads)
+
+        t0 = time.perf_counter()
+        if ml_type == "segmentation":
+            intersection = 0
+            union = 0
+            for image, mask, _ in patches:
+                predicted = backend.segment(image)[0] >= threshold
+                intersection += int(np.logical_and(predicted, mask).sum())
+                union += int(np.logical_or(predicted, mask).sum())
+            metric = {"iou": intersection / union if union else 0.0}
+        else:
+            detections = [backend.detect(image) for image, _, _ in patches]
+            metric = {"ap50": average_precision(detections, [boxes for _, _, boxes in patches])}
+        seconds = time.perf_counter() - t0
+
+        metric.update(seconds=seconds, tiles_per_sec=len(patches) / seconds)
+        results[name] = metric
+
+    # Differences to the reference backend
+    reference = results[backends[0]]
+    key = "iou" if ml_type == "segmentation" else "ap50"
+    for name in backends[1:]:
+        results[name][f"{key}_delta"] = results[name][key] - reference[key]
+        results[name]["speedup"] = results[name]["tiles_per_sec"] / reference["tiles_per_sec"]
+
+    return {"label": label, "patches": len(patches), "backends": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy and throughput of quantised ADAF models.")
+    parser.add_argument("model_path", help="Path to AiTLAS checkpoint (tar file).")
+    parser.add_argument("patches_dir", help="Output directory of create_patches.py.")
+    parser.add_argument("--label", required=True)
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default="segmentation")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"])
+    parser.add_argument("--mask-band", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    res = benchmark_quantization(
+        args.model_path,
+        args.patches_dir,
+        args.label,
+        ml_type=args.ml_type,
+        backends=args.backends,
+        mask_band=args.mask_band,
+        threads=args.threads
+    )
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        print(f"{res['label']}: {res['patches']} patches")
+        for name, r in res["backends"].items():
+            print("  " + name.ljust(10) + "  ".join(f"{k} {v:.4g}" for k, v in r.items()))
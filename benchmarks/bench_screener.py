@@ -0,0 +1,131 @@
+"""
+ADAF - screener recall/throughput benchmark
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Measures the trade-off between recall (fraction of tiles with archaeology that are passed on to the full model) and
+throughput of the cascade (screener + full model on kept tiles) for a range of target recalls. The screener is trained
+on one part of the labeled patches (create_patches.py) and negative tiles, and evaluated on the rest.
+
+Run from the repository root:
+    python -m benchmarks.bench_screener <patches dir> <negatives dir> --label barrow --model-seconds 0.8
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import rasterio
+
+from adaf.screener import TileScreener, patches_dataset, texture_features, threshold_for_recall
+
+
+def benchmark_screener(
+        patches_dir,
+        negatives_dir,
+        label=None,
+        recalls=(0.9, 0.95, 0.98, 0.99, 1.0),
+        test_fraction=0.3,
+        model_seconds=None,
+        seed=0
+):
+    """Trains a screener and evaluates recall, pass rate and speed-up for each target recall.
+
+    Parameters
+    ----------
+    patches_dir : str or pathlib.Path()
+        Output directory of create_patches_main().
+    negatives_dir : str or pathlib.Path()
+        Folder with tiles without archaeology.
+    label : str
+        Optional - evaluate screener for a single label.
+    recalls : tuple
+        Target recalls (threshold is selected on the training part).
+    test_fraction : float
+        Fraction of tiles used for evaluation (stratified split).
+    model_seconds : float
+        Time of the full model per tile (seconds), used to estimate the speed-up of the cascade.
+    seed : int
+        Seed for the train/test split.
+
+    Returns
+    -------
+    dict
+        Size of the dataset, screening time per tile and results for each target recall.
+    """
+    features, targets, paths = patches_dataset(patches_dir, negatives_dir, label)
+
+    # Stratified split
+    rng = np.random.default_rng(seed)
+    test = np.zeros(len(targets), dtype=bool)
+    for value in (0, 1):
+        idx = np.flatnonzero(targets == value)
+        rng.shuffle(idx)
+        test[idx[:int(round(test_fraction * idx.size))]] = True
+
+    screener = TileScreener(label=label).fit(features[~test], targets[~test], recall=None)
+    train_probs = screener.predict_proba(features[~test])
+    test_probs = screener.predict_proba(features[test])
+    test_targets = targets[test]
+
+    # Screening time per tile (features from array + classifier), reading of the tile is not included
+    with rasterio.open(paths[0]) as src:
+        image = src.read(1)
+    t0 = time.perf_counter()
+    for _ in range(20):
+        screener.predict_proba(texture_features(image))
+    screen_seconds = (time.perf_counter() - t0) / 20
+
+    results = []
+    for recall in recalls:
+        threshold = threshold_for_recall(train_probs, targets[~test], recall)
+        kept = test_probs >= threshold
+        n_pos = max(int(test_targets.sum()), 1)
+        row = {
+            "target_recall": recall,
+            "threshold": threshold,
+            "recall": float((kept & (test_targets == 1)).sum() / n_pos),
+            "pass_rate": float(kept.mean()) if kept.size else 0.0
+        }
+        if model_seconds:
+            # Tiles per second of the full model alone vs. cascade (screener on all tiles, model on kept tiles)
+            row["speedup"] = model_seconds / (screen_seconds + row["pass_rate"] * model_seconds)
+        results.append(row)
+
+    return {
+        "tiles": int(len(targets)),
+        "positives": int(targets.sum()),
+        "test_tiles": int(test.sum()),
+        "screen_seconds_per_tile": screen_seconds,
+        "results": results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/throughput trade-off of the tile screener.")
+    parser.add_argument("patches_dir", help="Output directory of create_patches.py.")
+    parser.add_argument("negatives_dir", help="Folder with tiles without archaeology.")
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--model-seconds", type=float, default=None, help="Full model time per tile (seconds).")
+    parser.add_argument("--test-fraction", type=float, default=0.3)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    res = benchmark_screener(
+        args.patches_dir,
+        args.negatives_dir,
+        label=args.label,
+        test_fraction=args.test_fraction,
+        model_seconds=args.model_seconds
+    )
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        print(f"{res['tiles']} tiles ({res['positives']} positive), {res['test_tiles']} for evaluation")
+        print(f"Screening: {res['screen_seconds_per_tile'] * 1000:.1f} ms/tile")
+        for r in res["results"]:
+            line = f"  target {r['target_recall']:.2f}  recall {r['recall']:.3f}  pass rate {r['pass_rate']:.3f}"
+            if "speedup" in r:
+                line += f"  speed-up {r['speedup']:.2f}x"
+            print(line)
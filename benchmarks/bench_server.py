@@ -0,0 +1,174 @@
+"""
+ADAF - load test of the inference server
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Several client processes send random tiles to the inference server (see adaf/inference_server.py) at the same time,
+as notebooks and scripts sharing one workstation would. Reports tiles per second, latency of requests (median and 95th
+percentile) and the mean batch size on the server. The server is started for the test, unless --address of a running
+server is given.
+
+Run from the repository root:
+    python -m benchmarks.bench_server adaf/ml_models/segmentation_AO.tar --clients 4 --tiles 16 --max-wait-ms 20
+"""
+import argparse
+import json
+import multiprocessing as mp
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from adaf.adaf_utils import RemoteBackend
+from adaf.inference_server import server_call
+
+
+def _client(args):
+    """Sends tiles one by one, returns latencies of requests and start and end time (seconds)."""
+    address, ml_type, model_path, backend, tile_size, nr_tiles, seed = args
+    remote = RemoteBackend(ml_type, model_path, backend, address=address)
+    rng = np.random.default_rng(seed)
+    latencies = []
+    start = time.time()
+    for _ in range(nr_tiles):
+        image = rng.random((1, tile_size, tile_size), dtype=np.float32)
+        t0 = time.perf_counter()
+        if ml_type == "segmentation":
+            remote.segment(image)
+        else:
+            remote.detect(image)
+        latencies.append(time.perf_counter() - t0)
+
+    return latencies, start, time.time()
+
+
+def _wait_for_server(address, timeout=60):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        try:
+            return server_call("ping", address)
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Inference server on {address} didn't start in {timeout} s!")
+
+
+def load_test(
+        model_path,
+        ml_type="segmentation",
+        address=None,
+        clients=4,
+        nr_tiles=16,
+        tile_size=1024,
+        backend="torch",
+        max_batch=8,
+        max_wait_ms=20,
+        cpus=None
+):
+    """Runs concurrent clients against the inference server.
+
+    Parameters
+    ----------
+    model_path : str or pathlib.Path()
+        Path to AiTLAS checkpoint (tar file).
+    ml_type : str
+        "object detection" or "segmentation".
+    address : str
+        Address of a running server, if None a server is started on "localhost:6231" for the test.
+    clients : int
+        Number of client processes.
+    nr_tiles : int
+        Number of tiles sent by each client.
+    tile_size : int
+        Size of random tiles.
+    backend : str
+        Inference backend of the server (see adaf_utils.load_backend()).
+    max_batch, max_wait_ms : int, float
+        Batching parameters of the started server.
+    cpus : int
+        Number of torch threads of the started server.
+
+    Returns
+    -------
+    dict
+        Throughput, latencies and statistics of the server.
+    """
+    server = None
+    if address is None:
+        address = "localhost:6231"
+        cmd = [
+            sys.executable, "-m", "adaf.inference_server", "--address", address,
+            "--max-batch", str(max_batch), "--max-wait-ms", str(max_wait_ms)
+        ]
+        if cpus:
+            cmd += ["--cpus", str(cpus)]
+        server = subprocess.Popen(cmd)
+    try:
+        _wait_for_server(address)
+        # Model is loaded before timing starts
+        _client((address, ml_type, model_path, backend, tile_size, 1, 0))
+        stats_before = server_call("stats", address)
+
+        jobs = [(address, ml_type, model_path, backend, tile_size, nr_tiles, seed) for seed in range(1, clients + 1)]
+        with mp.get_context("spawn").Pool(clients) as pool:
+            results = pool.map(_client, jobs)
+        latencies = np.concatenate([result[0] for result in results])
+        # From the first request to the last answer (start-up of client processes is not included)
+        seconds = max(result[2] for result in results) - min(result[1] for result in results)
+
+        stats = server_call("stats", address)
+    finally:
+        if server is not None:
+            server_call("shutdown", address)
+            server.wait(timeout=60)
+
+    batches = stats["batches"] - stats_before["batches"]
+
+    return {
+        "clients": clients,
+        "tiles": len(latencies),
+        "seconds": seconds,
+        "tiles_per_sec": len(latencies) / seconds,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "batches": batches,
+        "mean_batch": (stats["tiles"] - stats_before["tiles"]) / batches if batches else 0,
+        "max_batch": stats["max_batch"]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the ADAF inference server.")
+    parser.add_argument("model_path", help="Path to AiTLAS checkpoint (tar file).")
+    parser.add_argument("--ml-type", choices=["object detection", "segmentation"], default="segmentation")
+    parser.add_argument("--address", default=None, help="Address of a running server, started for the test if omitted.")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--tiles", type=int, default=16, help="Number of tiles per client.")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--cpus", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    res = load_test(
+        args.model_path,
+        args.ml_type,
+        address=args.address,
+        clients=args.clients,
+        nr_tiles=args.tiles,
+        tile_size=args.tile_size,
+        backend=args.backend,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        cpus=args.cpus
+    )
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        print(f"{res['clients']} clients, {res['tiles']} tiles in {res['seconds']:.2f} s "
+              f"({res['tiles_per_sec']:.2f} tiles/s)")
+        print(f"  latency: median {res['latency_p50_ms']:.0f} ms, 95th percentile {res['latency_p95_ms']:.0f} ms")
+        print(f"  server: {res['batches']} batches, mean batch {res['mean_batch']:.2f}, max batch {res['max_batch']}")
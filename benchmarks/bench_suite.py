@@ -0,0 +1,332 @@
+"""
+ADAF - benchmark suite
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Times the main stages of ADAF on a synthetic DEM (see synthetic_dem.py), so performance can be compared between
+versions and machines without ALS data:
+    poly_from_valid - outline of valid data,
+    grid - bounding_grid() and filter_by_outline(),
+    visualisations - tiled_processing() (SLRM of all tiles),
+    tiling - image_tiling() of the visualisation,
+    od_vectors - object_detection_vectors() of bounding boxes of injected features (one file per tile),
+    seg_vectors - semantic_segmentation_vectors() of probability masks of injected features (one mask per tile),
+    patches - create_patches_main() with injected features as labels.
+
+Inputs of the vectorisers are made from the injected features, so they don't depend on ML models. The best and median
+time of repetitions are reported. Results are saved as JSON (with the revision, machine and DEM parameters), a previous
+result can be given as baseline to report slower stages.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite --width 6000 --height 4000 --workers 4 --output bench_results/HEAD.json
+    python -m benchmarks.bench_suite --output new.json --baseline bench_results/HEAD.json
+    python -m benchmarks.bench_suite --only grid visualisations --mosaic 2000
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import from_bounds
+
+import adaf.grid_tools as gt
+from adaf.adaf_inference import object_detection_vectors, semantic_segmentation_vectors
+from adaf.adaf_utils import image_tiling
+from adaf.adaf_vis import tiled_processing
+from adaf.create_patches import create_patches_main
+from benchmarks.synthetic_dem import make_dem
+
+BENCHMARKS = ("poly_from_valid", "grid", "visualisations", "tiling", "od_vectors", "seg_vectors", "patches")
+
+
+def _timed(func, repeat):
+    """Runs func() repeat times, returns list of times (seconds) and result of the last run."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+
+    return times, result
+
+
+def _revision():
+    """Git revision of the repository (None if not available)."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _od_predictions(features, tiles_extents, res, epsg, out_dir, label="barrow"):
+    """Bounding box files (format of adaf_utils.object_detection_on_array()) of features in every tile."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    features = features[features["label"] == label]
+    for minx, miny, maxx, maxy in tiles_extents[["minx", "miny", "maxx", "maxy"]].itertuples(index=False):
+        lines = ""
+        for geom in features.cx[minx:maxx, miny:maxy].geometry:
+            x0, y0, x1, y1 = geom.bounds
+            lines += (
+                f"{round((max(x0, minx) - minx) / res)} {round((maxy - min(y1, maxy)) / res)} "
+                f"{round((min(x1, maxx) - minx) / res)} {round((maxy - max(y0, miny)) / res)} "
+                f"{label} 0.9000 {epsg} {res} {minx} {maxy}\n"
+            )
+        with open(out_dir / f"{int(minx)}_{int(maxy)}_{label}_bounding_boxes.txt", "w") as dst:
+            dst.write(lines)
+
+    return out_dir
+
+
+def _seg_predictions(features, tiles_extents, vis_path, out_dir, label="enclosure"):
+    """Probability masks (format of adaf_utils.segmentation_on_array()) of features in every tile, with noise."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    features = features[features["label"] == label]
+    rng = np.random.default_rng(0)
+    with rasterio.open(vis_path) as src:
+        profile = {"driver": "GTiff", "dtype": "float32", "count": 1, "crs": src.crs}
+        for bounds in tiles_extents[["minx", "miny", "maxx", "maxy"]].itertuples(index=False):
+            window = from_bounds(*bounds, transform=src.transform).round_offsets().round_lengths()
+            transform = src.window_transform(window)
+            shape = (int(window.height), int(window.width))
+            probs = rng.random(shape, dtype=np.float32) * 0.4
+            geoms = list(features.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]].geometry)
+            if geoms:
+                inside = rasterize(geoms, out_shape=shape, transform=transform, fill=0, default_value=1)
+                probs[inside == 1] += 0.5
+            with rasterio.open(
+                    out_dir / f"{int(bounds[0])}_{int(bounds[3])}_{label}_segmentation_mask_probs.tif", "w",
+                    width=shape[1], height=shape[0], transform=transform, **profile
+            ) as dst:
+                dst.write(probs, 1)
+
+    return out_dir
+
+
+def run_suite(
+        work_dir=None,
+        width=4000,
+        height=3000,
+        res=0.5,
+        seed=0,
+        mosaic=None,
+        nr_workers=None,
+        tile_size=1024,
+        repeat=3,
+        only=None,
+        executor="processes"
+):
+    """Runs benchmarks on a synthetic DEM.
+
+    Parameters
+    ----------
+    work_dir : str or pathlib.Path()
+        Optional - folder for the DEM and outputs (kept), by default a temporary folder (removed).
+    width, height, res, seed, mosaic
+        Parameters of the synthetic DEM (see synthetic_dem.make_dem()).
+    nr_workers : int
+        Number of workers, defaults to the number of CPUs minus two.
+    tile_size : int
+        Tile size in pixels (1024 as in ADAF).
+    repeat : int
+        Number of repetitions of every benchmark.
+    only : list
+        Optional - names of benchmarks to run (see BENCHMARKS), stages they need are run but not timed.
+    executor : str
+        Kind of executor for tiled stages (see executors.get_executor()).
+
+    Returns
+    -------
+    dict
+        Parameters of the run and results of benchmarks ("seconds" is the best time, "median_seconds", "items" and
+        "items_per_sec").
+    """
+    nr_workers = nr_workers or max(os.cpu_count() - 2, 1)
+    selected = set(only or BENCHMARKS)
+    unknown = selected - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {sorted(unknown)}, choose from {BENCHMARKS}!")
+    temporary = work_dir is None
+    work_dir = Path(tempfile.mkdtemp(prefix="adaf_bench_suite_") if temporary else work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+
+    def bench(name, func, items=None):
+        """Times func if the benchmark is selected (otherwise runs it once), returns result."""
+        if name not in selected:
+            return func()
+        times, result = _timed(func, repeat)
+        best = min(times)
+        nr_items = items(result) if callable(items) else items
+        results[name] = {
+            "seconds": best,
+            "median_seconds": statistics.median(times),
+            "repeat": repeat,
+            "items": nr_items,
+            "items_per_sec": nr_items / best if nr_items and best > 0 else None
+        }
+        print(f"  {name:<16} {best:8.3f} s" + (f"  {results[name]['items_per_sec']:8.1f} items/s" if nr_items else ""))
+
+        return result
+
+    try:
+        t0 = time.perf_counter()
+        dem = make_dem(work_dir / ("dem" if mosaic else "dem.tif"), width, height, res, seed, mosaic)
+        dem_path = dem["dem_path"]
+        features = dem["features"]
+        with rasterio.open(dem_path) as src:
+            epsg = src.crs.to_epsg()
+        print(f"Synthetic DEM {width} x {height} px ({len(features)} features) in {time.perf_counter() - t0:.1f} s")
+
+        outline, _ = bench("poly_from_valid", lambda: gt.poly_from_valid(dem_path), items=width * height / 1e6)
+
+        def grid():
+            extents = gt.bounding_grid(dem_path, tile_size, tag=False)
+            return gt.filter_by_outline(extents, outline)
+        tiles_extents = bench("grid", grid, items=len)
+
+        def visualisations():
+            out_dir = work_dir / "vis"
+            shutil.rmtree(out_dir, ignore_errors=True)
+            return tiled_processing(
+                dem_path, tiles_extents, nr_processes=nr_workers, save_dir=out_dir, executor=executor
+            )
+        vis = bench("visualisations", visualisations, items=len(tiles_extents))
+        vis_path = Path(vis["vrt_path"]).as_posix()
+
+        if "tiling" in selected:
+            def tiling():
+                out_dir = work_dir / "tiles"
+                shutil.rmtree(out_dir, ignore_errors=True)
+                return image_tiling(vis_path, tiles_extents, nr_processes=nr_workers, save_dir=out_dir, engine="thread")
+            bench("tiling", tiling, items=len(tiles_extents))
+
+        if "od_vectors" in selected:
+            od_dir = _od_predictions(features, tiles_extents, res, epsg, work_dir / "predictions_od" / "barrow")
+            bench(
+                "od_vectors",
+                lambda: object_detection_vectors({"barrow": od_dir}, min_area=0),
+                items=len(tiles_extents)
+            )
+
+        if "seg_vectors" in selected:
+            seg_dir = _seg_predictions(features, tiles_extents, vis_path, work_dir / "predictions_seg" / "enclosure")
+            bench(
+                "seg_vectors",
+                lambda: semantic_segmentation_vectors(
+                    {"enclosure": seg_dir}, nr_processes=nr_workers, executor=executor
+                ),
+                items=len(tiles_extents)
+            )
+
+        if "patches" in selected:
+            labels = {}
+            for label in ("barrow", "enclosure"):
+                labels[label] = (work_dir / f"features_{label}.gpkg").as_posix()
+                # Labels of training data have difficulty of the object ("DFM")
+                features[features["label"] == label].assign(DFM=1).to_file(labels[label], driver="GPKG")
+
+            def patches():
+                out_dir = work_dir / "patches"
+                shutil.rmtree(out_dir, ignore_errors=True)
+                create_patches_main(vis_path, labels, out_dir, executor=executor)
+                return out_dir
+            bench("patches", patches, items=len(features))
+    finally:
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "revision": _revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count()
+        },
+        "parameters": {
+            "width": width,
+            "height": height,
+            "res": res,
+            "seed": seed,
+            "mosaic": mosaic,
+            "tile_size": tile_size,
+            "workers": nr_workers,
+            "executor": executor,
+            "repeat": repeat,
+            "features": len(features)
+        },
+        "results": results
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Ratio of times (results / baseline) for benchmarks in both, and names of benchmarks slower than 1 + tolerance.
+    Results with different DEM or workers are not comparable (a warning is returned)."""
+    warnings = []
+    for key in ("width", "height", "res", "seed", "mosaic", "tile_size", "workers"):
+        if results["parameters"].get(key) != baseline["parameters"].get(key):
+            warnings.append(f"different {key}: {baseline['parameters'].get(key)} -> {results['parameters'].get(key)}")
+    ratios = {
+        name: result["seconds"] / baseline["results"][name]["seconds"]
+        for name, result in results["results"].items() if name in baseline["results"]
+    }
+
+    return {
+        "baseline_revision": baseline.get("revision"),
+        "ratios": ratios,
+        "slower": [name for name, ratio in ratios.items() if ratio > 1 + tolerance],
+        "warnings": warnings
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ADAF benchmark suite on a synthetic DEM.")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--res", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mosaic", type=int, default=None, help="DEM as VRT mosaic of tiles of this size (pixels).")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--executor", default="processes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", default=None, choices=BENCHMARKS)
+    parser.add_argument("--work-dir", default=None, help="Keep the DEM and outputs in this folder.")
+    parser.add_argument("--output", default=None, help="Save results as JSON.")
+    parser.add_argument("--baseline", default=None, help="JSON results of a previous run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as regression.")
+    args = parser.parse_args()
+
+    res = run_suite(
+        args.work_dir, args.width, args.height, args.res, args.seed, args.mosaic, args.workers, repeat=args.repeat,
+        only=args.only, executor=args.executor
+    )
+    if args.baseline:
+        with open(args.baseline) as src:
+            res["comparison"] = compare(res, json.load(src), args.tolerance)
+        for name, ratio in res["comparison"]["ratios"].items():
+            flag = "  SLOWER" if name in res["comparison"]["slower"] else ""
+            print(f"  {name:<16} x{ratio:6.2f} of baseline{flag}")
+        for warning in res["comparison"]["warnings"]:
+            print(f"  Warning: {warning}")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w") as dst:
+            json.dump(res, dst, indent=2)
+        print(f"Results: {args.output}")
+    else:
+        print(json.dumps(res, indent=2))
@@ -0,0 +1,81 @@
+"""
+ADAF - tiling benchmark
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Compares the engines of adaf_utils.image_tiling() (serial, process and thread) on the path used when the
+visualisation already exists (vis_exist_ok).
+
+Run from the repository root:
+    python -m benchmarks.bench_tiling <path to visualisation> --workers 8 --repeat 3
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import adaf.grid_tools as gt
+from adaf.adaf_utils import image_tiling
+
+
+def benchmark_tiling(vis_path, tile_size=1024, nr_workers=None, repeat=3, engines=("serial", "process", "thread")):
+    """Times image_tiling() for each engine on the same reference grid.
+
+    Parameters
+    ----------
+    vis_path : str or pathlib.Path()
+        Path to the visualisation raster (GeoTIFF or VRT).
+    tile_size : int
+        Tile size in pixels.
+    nr_workers : int
+        Number of processes/threads, defaults to the number of CPUs minus two.
+    repeat : int
+        Number of repetitions for each engine, the best time is reported.
+    engines : tuple
+        Engines to compare.
+
+    Returns
+    -------
+    dict
+        Best time in seconds and tiles per second for each engine.
+    """
+    vis_path = Path(vis_path)
+    if nr_workers is None:
+        nr_workers = max(os.cpu_count() - 2, 1)
+
+    # Same grid as in adaf_inference.run_tiling()
+    valid_data_outline, _ = gt.poly_from_valid(vis_path.as_posix())
+    tiles_extents = gt.bounding_grid(vis_path.as_posix(), tile_size, tag=False)
+    tiles_extents = gt.filter_by_outline(tiles_extents, valid_data_outline)
+    nr_tiles = tiles_extents.shape[0]
+
+    results = {}
+    for engine in engines:
+        times = []
+        for _ in range(repeat):
+            save_dir = Path(tempfile.mkdtemp(prefix=f"adaf_bench_{engine}_"))
+            t0 = time.perf_counter()
+            image_tiling(vis_path, tiles_extents, nr_processes=nr_workers, save_dir=save_dir, engine=engine)
+            times.append(time.perf_counter() - t0)
+            shutil.rmtree(save_dir)
+        best = min(times)
+        results[engine] = {"seconds": best, "tiles_per_sec": nr_tiles / best}
+
+    return {"tiles": nr_tiles, "workers": nr_workers, "engines": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial/process/thread engines of image_tiling().")
+    parser.add_argument("vis_path", help="Path to visualisation raster (GeoTIFF or VRT).")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    res = benchmark_tiling(args.vis_path, args.tile_size, args.workers, args.repeat)
+
+    print(f"{res['tiles']} tiles, {res['workers']} workers")
+    for eng, r in res["engines"].items():
+        print(f"  {eng:<8} {r['seconds']:8.2f} s  {r['tiles_per_sec']:8.1f} tiles/s")
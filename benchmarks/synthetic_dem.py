@@ -0,0 +1,276 @@
+"""
+ADAF - synthetic DEM generator
+Created on 19 October 2026
+@author: Nejc Čož, ZRC SAZU, Novi trg 2, 1000 Ljubljana, Slovenia
+
+Creates reproducible test DEMs for benchmarks (see bench_suite.py), so ADAF performance can be measured without
+(private) ALS data. Terrain is value noise of several octaves (hills down to micro relief), with injected
+archaeological-like features: mounds (barrows) and circular banks with an outer ditch (enclosures). Holes of nodata
+(e.g. water bodies, missing strips) are cut into the terrain. The same seed always gives the same DEM.
+
+The DEM is saved as a single GeoTIFF or as a mosaic of GeoTIFF tiles with a VRT (as DEMs are usually delivered). The
+injected features are returned as polygons (GeoDataFrame with "label"), e.g. for training patches or predictions.
+
+Run from the repository root:
+    python -m benchmarks.synthetic_dem synthetic/dem.tif --width 8000 --height 6000 --seed 1
+    python -m benchmarks.synthetic_dem synthetic/mosaic --width 8000 --height 6000 --mosaic 2000
+"""
+import argparse
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from shapely.geometry import Point
+
+from adaf.adaf_utils import build_vrt_from_list
+
+# Projected CRS of generated DEMs (Slovenia, D96/TM) and upper left corner
+CRS = "EPSG:3794"
+ORIGIN = (500000.0, 100000.0)
+NODATA = -9999.0
+
+
+def _value_noise(shape, cell, rng):
+    """Smooth noise (bilinear interpolation with smoothstep of a random grid with the given cell size in pixels)."""
+    grid = rng.standard_normal((shape[0] // cell + 2, shape[1] // cell + 2)).astype(np.float32)
+    y = np.arange(shape[0], dtype=np.float32) / cell
+    x = np.arange(shape[1], dtype=np.float32) / cell
+    y0 = y.astype(int)
+    x0 = x.astype(int)
+    fy = (y - y0)[:, None]
+    fx = (x - x0)[None, :]
+    fy = fy * fy * (3 - 2 * fy)
+    fx = fx * fx * (3 - 2 * fx)
+    top = grid[y0][:, x0] * (1 - fx) + grid[y0][:, x0 + 1] * fx
+    bottom = grid[y0 + 1][:, x0] * (1 - fx) + grid[y0 + 1][:, x0 + 1] * fx
+
+    return top * (1 - fy) + bottom * fy
+
+
+def terrain(shape, res=0.5, seed=0, relief=30.0, roughness=0.5):
+    """Terrain of value noise octaves, from hills (cells of 256 m) to micro relief (cells of 2 m).
+
+    Parameters
+    ----------
+    shape : tuple
+        (rows, cols) in pixels.
+    res : float
+        Pixel size in metres.
+    seed : int
+        Seed of the random generator.
+    relief : float
+        Amplitude of the largest octave in metres.
+    roughness : float
+        Ratio of amplitudes of neighbouring octaves.
+
+    Returns
+    -------
+    np.ndarray
+        Elevation (float32).
+    """
+    rng = np.random.default_rng(seed)
+    dem = np.full(shape, 300.0, dtype=np.float32)
+    amplitude = relief
+    cell_m = 256.0
+    while cell_m >= 2.0:
+        cell = max(int(round(cell_m / res)), 2)
+        dem += amplitude * _value_noise(shape, cell, rng)
+        amplitude *= roughness
+        cell_m /= 2
+
+    return dem
+
+
+def _add_feature(dem, row, col, radius_px, profile):
+    """Adds a radial feature (height as a function of distance / radius) at (row, col)."""
+    reach = int(np.ceil(radius_px * 1.6))
+    r0, r1 = max(row - reach, 0), min(row + reach + 1, dem.shape[0])
+    c0, c1 = max(col - reach, 0), min(col + reach + 1, dem.shape[1])
+    yy, xx = np.ogrid[r0 - row:r1 - row, c0 - col:c1 - col]
+    dem[r0:r1, c0:c1] += profile(np.sqrt(yy ** 2 + xx ** 2) / radius_px).astype(np.float32)
+
+
+def inject_features(dem, transform, seed=0, mounds_per_km2=40, enclosures_per_km2=8):
+    """Adds mounds and enclosures to the DEM (in place) and returns their outlines.
+
+    Mounds are domes (radius 4-12 m, height 0.4-2 m), enclosures are circular banks (radius 15-40 m, height 0.3-1 m)
+    with an outer ditch. Features don't overlap each other.
+
+    Parameters
+    ----------
+    dem : np.ndarray
+        Elevation, changed in place.
+    transform : affine.Affine
+        Transform of the DEM.
+    seed : int
+        Seed of the random generator.
+    mounds_per_km2, enclosures_per_km2 : float
+        Density of features.
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        Outlines of features with "label" ("barrow" or "enclosure"), "radius" and "height".
+    """
+    rng = np.random.default_rng(seed + 1)
+    res = transform.a
+    area_km2 = dem.shape[0] * dem.shape[1] * res ** 2 / 1e6
+    # Larger features are placed first
+    labels = ["enclosure"] * rng.poisson(enclosures_per_km2 * area_km2)
+    labels += ["barrow"] * rng.poisson(mounds_per_km2 * area_km2)
+
+    placed = []
+    records = []
+    for label in labels:
+        if label == "barrow":
+            radius, height = rng.uniform(4, 12), rng.uniform(0.4, 2.0)
+        else:
+            radius, height = rng.uniform(15, 40), rng.uniform(0.3, 1.0)
+        # A few attempts to find a free place, features near the edge are kept whole
+        for _ in range(10):
+            margin = 1.5 * radius / res
+            row = rng.uniform(margin, dem.shape[0] - margin)
+            col = rng.uniform(margin, dem.shape[1] - margin)
+            if all((row - r) ** 2 + (col - c) ** 2 > ((radius + rad) * 1.5 / res) ** 2 for r, c, rad in placed):
+                break
+        else:
+            continue
+        placed.append((row, col, radius))
+
+        radius_px = radius / res
+        if label == "barrow":
+            _add_feature(dem, int(row), int(col), radius_px, lambda d: height * np.clip(1 - d ** 2, 0, None))
+        else:
+            def bank(d):
+                return height * (np.exp(-((d - 1) / 0.08) ** 2) - 0.5 * np.exp(-((d - 1.15) / 0.05) ** 2))
+            _add_feature(dem, int(row), int(col), radius_px, bank)
+
+        x, y = transform * (col, row)
+        # Outline of an enclosure includes the ditch
+        outline = Point(x, y).buffer(radius if label == "barrow" else radius * 1.2)
+        records.append({"label": label, "radius": radius, "height": height, "geometry": outline})
+
+    return gpd.GeoDataFrame(records, columns=["label", "radius", "height", "geometry"], geometry="geometry", crs=CRS)
+
+
+def cut_holes(dem, seed=0, holes=3, hole_fraction=0.02):
+    """Sets nodata in elliptical holes (total area about hole_fraction of the DEM) and in one corner (irregular
+    outline of the survey)."""
+    rng = np.random.default_rng(seed + 2)
+    rows, cols = dem.shape
+    yy, xx = np.ogrid[:rows, :cols]
+    for _ in range(holes):
+        area = hole_fraction * rows * cols / max(holes, 1)
+        a = np.sqrt(area / np.pi) * rng.uniform(0.6, 1.6)
+        b = area / (np.pi * a)
+        r, c = rng.uniform(0, rows), rng.uniform(0, cols)
+        dem[((yy - r) / b) ** 2 + ((xx - c) / a) ** 2 <= 1] = NODATA
+    # Missing corner (triangle)
+    corner = int(min(rows, cols) * 0.2)
+    dem[(yy + xx) < corner] = NODATA
+
+
+def make_dem(
+        out_path,
+        width=4000,
+        height=3000,
+        res=0.5,
+        seed=0,
+        mosaic=None,
+        holes=3,
+        mounds_per_km2=40,
+        enclosures_per_km2=8
+):
+    """Creates a synthetic DEM.
+
+    Parameters
+    ----------
+    out_path : str or pathlib.Path()
+        Path to GeoTIFF or, for a mosaic, to folder of tiles (VRT is saved next to it, with the same name).
+    width, height : int
+        Size in pixels.
+    res : float
+        Pixel size in metres.
+    seed : int
+        Seed, the same seed (and size) gives the same DEM.
+    mosaic : int
+        Optional - size of mosaic tiles in pixels, the DEM is saved as tiles and a VRT.
+    holes : int
+        Number of nodata holes.
+    mounds_per_km2, enclosures_per_km2 : float
+        Density of injected features.
+
+    Returns
+    -------
+    dict
+        "dem_path" (GeoTIFF or VRT), "features" (GeoDataFrame of injected features), "tiles" (list of mosaic tiles)
+        and parameters.
+    """
+    out_path = Path(out_path)
+    transform = from_origin(*ORIGIN, res, res)
+    dem = terrain((height, width), res, seed)
+    features = inject_features(dem, transform, seed, mounds_per_km2, enclosures_per_km2)
+    cut_holes(dem, seed, holes)
+
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "crs": CRS,
+        "nodata": NODATA,
+        "compress": "lzw",
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256
+    }
+    tiles = []
+    if mosaic:
+        out_path.mkdir(parents=True, exist_ok=True)
+        for row in range(0, height, mosaic):
+            for col in range(0, width, mosaic):
+                window = Window(col, row, min(mosaic, width - col), min(mosaic, height - row))
+                tile_path = out_path / f"dem_{row // mosaic:03d}_{col // mosaic:03d}.tif"
+                with rasterio.open(
+                        tile_path, "w", width=window.width, height=window.height,
+                        transform=rasterio.windows.transform(window, transform), **profile
+                ) as dst:
+                    dst.write(dem[row:row + window.height, col:col + window.width], 1)
+                tiles.append(tile_path.as_posix())
+        dem_path = out_path.with_suffix(".vrt")
+        build_vrt_from_list(tiles, dem_path)
+    else:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with rasterio.open(out_path, "w", width=width, height=height, transform=transform, **profile) as dst:
+            dst.write(dem, 1)
+        dem_path = out_path
+
+    return {
+        "dem_path": dem_path.as_posix(),
+        "features": features,
+        "tiles": tiles,
+        "width": width,
+        "height": height,
+        "res": res,
+        "seed": seed,
+        "mosaic": mosaic
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a synthetic DEM with archaeological-like features.")
+    parser.add_argument("out_path", help="Path to GeoTIFF (or folder of tiles with --mosaic).")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--res", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mosaic", type=int, default=None, help="Save as tiles of this size (pixels) and a VRT.")
+    parser.add_argument("--features", default=None, help="Optional - save injected features (GPKG).")
+    args = parser.parse_args()
+
+    res = make_dem(args.out_path, args.width, args.height, args.res, args.seed, args.mosaic)
+    if args.features:
+        res["features"].to_file(args.features, driver="GPKG")
+    print(f"DEM: {res['dem_path']} ({len(res['features'])} features)")